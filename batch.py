@@ -0,0 +1,129 @@
+import argparse
+import fnmatch
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List,Optional,Tuple
+from compile_cache import CompileCache
+import main
+
+# Batch compilation: many source files compiled in parallel by a pool
+# of processes, each file with a fresh Scanner, Parser and IRCompiler
+# (the parser keeps per-compile state: the virtual register allocator,
+# the new name generator and the symbol table).
+#
+# The inputs are files, directories (every file matching --pattern
+# below them) and globs. The IR of a file goes to --output_dir (the
+# file's own directory by default) under --output_template, where
+# {stem} is the file name without its extension, {name} the file name
+# and {dir} the file's directory. The default, {stem}ir.cpp, is the
+# name the tests use (tests/test0/test0ir.cpp).
+#
+# A file that fails to compile is reported with its error and the
+# batch goes on; the exit status is 1 if any file failed. Every option
+# of main.py choosing how to compile applies to all the files.
+#
+# python3 batch.py -O2 -j 4 tests/test*/test?.cpp
+# python3 batch.py --output_dir out --output_template {stem}.ir.cpp corpus/
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('inputs', type=str, nargs='+')
+    parser.add_argument('--output_dir', '-o', type=str)
+    parser.add_argument('--output_template', type=str, default='{stem}ir.cpp')
+    parser.add_argument('--pattern', type=str, default='*.cpp', help='the files compiled in input directories')
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count())
+    main.add_compile_arguments(parser)
+    return parser
+
+# the source files of the inputs, each once, in order
+def expand_inputs(inputs: List[str], pattern: str) -> List[str]:
+    ret = {}
+    for i in inputs:
+        if os.path.isdir(i):
+            for root, dirs, files in os.walk(i):
+                dirs.sort()
+                for f in sorted(fnmatch.filter(files, pattern)):
+                    ret[os.path.join(root, f)] = True
+        elif os.path.exists(i):
+            ret[i] = True
+        else:
+            matches = sorted(glob.glob(i, recursive=True))
+            if not matches:
+                raise ValueError("no files match '%s'" % i)
+            for m in matches:
+                ret[m] = True
+    return list(ret)
+
+def output_path(source: str, output_dir: Optional[str], template: str) -> str:
+    name = os.path.basename(source)
+    directory = os.path.dirname(source)
+    out = template.format(stem=os.path.splitext(name)[0], name=name, dir=directory)
+    return os.path.join(output_dir if output_dir is not None else directory, out)
+
+# a file to compile and how
+class Task:
+    def __init__(self, source: str, output: str, pipeline: List[str], uf: int, fixed_point: bool,
+                 time_passes: bool, backend: str, cache: Optional[CompileCache]) -> None:
+        self.source = source
+        self.output = output
+        self.pipeline = pipeline
+        self.uf = uf
+        self.fixed_point = fixed_point
+        self.time_passes = time_passes
+        self.backend = backend
+        self.cache = cache
+
+# compile one file in a worker, returns the source, the error (None
+# on success) and the seconds it took
+def compile_task(task: Task) -> Tuple[str,Optional[str],float]:
+    start = time.perf_counter()
+    try:
+        ir = main.compile_cached(task.cache, task.source, task.pipeline, task.uf, task.fixed_point, task.time_passes, task.backend)
+        os.makedirs(os.path.dirname(task.output) or ".", exist_ok=True)
+        with open(task.output, "w") as f:
+            f.write(ir + "\n")
+    except Exception as e:
+        return task.source, "%s: %s" % (type(e).__name__, e), time.perf_counter() - start
+    return task.source, None, time.perf_counter() - start
+
+# Compile the tasks with jobs processes, returns the errors as
+# (source, error). Results come back in task order
+def run_batch(tasks: List[Task], jobs: int) -> List[Tuple[str,str]]:
+    if jobs <= 1 or len(tasks) <= 1:
+        return [(s, e) for s, e, _ in map(compile_task, tasks) if e is not None]
+    errors = []
+    # a few chunks per worker keeps them busy without a round trip per file
+    chunksize = max(1, len(tasks) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for source, error, _ in pool.map(compile_task, tasks, chunksize=chunksize):
+            if error is not None:
+                errors.append((source, error))
+    return errors
+
+if __name__ == "__main__":
+    parser = build_arg_parser()
+    args = parser.parse_args()
+    pipeline, fixed_point = main.select_passes(parser, args)
+    try:
+        sources = expand_inputs(args.inputs, args.pattern)
+    except ValueError as e:
+        parser.error(str(e))
+
+    cache = None
+    if not args.no_cache:
+        cache = CompileCache(args.cache_dir, args.cache_size * 2**20)
+        # hashed once here rather than in every worker
+        cache.compiler_version()
+    tasks = [Task(s, output_path(s, args.output_dir, args.output_template), pipeline, args.unroll_factor or 1,
+                  fixed_point, args.time_passes, args.backend, cache) for s in sources]
+
+    start = time.perf_counter()
+    errors = run_batch(tasks, args.jobs)
+    for source, error in errors:
+        print("%s: %s" % (source, error), file=sys.stderr)
+    print("compiled %d files (%d failed) in %.2f s with %d jobs" % (
+        len(tasks), len(errors), time.perf_counter() - start, max(1, args.jobs)), file=sys.stderr)
+    sys.exit(1 if errors else 0)
@@ -0,0 +1,71 @@
+# Differential check of the C backend against the classir.h backend
+#
+# Compiles every source with each set of --options twice, with
+# --backend classir and --backend c, builds both with the driver of
+# benchmarks/runtime_matrix.py (same arguments, one call) and checks
+# that they print the same argument values. The sources are the files
+# given, or by default the tests, plus --generated programs from
+# benchmarks/generator.py (seeds 0 to N-1, written to a temporary
+# directory). Exits with status 1 on any difference.
+#
+# The C++ compiler is $CXX, by default clang++ (or g++ if clang++ is
+# not installed).
+#
+# run from the repository root:
+#   python3 -m benchmarks.backend_check
+#   python3 -m benchmarks.backend_check --generated 100 --options="" --options="-O3 -uf 2"
+
+import argparse
+import glob
+import os
+import sys
+import tempfile
+from typing import List,Tuple
+from benchmarks.generator import generate
+from benchmarks.register_bench import find_cxx
+from benchmarks.runtime_matrix import build, compile_variant, make_driver, run
+
+default_options = ["", "-lvn", "-uf 4", "-O1", "-O2", "-O3", "-lvn -ra -uf 2"]
+
+# the outputs of the two backends for source compiled with flags
+def compare(source: str, flags: str, cxx: str, cxxflags: List[str], directory: str) -> Tuple[str,str]:
+    header = os.path.abspath("classir.h")
+    outputs = []
+    for backend in ("classir", "c"):
+        ir, function, args = compile_variant(source, flags + " --backend " + backend)
+        ir = ir.replace('#include "../../classir.h"', '#include "%s"' % header)
+        binary = build(cxx, cxxflags, directory, backend, ir, make_driver(backend + ".cpp", function, args))
+        outputs.append(run(binary, 0)[0])
+    return outputs[0], outputs[1]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('sources', type=str, nargs='*')
+    parser.add_argument('--options', type=str, action='append',
+                        help='main.py options, repeat for more, e.g. --options="" --options="-O2"')
+    parser.add_argument('--generated', type=int, default=0, help='also check this many generated programs')
+    parser.add_argument('--statements', type=int, default=60)
+    parser.add_argument('--cxxflags', type=str, default='-std=c++11 -O0 -w')
+    args = parser.parse_args()
+    options = args.options if args.options is not None else default_options
+    cxx = find_cxx()
+
+    with tempfile.TemporaryDirectory() as d:
+        sources = args.sources
+        if not sources:
+            sources = sorted(glob.glob("tests/test*/test?.cpp")) + ["tests/timing/timing.cpp"]
+        for seed in range(args.generated):
+            path = os.path.join(d, "generated%d.cpp" % seed)
+            with open(path, "w") as f:
+                f.write(generate(seed, args.statements))
+            sources.append(path)
+
+        differences = 0
+        for source in sources:
+            for flags in options:
+                classir, c = compare(source, flags, cxx, args.cxxflags.split(), d)
+                if classir != c:
+                    differences += 1
+                    print("DIFFERENT %s %s: classir.h%s, C%s" % (source, flags if flags else "(none)", classir, c))
+    print("%d sources, %d option sets, %d differences" % (len(sources), len(options), differences))
+    sys.exit(1 if differences else 0)
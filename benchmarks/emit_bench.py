@@ -0,0 +1,57 @@
+# Code emission benchmark
+#
+# Parses generated C-simple functions of increasing size into ClassIeR
+# and reports the time per statement. All parse and linearize routines
+# append into one Emitter, so the microseconds per statement stay flat
+# as the function grows (building the program by concatenating lists
+# made this grow with the size of the enclosing statement list).
+#
+# Every statement group mixes straight line code, an if/else, a for
+# loop (unrolled with --uf) and expressions nested --depth levels deep.
+#
+# run from the repository root:
+#   python3 -m benchmarks.emit_bench
+#   python3 -m benchmarks.emit_bench --uf 4 --depth 40
+#   python3 -m benchmarks.emit_bench --sizes 10 --depth 10000
+
+import argparse
+import time
+from cse110A_parser import Parser
+from benchmarks.scanner_bench import make_scanner
+
+# a nested expression: ((((x + 1) * y) - 2) ...)
+def nested_expr(depth: int) -> str:
+    ops = ["+ 1", "* y", "- 2", "/ 3"]
+    ret = "x"
+    for d in range(depth):
+        ret = "(%s %s)" % (ret, ops[d % len(ops)])
+    return ret
+
+# a group of 5 statements
+def make_group(depth: int) -> str:
+    return ("  x = %s;\n" % nested_expr(depth) +
+            "  if (x < y) { y = y + 1; } else { y = y - 1; }\n" +
+            "  for (i = 0; i < 10; i = i + 1) { z = z + i * 2.5; }\n")
+
+def make_function(statements: int, depth: int) -> str:
+    return ("void bench(int &x, int &y, float &z) {\n  int i;\n" +
+            make_group(depth) * (statements // 5) + "}\n")
+
+def statement_count(statements: int) -> int:
+    return (statements // 5) * 5
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--depth', type=int, default=20)
+    parser.add_argument('--uf', type=int, default=1)
+    args = parser.parse_args()
+
+    print("%-12s %14s %14s %14s" % ("statements", "instructions", "seconds", "us/statement"))
+    for n in args.sizes:
+        src = make_function(n, args.depth)
+        start = time.perf_counter()
+        program = Parser(make_scanner()).parse(src, args.uf)
+        elapsed = time.perf_counter() - start
+        count = statement_count(n)
+        print("%-12d %14d %14.3f %14.2f" % (count, len(program), elapsed, elapsed / count * 1e6))
@@ -0,0 +1,165 @@
+# Seeded generator of valid C-simple functions for the benchmarks
+#
+# The same seed and settings always give the same program. The knobs:
+# * statements: how many statements (declarations with their
+#   initialization, assignments, if/else and for statements and
+#   blocks all count)
+# * expr_depth: the depth of the expression trees
+# * nesting: how deeply if/else and for statements nest
+# * scope_depth: how deeply plain blocks declaring their own
+#   variables nest inside each statement level
+# * float_ratio: the fraction of float variables, literals and IO
+#   arguments (the rest are int)
+#
+# Every variable is declared and initialized before it is read, loop
+# indices are only written by their loop, and divisions are by
+# non-zero literals, so the programs also run.
+#
+# python3 -m benchmarks.generator --statements 50 --seed 3
+
+import argparse
+import random
+from typing import List,Tuple
+
+operators = ["+", "-", "*", "/", "<", "=="]
+
+class Generator:
+    def __init__(self, seed: int, statements: int = 100, expr_depth: int = 3, nesting: int = 2,
+                 scope_depth: int = 1, float_ratio: float = 0.3) -> None:
+        self.random = random.Random(seed)
+        self.budget = statements
+        self.expr_depth = expr_depth
+        self.nesting = nesting
+        self.scope_depth = scope_depth
+        self.float_ratio = float_ratio
+        self.scopes = []        # the (name, type) of the variables of each open scope
+        self.indices = set()    # loop indices, only written by their loop
+        self.counter = 0
+        self.lines = []
+
+    def new_name(self, prefix: str) -> str:
+        self.counter += 1
+        return "%s%d" % (prefix, self.counter)
+
+    def pick_type(self) -> str:
+        return "float" if self.random.random() < self.float_ratio else "int"
+
+    def variables(self, assignable: bool = False) -> List[Tuple[str,str]]:
+        ret = []
+        for scope in self.scopes:
+            ret.extend([v for v in scope if not (assignable and v[0] in self.indices)])
+        return ret
+
+    def literal(self, nonzero: bool = False) -> str:
+        if self.pick_type() == "float":
+            return "%d.%d" % (self.random.randint(0 if not nonzero else 1, 9), self.random.randint(0, 99))
+        return str(self.random.randint(1 if nonzero else 0, 99))
+
+    def expr(self, depth: int) -> str:
+        if depth <= 0 or self.random.random() < 0.15:
+            if self.random.random() < 0.3:
+                return self.literal()
+            return self.random.choice(self.variables())[0]
+        op = self.random.choice(operators)
+        if op == "/":
+            return "(%s / %s)" % (self.expr(depth - 1), self.literal(nonzero=True))
+        return "(%s %s %s)" % (self.expr(depth - 1), op, self.expr(depth - 1))
+
+    def emit(self, indent: int, line: str) -> None:
+        self.lines.append("  " * indent + line)
+
+    def declare(self, indent: int) -> None:
+        name = self.new_name("v")
+        t = self.pick_type()
+        self.emit(indent, "%s %s;" % (t, name))
+        self.emit(indent, "%s = %s;" % (name, self.literal()))
+        self.scopes[-1].append((name, t))
+        self.budget -= 1
+
+    def assignment(self, indent: int) -> None:
+        name = self.random.choice(self.variables(assignable=True))[0]
+        self.emit(indent, "%s = %s;" % (name, self.expr(self.expr_depth)))
+        self.budget -= 1
+
+    # the statements of a block, until the budget runs out or the block
+    # is long enough
+    def statement_list(self, indent: int, nesting: int, scope_depth: int) -> None:
+        length = self.random.randint(1, 8)
+        while self.budget > 0 and length > 0:
+            length -= 1
+            r = self.random.random()
+            if r < 0.1:
+                self.declare(indent)
+            elif r < 0.2 and nesting > 0:
+                self.if_else(indent, nesting, scope_depth)
+            elif r < 0.3 and nesting > 0:
+                self.for_loop(indent, nesting, scope_depth)
+            elif r < 0.35 and scope_depth > 0:
+                self.block(indent, nesting, scope_depth - 1)
+            else:
+                self.assignment(indent)
+
+    # a block with its own declarations
+    def block(self, indent: int, nesting: int, scope_depth: int) -> None:
+        self.budget -= 1
+        self.emit(indent, "{")
+        self.scopes.append([])
+        self.declare(indent + 1)
+        self.statement_list(indent + 1, nesting, scope_depth)
+        self.scopes.pop()
+        self.emit(indent, "}")
+
+    def body(self, indent: int, nesting: int, scope_depth: int) -> None:
+        self.scopes.append([])
+        self.statement_list(indent + 1, nesting, scope_depth)
+        if self.lines[-1].endswith("{"):
+            # an empty body still needs a statement
+            self.assignment(indent + 1)
+        self.scopes.pop()
+
+    def if_else(self, indent: int, nesting: int, scope_depth: int) -> None:
+        self.budget -= 1
+        self.emit(indent, "if (%s) {" % self.expr(self.expr_depth))
+        self.body(indent, nesting - 1, scope_depth)
+        self.emit(indent, "} else {")
+        self.body(indent, nesting - 1, scope_depth)
+        self.emit(indent, "}")
+
+    def for_loop(self, indent: int, nesting: int, scope_depth: int) -> None:
+        self.budget -= 1
+        i = self.new_name("i")
+        self.emit(indent, "int %s;" % i)
+        self.scopes[-1].append((i, "int"))
+        self.indices.add(i)
+        self.emit(indent, "for (%s = 0; %s < %d; %s = %s + 1) {" % (i, i, self.random.randint(1, 10), i, i))
+        self.body(indent, nesting - 1, scope_depth)
+        self.emit(indent, "}")
+
+    def function(self, name: str = "bench") -> str:
+        args = []
+        self.scopes.append([])
+        for k in range(4):
+            arg = self.new_name("a")
+            t = "float" if k >= 2 and self.float_ratio > 0 or self.float_ratio >= 1 else "int"
+            args.append("%s &%s" % (t, arg))
+            self.scopes[-1].append((arg, t))
+        self.lines = []
+        while self.budget > 0:
+            self.statement_list(1, self.nesting, self.scope_depth)
+        self.scopes.pop()
+        return "void %s(%s) {\n%s\n}\n" % (name, ", ".join(args), "\n".join(self.lines))
+
+def generate(seed: int, statements: int = 100, expr_depth: int = 3, nesting: int = 2,
+             scope_depth: int = 1, float_ratio: float = 0.3) -> str:
+    return Generator(seed, statements, expr_depth, nesting, scope_depth, float_ratio).function()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--statements', type=int, default=100)
+    parser.add_argument('--expr_depth', type=int, default=3)
+    parser.add_argument('--nesting', type=int, default=2)
+    parser.add_argument('--scope_depth', type=int, default=1)
+    parser.add_argument('--float_ratio', type=float, default=0.3)
+    args = parser.parse_args()
+    print(generate(args.seed, args.statements, args.expr_depth, args.nesting, args.scope_depth, args.float_ratio), end="")
@@ -0,0 +1,197 @@
+# Compiler phase benchmark
+#
+# Compiles generated C-simple functions (benchmarks/generator.py) over
+# a sweep of one generator setting and times each phase of the
+# compiler separately:
+#   scan            Scanner.tokenize
+#   parse           Parser.parse_input less the phases below it
+#                   (statements, symbol table, emitting)
+#   parse_expr      Parser.parse_expr
+#   type_inference  type_inference
+#   allocate_vrs    Parser.allocate_vrs
+#   linearize_code  ASTNode.linearize_code
+#   unroll          Parser.unroll_loop (with --uf)
+#   pass:<name>     every pass of the pipeline
+#   print_program   IRCompiler.print_program
+# Times are exclusive: a phase called from another one is not counted
+# twice. The wrappers cost about a microsecond per call, so the
+# expression phases are slightly inflated.
+#
+# Results go to a JSON file; --compare reads an earlier one and flags
+# every phase that got slower by more than --threshold (exit status
+# 1), ignoring phases shorter than --min_ms. The time per statement
+# shows the scaling: it stays flat for linear phases.
+#
+# run from the repository root:
+#   python3 -m benchmarks.phase_bench --output base.json
+#   python3 -m benchmarks.phase_bench --compare base.json --threshold 0.2
+#   python3 -m benchmarks.phase_bench --sweep expr_depth --values 2 8 32 --statements 500
+
+import argparse
+import json
+import platform
+import sys
+import time
+from typing import Callable,Dict,List,Tuple
+import cse110A_ast
+import cse110A_parser
+import pass_manager
+import scanner
+from ir_compiler import IRCompiler
+from main import make_compiler
+from benchmarks.generator import generate
+
+sweeps = ["statements", "expr_depth", "nesting", "scope_depth", "float_ratio"]
+
+# the phases and where they are: (phase, object, attribute)
+def phase_points() -> List[tuple]:
+    ret = [
+        ("scan", scanner.Scanner, "tokenize"),
+        ("parse", cse110A_parser.Parser, "parse_input"),
+        ("parse_expr", cse110A_parser.Parser, "parse_expr"),
+        ("type_inference", cse110A_parser, "type_inference"),
+        ("allocate_vrs", cse110A_parser.Parser, "allocate_vrs"),
+        ("linearize_code", cse110A_ast.ASTNode, "linearize_code"),
+        ("unroll", cse110A_parser.Parser, "unroll_loop"),
+        ("print_program", IRCompiler, "print_program"),
+    ]
+    for name, p in pass_manager.registry.items():
+        ret.append(("pass:" + name, p, "run"))
+    return ret
+
+# Exclusive time per phase: every wrapped call adds its time less the
+# time of the wrapped calls it made
+class PhaseTimer:
+    def __init__(self) -> None:
+        self.seconds = {}
+        self.stack = []     # the time of the wrapped calls made by each running call
+        self.saved = []
+
+    def wrap(self, phase: str, f: Callable) -> Callable:
+        seconds = self.seconds
+        stack = self.stack
+        seconds[phase] = 0.0
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            stack.append(0.0)
+            try:
+                return f(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                seconds[phase] += elapsed - stack.pop()
+                if stack:
+                    stack[-1] += elapsed
+        return timed
+
+    def install(self) -> None:
+        for phase, obj, attribute in phase_points():
+            f = getattr(obj, attribute)
+            self.saved.append((obj, attribute, f))
+            setattr(obj, attribute, self.wrap(phase, f))
+
+    def uninstall(self) -> None:
+        for obj, attribute, f in reversed(self.saved):
+            setattr(obj, attribute, f)
+        self.saved = []
+
+    def reset(self) -> None:
+        for phase in self.seconds:
+            self.seconds[phase] = 0.0
+
+# compile src with the pipeline, returns the phase times (the fastest
+# of repeat runs for each phase) and the size of the output
+def measure(timer: PhaseTimer, src: str, pipeline: List[str], uf: int, repeat: int) -> Tuple[Dict[str,float],float,int]:
+    best = {}
+    best_total = None
+    for _ in range(repeat):
+        timer.reset()
+        compiler = make_compiler()
+        start = time.perf_counter()
+        program = compiler.parser.parse(src, uf, "cf" in pipeline)
+        compiler.run_passes(program, pipeline)
+        total = time.perf_counter() - start
+        for phase, seconds in timer.seconds.items():
+            best[phase] = min(best.get(phase, seconds), seconds)
+        best_total = total if best_total is None else min(best_total, total)
+    return best, best_total, compiler.ir_program.count("\n")
+
+# the phases slower than in the baseline by more than threshold
+def regressions(baseline: dict, results: dict, threshold: float, min_ms: float) -> List[str]:
+    old = {str(r["value"]): r for r in baseline["results"]}
+    ret = []
+    for r in results["results"]:
+        b = old.get(str(r["value"]))
+        if b is None:
+            continue
+        for phase, seconds in list(r["phases"].items()) + [("total", r["total"])]:
+            before = b["total"] if phase == "total" else b["phases"].get(phase)
+            if before is None or before * 1000 < min_ms:
+                continue
+            if seconds > before * (1 + threshold):
+                ret.append("%s=%s %s: %.2f ms -> %.2f ms (%+.0f%%)" % (
+                    results["meta"]["sweep"], r["value"], phase, before * 1000, seconds * 1000,
+                    (seconds / before - 1) * 100))
+    return ret
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sweep', choices=sweeps, default='statements')
+    parser.add_argument('--values', type=float, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--statements', type=int, default=1000)
+    parser.add_argument('--expr_depth', type=int, default=3)
+    parser.add_argument('--nesting', type=int, default=2)
+    parser.add_argument('--scope_depth', type=int, default=1)
+    parser.add_argument('--float_ratio', type=float, default=0.3)
+    parser.add_argument('--passes', type=str, default='lvn', help='comma separated, see pass_manager')
+    parser.add_argument('--uf', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', type=str)
+    parser.add_argument('--compare', type=str)
+    parser.add_argument('--threshold', type=float, default=0.2)
+    parser.add_argument('--min_ms', type=float, default=1.0)
+    args = parser.parse_args()
+    pipeline = pass_manager.build_pipeline([n for n in args.passes.split(",") if n])
+
+    settings = {s: getattr(args, s) for s in sweeps}
+    results = {
+        "meta": {"sweep": args.sweep, "settings": settings, "seed": args.seed, "passes": pipeline,
+                 "uf": args.uf, "repeat": args.repeat, "python": platform.python_version()},
+        "results": [],
+    }
+    timer = PhaseTimer()
+    timer.install()
+    try:
+        for value in args.values:
+            s = dict(settings)
+            s[args.sweep] = value if args.sweep == "float_ratio" else int(value)
+            src = generate(args.seed, s["statements"], s["expr_depth"], s["nesting"], s["scope_depth"], s["float_ratio"])
+            phases, total, lines = measure(timer, src, pipeline, args.uf, args.repeat)
+            results["results"].append({"value": s[args.sweep], "source_bytes": len(src), "output_lines": lines,
+                                       "statements": s["statements"], "total": total,
+                                       "phases": {p: t for p, t in phases.items() if t > 0}})
+    finally:
+        timer.uninstall()
+
+    phases = []
+    for r in results["results"]:
+        phases.extend([p for p in r["phases"] if p not in phases])
+    print("%-14s" % args.sweep + "".join(["%15s" % p for p in ["total"] + phases]) + "%12s" % "us/stmt")
+    for r in results["results"]:
+        print("%-14s" % r["value"] + "%15.2f" % (r["total"] * 1000) +
+              "".join(["%15.2f" % (r["phases"].get(p, 0.0) * 1000) for p in phases]) +
+              "%12.2f" % (r["total"] / r["statements"] * 1e6))
+    print("(times in ms)")
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        slower = regressions(baseline, results, args.threshold, args.min_ms)
+        for line in slower:
+            print("REGRESSION " + line)
+        if slower:
+            sys.exit(1)
+        print("no phase slower by more than %.0f%%" % (args.threshold * 100))
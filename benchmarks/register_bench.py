@@ -0,0 +1,65 @@
+# Register allocation benchmark
+#
+# Compiles the timing test and generated functions of increasing size
+# to ClassIeR with and without register allocation (-ra) and reports
+# the number of virtual_reg locals declared and how long the C++
+# compiler takes to compile the output at -O0 (as tests/timing does).
+#
+# The C++ compiler is $CXX, by default clang++ (or g++ if clang++ is
+# not installed).
+#
+# run from the repository root:
+#   python3 -m benchmarks.register_bench
+#   python3 -m benchmarks.register_bench --sizes 1000 --uf 8
+
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from cse110A_parser import Parser
+from ir_compiler import IRCompiler
+import pass_manager
+from benchmarks.scanner_bench import make_scanner
+from benchmarks.emit_bench import make_function
+
+def find_cxx() -> str:
+    if "CXX" in os.environ:
+        return os.environ["CXX"]
+    if shutil.which("clang++") is not None:
+        return "clang++"
+    return "g++"
+
+def compile_ir(src: str, uf: int, lvn: bool, ra: bool) -> str:
+    compiler = IRCompiler(Parser(make_scanner()))
+    compiler.compile2ir(src, pass_manager.flag_pipeline(lvn=lvn, ra=ra), uf)
+    return compiler.ir_program
+
+# seconds the C++ compiler takes to compile the IR to an object file
+def cxx_time(cxx: str, ir: str) -> float:
+    header = os.path.abspath("classir.h")
+    with tempfile.TemporaryDirectory() as d:
+        with open(os.path.join(d, "ir.cpp"), "w") as f:
+            f.write(ir.replace('#include "../../classir.h"', '#include "%s"' % header))
+        start = time.perf_counter()
+        subprocess.run([cxx, "-std=c++11", "-O0", "-w", "-c", "ir.cpp", "-o", "ir.o"], cwd=d, check=True)
+        return time.perf_counter() - start
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000])
+    parser.add_argument('--uf', type=int, default=1)
+    parser.add_argument('--lvn', action='store_true')
+    args = parser.parse_args()
+    cxx = find_cxx()
+
+    inputs = [("timing.cpp", open("tests/timing/timing.cpp").read())]
+    inputs += [("%d statements" % n, make_function(n, 4)) for n in args.sizes]
+
+    print("%-18s %6s %12s %12s" % ("input", "-ra", "virtual_reg", cxx + " (s)"))
+    for name, src in inputs:
+        for ra in (False, True):
+            ir = compile_ir(src, args.uf, args.lvn, ra)
+            declared = ir.count("virtual_reg ")
+            print("%-18s %6s %12d %12.2f" % (name, "yes" if ra else "no", declared, cxx_time(cxx, ir)))
@@ -0,0 +1,221 @@
+# Generated code runtime benchmark
+#
+# Compiles C-simple sources under a matrix of compiler options (the
+# options of main.py: -lvn, -uf N, -O1, --passes=..., --backend c,
+# ...), builds each variant with a generated driver and reports how
+# long the generated code runs: the median of --runs timed runs after --warmup
+# untimed ones, with the fastest and slowest run and the standard
+# deviation. For every variant it also records the static number of
+# instructions and of virtual_reg declarations, the number of
+# instructions one call runs (counted by classir_interpreter, so it does
+# not depend on the machine), and checks the output against the
+# original source compiled as C++ (C-simple is C++).
+#
+# The driver sets the function's arguments to fixed values, calls it
+# once and prints the arguments (the correctness check), then times
+# --calls calls, resetting the arguments before each so repeated calls
+# do the same work.
+#
+# The C++ compiler is $CXX, by default clang++ (or g++ if clang++ is
+# not installed), with -std=c++11 -O0 like the tests.
+#
+# run from the repository root:
+#   python3 -m benchmarks.runtime_matrix
+#   python3 -m benchmarks.runtime_matrix tests/test8/test8.cpp --variant="" --variant="-O3" --csv out.csv
+#   python3 -m benchmarks.runtime_matrix --json out.json --runs 11 --calls 100000
+
+import argparse
+import csv
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from typing import Dict,List,Tuple
+import classir_interpreter
+import main
+from benchmarks.register_bench import find_cxx
+
+default_variants = ["", "-lvn", "-uf 4", "-lvn -uf 4", "-O1", "-O2", "-O3"]
+
+driver_template = """#include <chrono>
+#include <cstdlib>
+#include <iomanip>
+#include <iostream>
+
+#include "%(source)s"
+
+int main(int argc, char **argv) {
+  long calls = atol(argv[1]);
+  %(declarations)s
+  %(reset)s
+  %(function)s(%(call_args)s);
+  std::cout << std::setprecision(9)%(print)s << std::endl;
+
+  auto start = std::chrono::steady_clock::now();
+  for (long i = 0; i < calls; i++) {
+    %(reset)s
+    %(function)s(%(call_args)s);
+  }
+  auto stop = std::chrono::steady_clock::now();
+  std::cout << std::chrono::duration<double, std::milli>(stop - start).count() << std::endl;
+  return 0;
+}
+"""
+
+# the argument values the driver sets
+def input_values(args: List[Tuple[str,str]]) -> Dict[str,float]:
+    return {name: k + 2 if t == "int" else k + 1.5 for k, (name, t) in enumerate(args)}
+
+# the number of instructions one call of the classir.h IR runs
+def dynamic_instructions(ir: str, args: List[Tuple[str,str]]) -> int:
+    _, interpreter = classir_interpreter.load(ir)
+    interpreter.run(input_values(args))
+    return interpreter.instructions()
+
+# the driver calling function with the arguments args ((name, type)
+# in order) defined in source
+def make_driver(source: str, function: str, args: List[Tuple[str,str]]) -> str:
+    values = []
+    for name, v in input_values(args).items():
+        values.append("%s = %s;" % (name, str(v) if isinstance(v, int) else "%sf" % v))
+    return driver_template % {
+        "source": source,
+        "function": function,
+        "declarations": " ".join(["%s %s;" % (t, name) for name, t in args]),
+        "reset": " ".join(values),
+        "call_args": ", ".join([name for name, _ in args]),
+        "print": "".join([' << " " << %s' % name for name, _ in args]),
+    }
+
+# compile source with main.py options, returns the IR, the function
+# name and its arguments in order
+def compile_variant(source: str, flags: str) -> Tuple[str,str,List[Tuple[str,str]]]:
+    parser = main.build_arg_parser()
+    args = parser.parse_args(flags.split() + [source])
+    pipeline, fixed_point = main.select_passes(parser, args)
+    compiler = main.make_compiler()
+    compiler.compile_file(source, pipeline, args.unroll_factor or 1, fixed_point, backend=args.backend)
+    function_args = [(name, t) for name, t in reversed(compiler.parser.function_args)]
+    return compiler.ir_program, compiler.parser.function_name, function_args
+
+# the static instruction count (labels not counted) and virtual_reg
+# count (locals with the C backend) of IR text
+def ir_counts(ir: str) -> Tuple[int,int]:
+    body = ir[ir.index("{") + 1:ir.rindex("return;")]
+    lines = [l.strip() for l in body.split("\n") if l.strip().endswith(";") and not l.strip().endswith(":;")]
+    registers = len([l for l in lines if l.split(" ")[0] in ("virtual_reg", "int", "float", "value")])
+    declarations = len([l for l in lines if l.startswith("union ")])
+    return len(lines) - registers - declarations, registers
+
+def build(cxx: str, cxxflags: List[str], directory: str, name: str, program: str, driver: str) -> str:
+    with open(os.path.join(directory, name + ".cpp"), "w") as f:
+        f.write(program)
+    with open(os.path.join(directory, name + "_driver.cpp"), "w") as f:
+        f.write(driver)
+    binary = os.path.join(directory, name)
+    subprocess.run([cxx] + cxxflags + [name + "_driver.cpp", "-o", name], cwd=directory, check=True)
+    return binary
+
+# run a driver, returns the correctness line and the milliseconds
+def run(binary: str, calls: int) -> Tuple[str,float]:
+    out = subprocess.run([binary, str(calls)], check=True, capture_output=True, text=True).stdout.split("\n")
+    return out[0], float(out[1])
+
+# time a driver: warmup untimed runs then runs timed ones
+def measure(binary: str, calls: int, warmup: int, runs: int) -> Tuple[str,List[float]]:
+    for _ in range(warmup):
+        run(binary, calls)
+    times = []
+    output = None
+    for _ in range(runs):
+        output, ms = run(binary, calls)
+        times.append(ms)
+    return output, times
+
+columns = ["source", "variant", "instructions", "virtual_regs", "dynamic_instructions", "median_ms", "min_ms", "max_ms",
+           "stdev_ms", "speedup", "correct"]
+
+def benchmark_source(source: str, variants: List[str], cxx: str, cxxflags: List[str], calls: int,
+                     warmup: int, runs: int) -> List[Dict]:
+    header = os.path.abspath("classir.h")
+    rows = []
+    with tempfile.TemporaryDirectory() as d:
+        compiled = [compile_variant(source, flags) for flags in variants]
+        _, function, args = compiled[0]
+
+        # the original, compiled as C++
+        with open(source) as f:
+            original = f.read()
+        binary = build(cxx, cxxflags, d, "original", original, make_driver("original.cpp", function, args))
+        expected, times = measure(binary, calls, warmup, runs)
+        baseline = statistics.median(times)
+
+        for k, (flags, (ir, _, _)) in enumerate(zip(variants, compiled)):
+            ir = ir.replace('#include "../../classir.h"', '#include "%s"' % header)
+            name = "variant%d" % k
+            binary = build(cxx, cxxflags, d, name, ir, make_driver(name + ".cpp", function, args))
+            output, times = measure(binary, calls, warmup, runs)
+            instructions, registers = ir_counts(ir)
+            median = statistics.median(times)
+            if k == 0:
+                first = median
+            rows.append({
+                "source": source,
+                "variant": flags if flags else "(none)",
+                "instructions": instructions,
+                "virtual_regs": registers,
+                # the C backend runs the same instructions
+                "dynamic_instructions": dynamic_instructions(compile_variant(source, flags + " --backend classir")[0], args),
+                "median_ms": round(median, 3),
+                "min_ms": round(min(times), 3),
+                "max_ms": round(max(times), 3),
+                "stdev_ms": round(statistics.stdev(times), 3) if len(times) > 1 else 0.0,
+                # against the first variant
+                "speedup": round(first / median, 2) if median > 0 else 0.0,
+                "correct": output == expected,
+            })
+        rows.append({"source": source, "variant": "original C++", "instructions": "", "virtual_regs": "", "dynamic_instructions": "",
+                     "median_ms": round(baseline, 3), "min_ms": "", "max_ms": "", "stdev_ms": "",
+                     "speedup": round(first / baseline, 2) if baseline > 0 else 0.0, "correct": True})
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('sources', type=str, nargs='*', default=['tests/timing/timing.cpp'])
+    parser.add_argument('--variant', type=str, action='append', dest='variants',
+                        help='main.py options of a variant, repeat for more, e.g. --variant="" --variant="-O2"')
+    parser.add_argument('--calls', type=int, default=16384)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--cxxflags', type=str, default='-std=c++11 -O0 -w')
+    parser.add_argument('--csv', type=str)
+    parser.add_argument('--json', type=str)
+    args = parser.parse_args()
+    if args.variants is None:
+        args.variants = default_variants
+    cxx = find_cxx()
+
+    rows = []
+    for source in args.sources:
+        rows.extend(benchmark_source(source, args.variants, cxx, args.cxxflags.split(), args.calls,
+                                     args.warmup, args.runs))
+
+    print("%-28s %-20s %8s %8s %10s %10s %10s %10s %8s %8s %8s" % (
+        "source", "variant", "instrs", "vregs", "dynamic", "median ms", "min ms", "max ms", "stdev", "speedup", "correct"))
+    for r in rows:
+        print("%-28s %-20s %8s %8s %10s %10s %10s %10s %8s %8s %8s" % tuple(
+            [r[c] if c != "correct" else ("yes" if r[c] else "NO") for c in columns]))
+
+    if args.csv is not None:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(rows)
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump({"cxx": cxx, "cxxflags": args.cxxflags, "calls": args.calls, "warmup": args.warmup,
+                       "runs": args.runs, "rows": rows}, f, indent=2)
+    if not all([r["correct"] for r in rows]):
+        sys.exit(1)
@@ -0,0 +1,88 @@
+# Scanner throughput benchmark
+#
+# Scans generated C-simple inputs of increasing size and reports the
+# time per token. With a linear time scanner the microseconds per token
+# stay flat as the input grows.
+#
+# With --file-mb the input is written to a temporary file and scanned
+# through Scanner.input_file (memory mapped), reporting the peak
+# resident memory next to the size of the mapping.
+#
+# run from the repository root:
+#   python3 -m benchmarks.scanner_bench
+#   python3 -m benchmarks.scanner_bench --file-mb 100
+
+import argparse
+import os
+import resource
+import tempfile
+import time
+from scanner import Scanner, tokens, Token, idy
+
+# a statement using every token in the C-simple token table
+STATEMENT = "  x = (x + 12 * y) / 3.5 - .25 < y == z;\n  if (x) { int w; } else { float v; }\n"
+
+def make_input(statements: int) -> str:
+    return "void bench(int &x, int &y, int &z) {\n" + STATEMENT * statements + "}\n"
+
+def make_scanner() -> Scanner:
+    s = Scanner()
+    s.set_tokens(tokens + [(Token.IGNORE, " |\n|\t", idy)])
+    return s
+
+def count_tokens(s: Scanner) -> int:
+    count = 0
+    while s.token() is not None:
+        count += 1
+    return count
+
+def scan(src: str) -> int:
+    s = make_scanner()
+    s.input_string(src)
+    return count_tokens(s)
+
+# peak resident memory of this process in MB
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def scan_file(megabytes: int) -> None:
+    with tempfile.NamedTemporaryFile("w", suffix=".cpp", delete=False) as f:
+        file_name = f.name
+        f.write("void bench(int &x, int &y, int &z) {\n")
+        statements = megabytes * 1024 * 1024 // len(STATEMENT)
+        chunk = STATEMENT * 1000
+        for _ in range(statements // 1000):
+            f.write(chunk)
+        f.write("}\n")
+    try:
+        size_mb = os.path.getsize(file_name) / (1024 * 1024)
+        before = peak_rss_mb()
+        s = make_scanner()
+        start = time.perf_counter()
+        s.input_file(file_name)
+        count = count_tokens(s)
+        elapsed = time.perf_counter() - start
+        lines = s.get_lineno()
+        s.close()
+        print("file: %.1f MB, %d tokens, %d lines, %.1f s" % (size_mb, count, lines, elapsed))
+        print("peak RSS: %.1f MB before scanning, %.1f MB after (mapping is %.1f MB)" % (before, peak_rss_mb(), size_mb))
+    finally:
+        os.unlink(file_name)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--file-mb', type=int)
+    args = parser.parse_args()
+
+    if args.file_mb is not None:
+        scan_file(args.file_mb)
+        exit(0)
+
+    print("%10s %10s %10s %12s %10s" % ("statements", "bytes", "tokens", "time (ms)", "us/token"))
+    for n in args.sizes:
+        src = make_input(n)
+        start = time.perf_counter()
+        count = scan(src)
+        elapsed = time.perf_counter() - start
+        print("%10d %10d %10d %12.1f %10.2f" % (n, len(src), count, elapsed * 1000, elapsed * 1e6 / count))
@@ -0,0 +1,96 @@
+# Compile server benchmark
+#
+# Compiles the same file over and over and reports requests per second
+# and the p50/p99 latency of:
+# * cold: python3 main.py, a new interpreter per compile
+# * client: python3 compile_client.py against a running compile server
+# * socket: requests sent straight to the server from this process by
+#   --clients threads (what a build tool keeping the connection code
+#   in process would see)
+#
+# The server is started on a temporary socket and stopped at the end.
+# The cache is off (--no-cache) unless --cache is given, so every
+# request compiles.
+#
+# run from the repository root:
+#   python3 -m benchmarks.server_bench
+#   python3 -m benchmarks.server_bench --requests 200 --clients 1 4 --flags="-O2"
+
+import argparse
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable,List,Tuple
+import compile_client
+
+def percentile(latencies: List[float], p: float) -> float:
+    ordered = sorted(latencies)
+    return ordered[max(0, math.ceil(p * len(ordered)) - 1)]
+
+# run requests calls of request on clients threads, returns the
+# latencies and the wall time
+def measure(request: Callable[[], None], requests: int, clients: int) -> Tuple[List[float],float]:
+    def timed(_) -> float:
+        start = time.perf_counter()
+        request()
+        return time.perf_counter() - start
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        latencies = list(pool.map(timed, range(requests)))
+    return latencies, time.perf_counter() - start
+
+def report(name: str, clients: int, latencies: List[float], seconds: float) -> None:
+    print("%-8s %8d %10.1f %10.2f %10.2f" % (name, clients, len(latencies) / seconds,
+                                             percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000))
+
+def wait_for_server(path: str, timeout: float) -> None:
+    deadline = time.time() + timeout
+    while True:
+        try:
+            compile_client.request(["--help"], path)
+            return
+        except OSError:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.05)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--file', type=str, default='tests/timing/timing.cpp')
+    parser.add_argument('--flags', type=str, default='', help='main.py options, e.g. --flags="-O2"')
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--cache', action='store_true')
+    args = parser.parse_args()
+
+    argv = args.flags.split() + ([] if args.cache else ["--no-cache"]) + [args.file]
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "server.sock")
+        env = dict(os.environ, CLASSIR_SERVER_SOCKET=path)
+        server = subprocess.Popen([sys.executable, "compile_server.py", "--socket", path], stderr=subprocess.DEVNULL)
+        try:
+            wait_for_server(path, 30)
+
+            def cold() -> None:
+                subprocess.run([sys.executable, "main.py"] + argv, check=True, stdout=subprocess.DEVNULL)
+
+            def client() -> None:
+                subprocess.run([sys.executable, "compile_client.py"] + argv, check=True, stdout=subprocess.DEVNULL, env=env)
+
+            def direct() -> None:
+                status, _, err = compile_client.request(argv, path)
+                if status != 0:
+                    raise RuntimeError(err)
+
+            print("%-8s %8s %10s %10s %10s" % ("mode", "clients", "req/s", "p50 (ms)", "p99 (ms)"))
+            for clients in args.clients:
+                for name, request in (("cold", cold), ("client", client), ("socket", direct)):
+                    latencies, seconds = measure(request, args.requests, clients)
+                    report(name, clients, latencies, seconds)
+        finally:
+            server.terminate()
+            server.wait()
@@ -0,0 +1,53 @@
+# Token tape benchmark
+#
+# Compares scanning into one Lexeme object per token (Scanner.token)
+# with bulk scanning onto a token tape (Scanner.tokenize). Reports
+# tokens/sec and the memory needed to hold every token of the input.
+#
+# run from the repository root:
+#   python3 -m benchmarks.token_tape_bench
+
+import argparse
+import time
+import tracemalloc
+from benchmarks.scanner_bench import make_input, make_scanner
+
+def lexemes(src: str) -> list:
+    s = make_scanner()
+    s.input_string(src)
+    ret = []
+    l = s.token()
+    while l is not None:
+        ret.append(l)
+        l = s.token()
+    return ret
+
+def tape(src: str):
+    s = make_scanner()
+    s.input_string(src)
+    return s.tokenize()
+
+# returns the result, the time in seconds and the bytes allocated
+# (and still alive) by the call
+def measure(f, src: str):
+    start = time.perf_counter()
+    f(src)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    result = f(src)
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, elapsed, allocated
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--statements', type=int, default=10000)
+    args = parser.parse_args()
+
+    src = make_input(args.statements)
+    print("%-10s %10s %14s %14s" % ("mode", "tokens", "tokens/sec", "bytes/token"))
+    for name, f in [("lexemes", lexemes), ("tape", tape)]:
+        result, elapsed, allocated = measure(f, src)
+        count = len(result)
+        print("%-10s %10d %14.0f %14.1f" % (name, count, count / elapsed, allocated / count))
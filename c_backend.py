@@ -0,0 +1,184 @@
+from typing import Dict,List,Set,Tuple
+from classir import Op, Instruction
+
+# The C backend: lowers the instructions to typed C++ locals and
+# native operators instead of calls to the classir.h helpers, which
+# take and return the virtual_reg union by value and cost a call per
+# instruction in -O0 builds. Control flow (labels and goto) and the IO
+# arguments are the same as in the classir.h output.
+#
+# Every instruction reads its operands as int or float and writes an
+# int or a float (see operand_types and result_types), so a variable
+# only ever used as one type becomes an int or a float local. A
+# variable used as both (a float condition compared as an int by beq,
+# a register reused for both types by register allocation) becomes a
+# local union like virtual_reg, accessed through the member of each
+# use. The types of the source and destination of a copy are merged,
+# so a copy is a plain assignment; copies of a variable to itself are
+# left out.
+#
+# python3 main.py --backend c -O2 tests/test8/test8.cpp
+
+INT = "int"
+FLOAT = "float"
+
+# the type an instruction writes
+result_types = {
+    Op.INT2VR: INT, Op.FLOAT2VR: FLOAT,
+    Op.ADDI: INT, Op.ADDF: FLOAT, Op.SUBI: INT, Op.SUBF: FLOAT,
+    Op.MULTI: INT, Op.MULTF: FLOAT, Op.DIVI: INT, Op.DIVF: FLOAT,
+    Op.EQI: INT, Op.EQF: INT, Op.LTI: INT, Op.LTF: INT,
+    Op.VR_INT2FLOAT: FLOAT, Op.VR_FLOAT2INT: INT,
+    Op.VR2INT: INT, Op.VR2FLOAT: FLOAT,
+    Op.INCI: INT, Op.DECI: INT, Op.SHLI: INT, Op.DIVPOW2I: INT,
+}
+
+# the type an instruction reads its (variable) operands as
+operand_types = {
+    Op.INT2VR: INT, Op.FLOAT2VR: FLOAT,
+    Op.ADDI: INT, Op.ADDF: FLOAT, Op.SUBI: INT, Op.SUBF: FLOAT,
+    Op.MULTI: INT, Op.MULTF: FLOAT, Op.DIVI: INT, Op.DIVF: FLOAT,
+    Op.EQI: INT, Op.EQF: FLOAT, Op.LTI: INT, Op.LTF: FLOAT,
+    Op.VR_INT2FLOAT: INT, Op.VR_FLOAT2INT: FLOAT,
+    Op.VR2INT: INT, Op.VR2FLOAT: FLOAT,
+    Op.INCI: INT, Op.DECI: INT, Op.SHLI: INT, Op.DIVPOW2I: INT,
+    Op.BEQ: INT, Op.BNEQ: INT,
+}
+
+operators = {
+    Op.ADDI: "+", Op.ADDF: "+", Op.SUBI: "-", Op.SUBF: "-",
+    Op.MULTI: "*", Op.MULTF: "*", Op.DIVI: "/", Op.DIVF: "/",
+    Op.EQI: "==", Op.EQF: "==", Op.LTI: "<", Op.LTF: "<",
+}
+
+# The types each variable is used as: the types it is written and
+# read as, shared along copies
+def variable_types(program: List[Instruction], io_variables: Set[str]) -> Dict[str,Set[str]]:
+    types = {}
+    copies = []
+    for i in program:
+        if i.op == Op.LABEL or i.op == Op.BRANCH:
+            continue
+        if i.op == Op.PHI:
+            raise ValueError("the C backend cannot print a program in SSA form")
+        if i.op == Op.COPY:
+            copies.append((i.dest, i.args[0]))
+            types.setdefault(i.dest, set())
+            types.setdefault(i.args[0], set())
+            continue
+        for a in i.uses():
+            if a not in io_variables:
+                types.setdefault(a, set()).add(operand_types[i.op])
+        if i.dest is not None and i.dest not in io_variables:
+            types.setdefault(i.dest, set()).add(result_types[i.op])
+
+    changed = True
+    while changed:
+        changed = False
+        for dest, source in copies:
+            for a, b in ((dest, source), (source, dest)):
+                if not types[a] >= types[b]:
+                    types[a] |= types[b]
+                    changed = True
+    for t in types.values():
+        if not t:
+            # only ever copied around
+            t.add(INT)
+    return types
+
+def float_literal(operand: str) -> str:
+    if "." not in operand and "e" not in operand and "E" not in operand:
+        operand += ".0"
+    return operand + "f"
+
+def int_literal(operand: str) -> str:
+    if int(operand) == -2**31:
+        return "(-2147483647 - 1)"
+    return operand
+
+# Formats the local declarations and the instructions of a program
+class CPrinter:
+    def __init__(self, program: List[Instruction], args: List[Tuple[str,str]]) -> None:
+        self.program = program
+        self.io_variables = set([a for a, _ in args])
+        self.types = variable_types(program, self.io_variables)
+
+    # variable v read or written as type t
+    def local(self, v: str, t: str) -> str:
+        if v in self.io_variables or len(self.types[v]) == 1:
+            return v
+        return "%s.%s" % (v, t[0])
+
+    def declarations(self) -> List[str]:
+        ret = []
+        variables = sorted(self.types, key=variable_order)
+        if any([len(self.types[v]) > 1 for v in variables]):
+            ret.append("union value { int i; float f; };")
+        for v in variables:
+            t = "value" if len(self.types[v]) > 1 else list(self.types[v])[0]
+            ret.append("%s %s;" % (t, v))
+        return ret
+
+    def format_instruction(self, i: Instruction) -> List[str]:
+        op = i.op
+        if op == Op.LABEL:
+            return ["%s:;" % i.args[0]]
+        if op == Op.BRANCH:
+            return ["goto %s;" % i.args[0]]
+        if op == Op.BEQ or op == Op.BNEQ:
+            return ["if (%s %s %s) goto %s;" % (self.local(i.args[0], INT), "==" if op == Op.BEQ else "!=",
+                                               self.local(i.args[1], INT), i.args[2])]
+        if op == Op.COPY:
+            if i.dest == i.args[0]:
+                return []
+            return ["%s = %s;" % (i.dest, i.args[0])]
+
+        dest = self.local(i.dest, result_types[op])
+        t = operand_types[op]
+        a = i.args[0]
+        if op == Op.INT2VR:
+            value = self.local(a, t) if a in self.io_variables else int_literal(a)
+        elif op == Op.FLOAT2VR:
+            value = self.local(a, t) if a in self.io_variables else float_literal(a)
+        elif op == Op.VR2INT or op == Op.VR2FLOAT:
+            value = self.local(a, t)
+        elif op in operators:
+            value = "%s %s %s" % (self.local(a, t), operators[op], self.local(i.args[1], t))
+        elif op == Op.VR_INT2FLOAT:
+            value = "static_cast<float>(%s)" % self.local(a, t)
+        elif op == Op.VR_FLOAT2INT:
+            value = "static_cast<int>(%s)" % self.local(a, t)
+        elif op == Op.INCI:
+            value = "%s + 1" % self.local(a, t)
+        elif op == Op.DECI:
+            value = "%s - 1" % self.local(a, t)
+        elif op == Op.SHLI:
+            value = "static_cast<int>(static_cast<unsigned>(%s) << %s)" % (self.local(a, t), i.args[1])
+        elif op == Op.DIVPOW2I:
+            a = self.local(a, t)
+            value = "(%s + ((%s >> 31) & %d)) >> %s" % (a, a, (1 << int(i.args[1])) - 1, i.args[1])
+        else:
+            raise ValueError("the C backend cannot print %s" % op.name.lower())
+        return ["%s = %s;" % (dest, value)]
+
+    def format_program(self) -> List[str]:
+        ret = []
+        for i in self.program:
+            ret.extend(self.format_instruction(i))
+        return ret
+
+# vr2 before vr10, the other names after the virtual registers
+def variable_order(v: str) -> Tuple[int,int,str]:
+    if v.startswith("vr") and v[2:].isdigit():
+        return (0, int(v[2:]), "")
+    return (1, 0, v)
+
+# the line the output starts with instead of the classir.h include
+preamble = "// C backend: typed locals and native operators, no classir.h"
+
+# the C++ function of a program (see IRCompiler.format_function)
+def format_function(program: List[Instruction], function_name: str, function_args: List[Tuple[str,str]]) -> str:
+    printer = CPrinter(program, function_args)
+    args = ["%s &%s" % (a[1], a[0]) for a in function_args]
+    return "void %s(%s){\n%s\n\n%s\nreturn;\n}" % (
+        function_name, ",".join(reversed(args)), "\n".join(printer.declarations()), "\n".join(printer.format_program()))
@@ -0,0 +1,174 @@
+from typing import List,Optional,Set,Tuple
+from classir import Instruction, branch_ops, LABEL, BRANCH
+
+# The bounds (start, end) of the basic blocks of a program: a label
+# starts a new block and a branch ends the current one. Block b is
+# program[start:end].
+def block_bounds(program: List[Instruction]) -> List[Tuple[int,int]]:
+    bounds = []
+    start = 0
+    for k, i in enumerate(program):
+        if i.op is LABEL and k > start:
+            bounds.append((start, k))
+            start = k
+        if i.op in branch_ops:
+            bounds.append((start, k + 1))
+            start = k + 1
+    if start < len(program):
+        bounds.append((start, len(program)))
+    return bounds
+
+# split a program into basic blocks
+def basic_blocks(program: List[Instruction]) -> List[List[Instruction]]:
+    return [program[start:end] for start, end in block_bounds(program)]
+
+# A basic block of a control flow graph: the instructions
+# program[start:end] and the indexes of its successor and
+# predecessor blocks
+class BasicBlock:
+    def __init__(self, index: int, start: int, end: int) -> None:
+        self.index = index
+        self.start = start
+        self.end = end
+        self.succs = []
+        self.preds = []
+
+# The control flow graph of a program. Blocks are in program order,
+# block 0 is the entry. A block falls through to the next block
+# unless it ends with an unconditional branch.
+class CFG:
+    def __init__(self, program: List[Instruction]) -> None:
+        self.program = program
+        self.blocks = [BasicBlock(b, start, end) for b, (start, end) in enumerate(block_bounds(program))]
+
+        # label -> index of the block it starts
+        self.labels = {}
+        for block in self.blocks:
+            first = program[block.start]
+            if first.op is LABEL:
+                self.labels[first.args[0]] = block.index
+
+        for block in self.blocks:
+            last = program[block.end - 1]
+            if last.op in branch_ops:
+                self.add_edge(block.index, self.labels[last.target()])
+            if last.op is not BRANCH and block.index + 1 < len(self.blocks):
+                self.add_edge(block.index, block.index + 1)
+
+    def add_edge(self, source: int, dest: int) -> None:
+        if dest not in self.blocks[source].succs:
+            self.blocks[source].succs.append(dest)
+            self.blocks[dest].preds.append(source)
+
+    def instructions(self, block: BasicBlock) -> List[Instruction]:
+        return self.program[block.start:block.end]
+
+    # the blocks in reverse postorder of a depth first search from
+    # the entry (unreachable blocks are left out)
+    def reverse_postorder(self) -> List[int]:
+        if not self.blocks:
+            return []
+        order = []
+        visited = bytearray(len(self.blocks))
+        visited[0] = 1
+        stack = [(0, iter(self.blocks[0].succs))]
+        while stack:
+            b, succs = stack[-1]
+            for s in succs:
+                if not visited[s]:
+                    visited[s] = 1
+                    stack.append((s, iter(self.blocks[s].succs)))
+                    break
+            else:
+                stack.pop()
+                order.append(b)
+        order.reverse()
+        return order
+
+# The dominators of every block as bitsets (python ints), block d
+# dominating block b if bit d of dominators[b] is set. Solved
+# iteratively over the reverse postorder; unreachable blocks get 0.
+def dominators(cfg: CFG) -> List[int]:
+    order = cfg.reverse_postorder()
+    every = (1 << len(cfg.blocks)) - 1
+    dom = [0] * len(cfg.blocks)
+    for b in order:
+        dom[b] = every
+    if order:
+        dom[0] = 1
+    changed = True
+    while changed:
+        changed = False
+        for b in order[1:]:
+            new_dom = every
+            for p in cfg.blocks[b].preds:
+                if dom[p]:
+                    new_dom &= dom[p]
+            new_dom |= 1 << b
+            if new_dom != dom[b]:
+                dom[b] = new_dom
+                changed = True
+    return dom
+
+# The immediate dominator of every block (None for the entry and
+# unreachable blocks): the strict dominator of b dominated by every
+# other strict dominator of b. Its dominators are exactly the strict
+# dominators of b, and dominator sets are distinct.
+def immediate_dominators(cfg: CFG, dom: List[int]) -> List[Optional[int]]:
+    block_of = {d: b for b, d in enumerate(dom) if d}
+    ret = [None] * len(cfg.blocks)
+    for b, d in enumerate(dom):
+        if d and b != 0:
+            ret[b] = block_of[d & ~(1 << b)]
+    return ret
+
+# the children of every block in the dominator tree, in program order
+def dominator_tree(idom: List[Optional[int]]) -> List[List[int]]:
+    children = [[] for _ in idom]
+    for b, d in enumerate(idom):
+        if d is not None:
+            children[d].append(b)
+    return children
+
+# A natural loop: the header block, the blocks of the loop (header
+# included) and the latches, the blocks with a back edge to the
+# header. depth is the number of loops the loop is nested in.
+class Loop:
+    def __init__(self, header: int) -> None:
+        self.header = header
+        self.blocks = set([header])
+        self.latches = []
+        self.depth = 0
+
+    # the blocks outside of the loop its blocks branch to
+    def exits(self, cfg: CFG) -> Set[int]:
+        return set([s for b in self.blocks for s in cfg.blocks[b].succs if s not in self.blocks])
+
+    # the blocks outside of the loop entering it
+    def entries(self, cfg: CFG) -> List[int]:
+        return [p for p in cfg.blocks[self.header].preds if p not in self.blocks]
+
+# The natural loops of a control flow graph, one per header: an edge
+# from block t to block h is a back edge when h dominates t, and the
+# loop is h with every block reaching t without going through h. Loops
+# sharing a header are merged. Loops are in program order of their
+# headers.
+def natural_loops(cfg: CFG, dom: List[int]) -> List[Loop]:
+    loops = {}
+    for block in cfg.blocks:
+        t = block.index
+        for h in block.succs:
+            if dom[t] >> h & 1:
+                loop = loops.setdefault(h, Loop(h))
+                loop.latches.append(t)
+                stack = [t]
+                while stack:
+                    b = stack.pop()
+                    if b not in loop.blocks and dom[b]:
+                        loop.blocks.add(b)
+                        stack.extend(cfg.blocks[b].preds)
+
+    ret = [loops[h] for h in sorted(loops)]
+    for loop in ret:
+        loop.depth = len([l for l in ret if l is not loop and loop.header in l.blocks])
+    return ret
@@ -107,6 +107,35 @@ virtual_reg vr_float2int(virtual_reg op1) {
 
 }
 
+// strength reduced integer operators. The shift amount of the
+// shifts is a plain int (a literal in the IR)
+virtual_reg inci(virtual_reg op1) {
+  virtual_reg ret;
+  ret.i = op1.i + 1;
+  return ret;
+}
+
+virtual_reg deci(virtual_reg op1) {
+  virtual_reg ret;
+  ret.i = op1.i - 1;
+  return ret;
+}
+
+// op1 * 2^op2, wrapping around like multi
+virtual_reg shli(virtual_reg op1, int op2) {
+  virtual_reg ret;
+  ret.i = static_cast<int>(static_cast<unsigned>(op1.i) << op2);
+  return ret;
+}
+
+// op1 / 2^op2 rounded towards zero like divi: a negative op1 is
+// biased by 2^op2 - 1 before the arithmetic shift
+virtual_reg divpow2i(virtual_reg op1, int op2) {
+  virtual_reg ret;
+  ret.i = (op1.i + ((op1.i >> 31) & ((1 << op2) - 1))) >> op2;
+  return ret;
+}
+
 // virtual register back to input/output
 int vr2int(virtual_reg op1) {
   return op1.i;
@@ -0,0 +1,193 @@
+from enum import IntEnum
+from typing import Dict,List,Optional,Tuple
+
+# The ClassIeR instruction set (see classir.h). Opcodes are small
+# integers so that passes can hash and compare them cheaply; the
+# lower case member name is the name used in the C++ output.
+class Op(IntEnum):
+    # primitives to virtual registers
+    INT2VR = 0
+    FLOAT2VR = 1
+
+    # binary operators
+    ADDI = 2
+    ADDF = 3
+    SUBI = 4
+    SUBF = 5
+    MULTI = 6
+    MULTF = 7
+    DIVI = 8
+    DIVF = 9
+    EQI = 10
+    EQF = 11
+    LTI = 12
+    LTF = 13
+
+    # casting between types
+    VR_INT2FLOAT = 14
+    VR_FLOAT2INT = 15
+
+    # virtual register back to input/output
+    VR2INT = 16
+    VR2FLOAT = 17
+
+    # dest = source, e.g. assigning a program variable
+    COPY = 18
+
+    # control flow
+    BEQ = 19
+    BNEQ = 20
+    BRANCH = 21
+    LABEL = 22
+
+    # strength reduced integer operators (see strength_reduction.py),
+    # the second operand of shli/divpow2i is a literal shift amount
+    INCI = 23
+    DECI = 24
+    SHLI = 25
+    DIVPOW2I = 26
+
+    # only in SSA form (see static_single_assignment.py), the value of
+    # the operand for the predecessor the block was entered from
+    PHI = 27
+
+op_names = {op: op.name.lower() for op in Op}
+
+# opcodes the passes compare against in their inner loops, as module
+# level names (enum member lookups are slow)
+INT2VR = Op.INT2VR
+FLOAT2VR = Op.FLOAT2VR
+ADDI = Op.ADDI
+SUBI = Op.SUBI
+MULTI = Op.MULTI
+DIVI = Op.DIVI
+COPY = Op.COPY
+BRANCH = Op.BRANCH
+LABEL = Op.LABEL
+INCI = Op.INCI
+DECI = Op.DECI
+PHI = Op.PHI
+
+load_ops = frozenset([Op.INT2VR, Op.FLOAT2VR])
+binary_ops = frozenset([Op.ADDI, Op.ADDF, Op.SUBI, Op.SUBF, Op.MULTI, Op.MULTF,
+                        Op.DIVI, Op.DIVF, Op.EQI, Op.EQF, Op.LTI, Op.LTF])
+unary_ops = frozenset([Op.VR_INT2FLOAT, Op.VR_FLOAT2INT])
+reduced_ops = frozenset([Op.INCI, Op.DECI, Op.SHLI, Op.DIVPOW2I])
+store_ops = frozenset([Op.VR2INT, Op.VR2FLOAT])
+branch_ops = frozenset([Op.BEQ, Op.BNEQ, Op.BRANCH])
+
+# operations computing a value from registers only
+arithmetic_ops = binary_ops | unary_ops | reduced_ops
+
+# operations whose operands can be swapped
+commutative_ops = frozenset([Op.ADDI, Op.ADDF, Op.MULTI, Op.MULTF, Op.EQI, Op.EQF])
+
+# Is an operand a literal (a number, negative ones come from
+# constant folding) rather than a variable?
+def is_literal(operand: str) -> bool:
+    return operand[0].isdigit() or operand[0] == "." or operand[0] == "-"
+
+# The value of an int literal read like C does: a leading 0 makes it
+# octal (010 is 8). None for a literal that is not a C int literal
+# (08).
+def int_literal_value(literal: str) -> Optional[int]:
+    digits = literal.lstrip("-")
+    try:
+        value = int(digits, 8) if len(digits) > 1 and digits[0] == "0" else int(digits)
+    except ValueError:
+        return None
+    return -value if literal.startswith("-") else value
+
+# One ClassIeR instruction:
+# * op is the operation
+# * dest is the variable written (None for control flow)
+# * args are the operands: variables or literals for computations,
+#   the compared registers and the target label for beq/bneq, the
+#   target label for branch and the label itself for a label
+class Instruction:
+    __slots__ = ("op", "dest", "args")
+
+    def __init__(self, op: Op, dest: Optional[str] = None, args: Tuple[str, ...] = ()) -> None:
+        self.op = op
+        self.dest = dest
+        self.args = args
+
+    def __str__(self) -> str:
+        return format_instruction(self)
+
+    def __repr__(self) -> str:
+        return "Instruction(%s)" % format_instruction(self)
+
+    # the variables read by this instruction
+    def uses(self) -> List[str]:
+        if self.op in branch_ops:
+            return list(self.args[:-1])
+        if self.op == Op.LABEL:
+            return []
+        return [a for a in self.args if not is_literal(a)]
+
+    # the label this instruction branches to, if any
+    def target(self) -> Optional[str]:
+        if self.op in branch_ops:
+            return self.args[-1]
+        return None
+
+    # a copy with variables and labels renamed through names
+    def rename(self, names: Dict[str, str]) -> "Instruction":
+        dest = names.get(self.dest, self.dest)
+        args = tuple([names.get(a, a) for a in self.args])
+        return Instruction(self.op, dest, args)
+
+# Instruction constructors
+
+def label(name: str) -> Instruction:
+    return Instruction(Op.LABEL, None, (name,))
+
+def branch(target: str) -> Instruction:
+    return Instruction(Op.BRANCH, None, (target,))
+
+def beq(op1: str, op2: str, target: str) -> Instruction:
+    return Instruction(Op.BEQ, None, (op1, op2, target))
+
+def copy(dest: str, source: str) -> Instruction:
+    return Instruction(Op.COPY, dest, (source,))
+
+# Collects the instructions of a function in program order. Code is
+# only ever appended; a range of emitted code (from a position() up to
+# the end) can be cut out with extract() and emitted again, e.g. to
+# lay a loop out differently.
+class Emitter:
+    def __init__(self) -> None:
+        self.code = []
+
+    def emit(self, i: Instruction) -> None:
+        self.code.append(i)
+
+    def extend(self, program: List[Instruction]) -> None:
+        self.code.extend(program)
+
+    # the index the next emitted instruction will get
+    def position(self) -> int:
+        return len(self.code)
+
+    # remove and return the instructions emitted since position start
+    def extract(self, start: int) -> List[Instruction]:
+        ret = self.code[start:]
+        del self.code[start:]
+        return ret
+
+# The text printer: formats an instruction as C++ using classir.h
+def format_instruction(i: Instruction) -> str:
+    op = i.op
+    if op == Op.LABEL:
+        return "%s:" % i.args[0]
+    if op == Op.BRANCH:
+        return "branch(%s);" % i.args[0]
+    if op in branch_ops:
+        return "%s(%s);" % (op_names[op], ", ".join(i.args))
+    if op == Op.COPY:
+        return "%s = %s;" % (i.dest, i.args[0])
+    return "%s = %s(%s);" % (i.dest, op_names[op], ",".join(i.args))
+
+def format_program(program: List[Instruction]) -> List[str]:
+    return [format_instruction(i) for i in program]
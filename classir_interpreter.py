@@ -0,0 +1,391 @@
+import argparse
+import math
+import re
+import struct
+import sys
+from typing import Dict,List,Optional,Tuple,Union
+from classir import Op, Instruction, op_names, is_literal, int_literal_value, branch_ops
+from cfg import block_bounds
+import main
+
+# ClassIeR interpreter: runs the IR printed by IRCompiler in process,
+# with the semantics of classir.h, and counts what it executes.
+#
+# * a virtual_reg is a union of a 32 bit int and a float: a register
+#   holds a Python int (written through .i) or a Python float rounded
+#   to single precision (written through .f), and reading it through
+#   the other member reinterprets the bits like the union does
+# * int arithmetic wraps around at 32 bits, divi rounds towards zero
+#   and a division by zero or of INT_MIN by -1 is an error (it traps
+#   in C++); vr_float2int of a float out of the int range gives
+#   INT_MIN like x86
+# * beq/bneq compare the int members, the IO arguments are read and
+#   written through int2vr/float2vr and vr2int/vr2float
+#
+# The program is decoded once: every variable and literal gets a slot
+# in a register list, every instruction becomes a tuple of small ints
+# (opcode, dest slot, operand slots) and every basic block a tuple of
+# its instructions and how it ends (fall through, branch, beq or bneq
+# with the index of the target block), so running it never looks at a
+# name or a label. The interpreter counts how often each block runs;
+# the count of each opcode follows from those and the static opcodes
+# of the blocks (labels are not counted). The counts accumulate over
+# runs until reset_counters.
+#
+# python3 classir_interpreter.py tests/test8/test8.cpp -O2 --input x=1 y=2
+# python3 classir_interpreter.py --ir tests/test8/test8ir.cpp
+
+class InterpreterException(Exception):
+    pass
+
+INT_MIN = -2**31
+INT_MAX = 2**31 - 1
+
+float32 = struct.Struct("f")
+int32 = struct.Struct("i")
+
+# a Python float rounded to single precision
+def to_float32(f: float) -> float:
+    try:
+        return float32.unpack(float32.pack(f))[0]
+    except OverflowError:
+        return float("inf") if f > 0 else float("-inf")
+
+# a Python int wrapped around to 32 bits
+def to_int32(i: int) -> int:
+    return ((i - INT_MIN) & 0xffffffff) + INT_MIN
+
+# reading a register through the other union member
+def int_view(v: Union[int,float]) -> int:
+    if v.__class__ is int:
+        return v
+    return int32.unpack(float32.pack(v))[0]
+
+def float_view(v: Union[int,float]) -> float:
+    if v.__class__ is float:
+        return v
+    return float32.unpack(int32.pack(v))[0]
+
+# opcodes as plain ints (enum comparisons are slow)
+INT2VR = int(Op.INT2VR)
+FLOAT2VR = int(Op.FLOAT2VR)
+ADDI = int(Op.ADDI)
+ADDF = int(Op.ADDF)
+SUBI = int(Op.SUBI)
+SUBF = int(Op.SUBF)
+MULTI = int(Op.MULTI)
+MULTF = int(Op.MULTF)
+DIVI = int(Op.DIVI)
+DIVF = int(Op.DIVF)
+EQI = int(Op.EQI)
+EQF = int(Op.EQF)
+LTI = int(Op.LTI)
+LTF = int(Op.LTF)
+VR_INT2FLOAT = int(Op.VR_INT2FLOAT)
+VR_FLOAT2INT = int(Op.VR_FLOAT2INT)
+VR2INT = int(Op.VR2INT)
+VR2FLOAT = int(Op.VR2FLOAT)
+COPY = int(Op.COPY)
+INCI = int(Op.INCI)
+DECI = int(Op.DECI)
+SHLI = int(Op.SHLI)
+DIVPOW2I = int(Op.DIVPOW2I)
+
+# how a block ends
+FALL_THROUGH = 0
+BRANCH = 1
+BEQ = 2
+BNEQ = 3
+
+# the operations whose second operand is a literal shift amount
+shift_ops = frozenset([Op.SHLI, Op.DIVPOW2I])
+
+ops_by_name = {name: op for op, name in op_names.items()}
+
+header_re = re.compile(r"^void\s+(\w+)\s*\((.*)\)\s*\{$")
+declaration_re = re.compile(r"^virtual_reg\s+(\w+);$")
+label_re = re.compile(r"^(\w+):$")
+branch_re = re.compile(r"^branch\((\w+)\);$")
+compare_re = re.compile(r"^(beq|bneq)\((\w+),\s*(\w+),\s*(\w+)\);$")
+operation_re = re.compile(r"^(\w+) = (\w+)\(([^()]*)\);$")
+copy_re = re.compile(r"^(\w+) = ([\w.\-]+);$")
+
+# Parse the IR text printed by IRCompiler, returns the function name,
+# its arguments ((name, type) in order) and the instructions
+def parse_ir(text: str) -> Tuple[str,List[Tuple[str,str]],List[Instruction]]:
+    name = None
+    args = []
+    program = []
+    for lineno, line in enumerate(text.split("\n"), 1):
+        line = line.strip()
+        if name is None:
+            m = header_re.match(line)
+            if m is not None:
+                name = m.group(1)
+                for arg in [a for a in m.group(2).split(",") if a.strip()]:
+                    t, a = arg.split("&")
+                    args.append((a.strip(), t.strip()))
+            continue
+        if not line or line.startswith("//") or declaration_re.match(line):
+            continue
+        if line == "return;":
+            return name, args, program
+        m = label_re.match(line)
+        if m is not None:
+            program.append(Instruction(Op.LABEL, None, (m.group(1),)))
+            continue
+        m = branch_re.match(line)
+        if m is not None:
+            program.append(Instruction(Op.BRANCH, None, (m.group(1),)))
+            continue
+        m = compare_re.match(line)
+        if m is not None:
+            program.append(Instruction(ops_by_name[m.group(1)], None, m.groups()[1:]))
+            continue
+        m = operation_re.match(line)
+        if m is not None and m.group(2) in ops_by_name:
+            operands = tuple([a.strip() for a in m.group(3).split(",")])
+            program.append(Instruction(ops_by_name[m.group(2)], m.group(1), operands))
+            continue
+        m = copy_re.match(line)
+        if m is not None:
+            program.append(Instruction(Op.COPY, m.group(1), (m.group(2),)))
+            continue
+        raise InterpreterException("cannot parse IR line %d: %s" % (lineno, line))
+    raise InterpreterException("no function body in the IR")
+
+# the value of a literal operand: an int (octal with a leading 0, like
+# C), or a float if it has a decimal point or an exponent
+def literal_value(operand: str) -> Union[int,float]:
+    if "." in operand or "e" in operand or "E" in operand:
+        return to_float32(float(operand))
+    value = int_literal_value(operand)
+    if value is None:
+        raise InterpreterException("invalid int literal: %s" % operand)
+    return to_int32(value)
+
+# A decoded program and its execution counters
+class Interpreter:
+    def __init__(self, program: List[Instruction], args: List[Tuple[str,str]]) -> None:
+        self.args = args
+        self.slots = {}         # variable or literal -> slot
+        self.registers = []     # the initial register list: literals set, variables 0
+        for name, _ in args:
+            self.slot(name)
+
+        bounds = block_bounds(program)
+        block_of_label = {}
+        for b, (start, end) in enumerate(bounds):
+            if program[start].op == Op.LABEL:
+                block_of_label[program[start].args[0]] = b
+
+        self.blocks = []
+        self.block_names = []
+        self.block_ops = []     # the static opcodes of each block
+        for b, (start, end) in enumerate(bounds):
+            code = []
+            ops = []
+            ending = (FALL_THROUGH, b + 1, 0, 0)
+            for i in program[start:end]:
+                if i.op == Op.LABEL:
+                    continue
+                ops.append(i.op)
+                if i.op == Op.BRANCH:
+                    ending = (BRANCH, block_of_label[i.args[0]], 0, 0)
+                elif i.op in branch_ops:
+                    kind = BEQ if i.op == Op.BEQ else BNEQ
+                    ending = (kind, block_of_label[i.args[2]], self.slot(i.args[0]), self.slot(i.args[1]))
+                elif i.op == Op.PHI:
+                    raise InterpreterException("cannot run a program in SSA form")
+                else:
+                    code.append(self.decode(i))
+            self.blocks.append((tuple(code),) + ending)
+            first = program[start]
+            self.block_names.append(first.args[0] if first.op == Op.LABEL else "block%d" % b)
+            self.block_ops.append(ops)
+        self.reset_counters()
+
+    def slot(self, operand: str) -> int:
+        s = self.slots.get(operand)
+        if s is None:
+            s = len(self.registers)
+            self.slots[operand] = s
+            self.registers.append(literal_value(operand) if is_literal(operand) else 0)
+        return s
+
+    def decode(self, i: Instruction) -> Tuple[int,int,int,int]:
+        a = self.slot(i.args[0])
+        if len(i.args) == 1:
+            b = 0
+        elif i.op in shift_ops:
+            b = int(i.args[1])
+        else:
+            b = self.slot(i.args[1])
+        return (int(i.op), self.slot(i.dest), a, b)
+
+    def reset_counters(self) -> None:
+        self.block_counts = [0] * len(self.blocks)
+        self.runs = 0
+
+    # Run the function once. inputs gives the argument values (0 for
+    # missing ones), returns the argument values at the end. Running
+    # more than max_instructions instructions is an error.
+    def run(self, inputs: Optional[Dict[str,Union[int,float]]] = None, max_instructions: Optional[int] = None) -> Dict[str,Union[int,float]]:
+        r = list(self.registers)
+        for name, t in self.args:
+            v = (inputs or {}).get(name, 0)
+            r[self.slots[name]] = to_int32(int(v)) if t == "int" else to_float32(float(v))
+
+        blocks = self.blocks
+        counts = self.block_counts
+        sizes = [len(ops) for ops in self.block_ops]
+        limit = max_instructions
+        executed = 0
+        b = 0
+        n = len(blocks)
+        while b < n:
+            code, kind, target, x, y = blocks[b]
+            counts[b] += 1
+            if limit is not None:
+                executed += sizes[b]
+                if executed > limit:
+                    raise InterpreterException("ran more than %d instructions" % limit)
+            for op, d, a1, a2 in code:
+                if op == COPY:
+                    r[d] = r[a1]
+                elif op == INT2VR or op == VR2INT:
+                    r[d] = int_view(r[a1])
+                elif op == FLOAT2VR or op == VR2FLOAT:
+                    r[d] = float_view(r[a1])
+                elif op == ADDI:
+                    v = int_view(r[a1]) + int_view(r[a2])
+                    r[d] = v if INT_MIN <= v <= INT_MAX else to_int32(v)
+                elif op == SUBI:
+                    v = int_view(r[a1]) - int_view(r[a2])
+                    r[d] = v if INT_MIN <= v <= INT_MAX else to_int32(v)
+                elif op == MULTI:
+                    v = int_view(r[a1]) * int_view(r[a2])
+                    r[d] = v if INT_MIN <= v <= INT_MAX else to_int32(v)
+                elif op == LTI:
+                    r[d] = int(int_view(r[a1]) < int_view(r[a2]))
+                elif op == EQI:
+                    r[d] = int(int_view(r[a1]) == int_view(r[a2]))
+                elif op == INCI:
+                    v = int_view(r[a1]) + 1
+                    r[d] = v if v <= INT_MAX else INT_MIN
+                elif op == DECI:
+                    v = int_view(r[a1]) - 1
+                    r[d] = v if v >= INT_MIN else INT_MAX
+                elif op == SHLI:
+                    r[d] = to_int32(int_view(r[a1]) << a2)
+                elif op == DIVPOW2I:
+                    v = int_view(r[a1])
+                    r[d] = (v + ((v >> 31) & ((1 << a2) - 1))) >> a2
+                elif op == DIVI:
+                    v = int_view(r[a1])
+                    w = int_view(r[a2])
+                    if w == 0:
+                        raise InterpreterException("integer division by zero")
+                    if w == -1 and v == INT_MIN:
+                        raise InterpreterException("integer division overflow")
+                    q = abs(v) // abs(w)
+                    r[d] = to_int32(q if (v < 0) == (w < 0) else -q)
+                elif op == ADDF:
+                    r[d] = to_float32(float_view(r[a1]) + float_view(r[a2]))
+                elif op == SUBF:
+                    r[d] = to_float32(float_view(r[a1]) - float_view(r[a2]))
+                elif op == MULTF:
+                    r[d] = to_float32(float_view(r[a1]) * float_view(r[a2]))
+                elif op == DIVF:
+                    r[d] = divide_float(float_view(r[a1]), float_view(r[a2]))
+                elif op == LTF:
+                    r[d] = int(float_view(r[a1]) < float_view(r[a2]))
+                elif op == EQF:
+                    r[d] = int(float_view(r[a1]) == float_view(r[a2]))
+                elif op == VR_INT2FLOAT:
+                    r[d] = to_float32(float(int_view(r[a1])))
+                elif op == VR_FLOAT2INT:
+                    f = float_view(r[a1])
+                    r[d] = int(f) if -2.0**31 <= f < 2.0**31 else INT_MIN
+                else:
+                    raise InterpreterException("cannot run opcode %d" % op)
+            if kind <= BRANCH:
+                b = target
+            elif (int_view(r[x]) == int_view(r[y])) == (kind == BEQ):
+                b = target
+            else:
+                b += 1
+
+        self.runs += 1
+        ret = {}
+        for name, t in self.args:
+            v = r[self.slots[name]]
+            ret[name] = int_view(v) if t == "int" else float_view(v)
+        return ret
+
+    # the number of times each opcode ran
+    def op_counts(self) -> Dict[str,int]:
+        ret = {}
+        for count, ops in zip(self.block_counts, self.block_ops):
+            if count:
+                for op in ops:
+                    ret[op_names[op]] = ret.get(op_names[op], 0) + count
+        return ret
+
+    # the number of instructions run
+    def instructions(self) -> int:
+        return sum([count * len(ops) for count, ops in zip(self.block_counts, self.block_ops)])
+
+    def report(self) -> List[str]:
+        lines = ["%d instructions in %d runs" % (self.instructions(), self.runs)]
+        for name, count in sorted(self.op_counts().items(), key=lambda c: -c[1]):
+            lines.append("  %-14s %10d" % (name, count))
+        lines.append("blocks:")
+        for name, count, ops in zip(self.block_names, self.block_counts, self.block_ops):
+            lines.append("  %-14s %10d runs of %d instructions" % (name, count, len(ops)))
+        return lines
+
+# IEEE division: x/0 is an infinity or NaN rather than an error
+def divide_float(x: float, y: float) -> float:
+    if y == 0.0:
+        if x == 0.0 or x != x:
+            return float("nan")
+        return math.copysign(float("inf"), x) * math.copysign(1.0, y)
+    return to_float32(x / y)
+
+# an interpreter for the IR text printed by IRCompiler
+def load(text: str) -> Tuple[str,Interpreter]:
+    name, args, program = parse_ir(text)
+    return name, Interpreter(program, args)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('file_name', type=str)
+    parser.add_argument('--ir', action='store_true', help='the file is compiled IR, not C-simple')
+    parser.add_argument('--input', type=str, nargs='*', default=[], help='argument values, e.g. x=1 y=2.5')
+    parser.add_argument('--runs', type=int, default=1)
+    parser.add_argument('--max_instructions', type=int)
+    main.add_compile_arguments(parser)
+    args = parser.parse_args()
+
+    if args.ir:
+        with open(args.file_name) as f:
+            text = f.read()
+    else:
+        if args.unroll_factor is None:
+            args.unroll_factor = 1
+        pipeline, fixed_point = main.select_passes(parser, args)
+        text = main.compile_file(args.file_name, pipeline, args.unroll_factor, fixed_point)
+    inputs = {}
+    for i in args.input:
+        name, value = i.split("=")
+        inputs[name] = float(value) if "." in value else int(value)
+
+    try:
+        name, interpreter = load(text)
+        for _ in range(args.runs):
+            outputs = interpreter.run(inputs, args.max_instructions)
+    except InterpreterException as e:
+        sys.exit("error: %s" % e)
+    print("%s(%s)" % (name, ", ".join(["%s = %s" % (a, outputs[a]) for a, _ in interpreter.args])))
+    print("\n".join(interpreter.report()))
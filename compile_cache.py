@@ -0,0 +1,219 @@
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+from typing import Dict,List,Optional
+
+# On-disk cache of compiled IR, content addressed: the key is the
+# sha256 of the compiler's own sources, the options (passes, unroll
+# factor, ...) and the source text, and an entry holds the IR text
+# main.py prints. A hit skips scanning, parsing and every pass.
+#
+# Entries are written to a temporary file in the cache directory and
+# renamed over the entry, so a concurrent reader sees the old entry,
+# the new one or none, never part of one. Reads touch the entry's
+# modification time, and after a write the least recently used
+# entries are removed until the cache fits in max_bytes.
+#
+# A lookup is counted by appending one byte (h or m) to stats.log
+# under a shared lock on stats.lock, so concurrent builds do not wait
+# for each other. Once the log reaches stats_merge_bytes, and whenever
+# the statistics are read, it is added up into stats.json and emptied
+# under the exclusive lock, which waits for the appends in progress.
+#
+# python3 compile_cache.py prints the statistics, --clear empties the
+# cache.
+
+default_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".ir_cache")
+default_max_bytes = 64 * 2**20
+
+entry_suffix = ".ir"
+
+stats_merge_bytes = 4096
+
+class CompileCache:
+    def __init__(self, directory: str = default_directory, max_bytes: int = default_max_bytes) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.version = None
+
+    # the sha256 of the compiler's modules: editing the compiler
+    # changes every key
+    def compiler_version(self) -> str:
+        if self.version is None:
+            h = hashlib.sha256()
+            here = os.path.dirname(os.path.abspath(__file__))
+            for name in sorted(os.listdir(here)):
+                if name.endswith(".py"):
+                    with open(os.path.join(here, name), "rb") as f:
+                        h.update(name.encode())
+                        h.update(f.read())
+            self.version = h.hexdigest()
+        return self.version
+
+    def key(self, source: bytes, options: List[str]) -> str:
+        h = hashlib.sha256()
+        h.update(self.compiler_version().encode())
+        # the options are separated by a byte no option contains
+        h.update("\0".join(options).encode())
+        h.update(b"\0")
+        h.update(source)
+        return h.hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + entry_suffix)
+
+    # the IR of a key, None on a miss
+    def get(self, key: str) -> Optional[str]:
+        try:
+            with open(self.path(key), "r") as f:
+                ret = f.read()
+            os.utime(self.path(key))
+        except OSError:
+            # missing, or evicted by another build since
+            self.record(False)
+            return None
+        self.record(True)
+        return ret
+
+    def put(self, key: str, ir: str) -> None:
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    f.write(ir)
+                os.replace(tmp, self.path(key))
+            except BaseException:
+                os.unlink(tmp)
+                raise
+            self.evict()
+        except OSError:
+            # the cache is an optimization, compiling still succeeded
+            pass
+
+    # the entries as (modification time, size, path), oldest first
+    def entries(self) -> List[tuple]:
+        ret = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return ret
+        for name in names:
+            if name.endswith(entry_suffix):
+                p = os.path.join(self.directory, name)
+                try:
+                    st = os.stat(p)
+                except OSError:
+                    continue
+                ret.append((st.st_mtime, st.st_size, p))
+        ret.sort()
+        return ret
+
+    # remove the least recently used entries until the cache fits
+    def evict(self) -> None:
+        entries = self.entries()
+        total = sum([e[1] for e in entries])
+        for _, size, p in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(p)
+            except OSError:
+                pass
+            total -= size
+
+    def stats_file(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def record(self, hit: bool) -> None:
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.stats_file("stats.lock"), "w") as lock:
+                fcntl.flock(lock, fcntl.LOCK_SH)
+                fd = os.open(self.stats_file("stats.log"), os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+                try:
+                    os.write(fd, b"h" if hit else b"m")
+                    size = os.fstat(fd).st_size
+                finally:
+                    os.close(fd)
+                if size < stats_merge_bytes:
+                    return
+                fcntl.flock(lock, fcntl.LOCK_UN)
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # another build is appending or merging, a later
+                    # lookup merges
+                    return
+                self.merge_stats()
+        except OSError:
+            pass
+
+    # add the log up into stats.json and empty it, under the exclusive
+    # lock
+    def merge_stats(self) -> Dict[str,int]:
+        stats_path = self.stats_file("stats.json")
+        log_path = self.stats_file("stats.log")
+        try:
+            with open(stats_path) as f:
+                stats = json.load(f)
+        except (OSError, ValueError):
+            stats = {"hits": 0, "misses": 0}
+        try:
+            with open(log_path, "rb") as f:
+                log = f.read()
+        except OSError:
+            log = b""
+        if log:
+            stats["hits"] += log.count(b"h")
+            stats["misses"] += log.count(b"m")
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(stats, f)
+            os.replace(tmp, stats_path)
+            os.truncate(log_path, 0)
+        return stats
+
+    # the hit and miss counts, the number of entries and their size
+    def stats(self) -> Dict[str,int]:
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.stats_file("stats.lock"), "w") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                ret = dict(self.merge_stats())
+        except OSError:
+            ret = {"hits": 0, "misses": 0}
+        entries = self.entries()
+        ret["entries"] = len(entries)
+        ret["bytes"] = sum([e[1] for e in entries])
+        return ret
+
+    def clear(self) -> None:
+        for _, _, p in self.entries():
+            try:
+                os.unlink(p)
+            except OSError:
+                pass
+        for name in ["stats.json", "stats.log"]:
+            try:
+                os.unlink(self.stats_file(name))
+            except OSError:
+                pass
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cache_dir', type=str, default=default_directory)
+    parser.add_argument('--clear', action='store_true')
+    args = parser.parse_args()
+    cache = CompileCache(args.cache_dir)
+    if args.clear:
+        cache.clear()
+    stats = cache.stats()
+    lookups = stats["hits"] + stats["misses"]
+    print("hits: %d" % stats["hits"])
+    print("misses: %d" % stats["misses"])
+    print("hit rate: %.1f%%" % (100.0 * stats["hits"] / lookups if lookups else 0.0))
+    print("entries: %d (%d bytes)" % (stats["entries"], stats["bytes"]))
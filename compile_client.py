@@ -0,0 +1,50 @@
+import json
+import os
+import socket
+import sys
+import tempfile
+from typing import List,Optional,Tuple
+
+# Client of compile_server.py: takes the arguments of main.py, has the
+# server compile and prints the IR, so a build pays for starting this
+# small script rather than for importing the compiler. With no server
+# running it compiles in its own process like main.py.
+#
+# The server's socket is $CLASSIR_SERVER_SOCKET, by default
+# classir-server-<uid>.sock in the temporary directory.
+#
+# python3 compile_client.py -O2 tests/test0/test0.cpp
+
+def socket_path() -> str:
+    if "CLASSIR_SERVER_SOCKET" in os.environ:
+        return os.environ["CLASSIR_SERVER_SOCKET"]
+    return os.path.join(tempfile.gettempdir(), "classir-server-%d.sock" % os.getuid())
+
+# Have the server run main.py with argv, in directory cwd (this
+# process's by default). Returns the exit status, stdout and stderr.
+# Raises OSError when no server listens on path
+def request(argv: List[str], path: Optional[str] = None, cwd: Optional[str] = None) -> Tuple[int,str,str]:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(path if path is not None else socket_path())
+        s.sendall(json.dumps({"argv": argv, "cwd": cwd if cwd is not None else os.getcwd()}).encode() + b"\n")
+        s.shutdown(socket.SHUT_WR)
+        chunks = []
+        while True:
+            chunk = s.recv(1 << 16)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    response = json.loads(b"".join(chunks))
+    return response["status"], response["stdout"], response["stderr"]
+
+if __name__ == "__main__":
+    try:
+        status, out, err = request(sys.argv[1:])
+    except (OSError, ValueError):
+        # no server (or it went away mid request)
+        import main
+        main.main(sys.argv[1:])
+        sys.exit(0)
+    sys.stdout.write(out)
+    sys.stderr.write(err)
+    sys.exit(status)
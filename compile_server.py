@@ -0,0 +1,122 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import traceback
+from typing import List,Optional,Tuple
+from compile_client import socket_path
+import main
+import pass_manager
+
+# Compile server: a long running process listening on a Unix socket
+# that compiles for compile_client.py, so the interpreter start-up,
+# the module imports and the compilation of the scanner's regular
+# expressions are paid once instead of on every compile.
+#
+# A request is one line of JSON, {"argv": [main.py arguments], "cwd":
+# the client's directory}, and the response one line of JSON,
+# {"status": exit status, "stdout": ..., "stderr": ...}.
+#
+# Every request is handled in a child process forked from the server,
+# so requests run concurrently, each with a fresh Scanner, Parser and
+# IRCompiler, and nothing a compile does (changing directory, a crash)
+# reaches the server or the other requests. The server compiles a
+# small program before listening, so the children start with every
+# module imported and the regular expressions compiled.
+#
+# python3 compile_server.py &
+# python3 compile_client.py -O2 tests/test0/test0.cpp
+
+warm_up_source = """
+void warmup(int &a, float &b) {
+    int i;
+    for (i = 0; i < 4; i = i + 1) {
+        if (a < i) { a = a * 2 + i; } else { b = b / 2.0; }
+    }
+}
+"""
+
+class CompileServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    # the server does not wait for running requests to exit
+    block_on_close = False
+
+class CompileHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        try:
+            request = json.loads(self.rfile.readline())
+            status, out, err = run_main(request["argv"], request.get("cwd"))
+        except (ValueError, KeyError, TypeError) as e:
+            status, out, err = 2, "", "bad request: %s\n" % e
+        try:
+            self.wfile.write(json.dumps({"status": status, "stdout": out, "stderr": err}).encode() + b"\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # the client went away
+            pass
+
+# run main.py's main with argv in directory cwd, returns the exit
+# status and what it printed
+def run_main(argv: List[str], cwd: Optional[str]) -> Tuple[int,str,str]:
+    out = io.StringIO()
+    err = io.StringIO()
+    status = 0
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+        try:
+            if cwd is not None:
+                os.chdir(cwd)
+            main.main(argv)
+        except SystemExit as e:
+            # argparse errors and sys.exit(message)
+            if isinstance(e.code, int):
+                status = e.code
+            elif e.code is not None:
+                print(e.code, file=sys.stderr)
+                status = 1
+        except Exception:
+            traceback.print_exc()
+            status = 1
+    return status, out.getvalue(), err.getvalue()
+
+# compile once with every pass in the server so the children inherit
+# the imports and compiled regular expressions
+def warm_up() -> None:
+    main.make_compiler().compile2ir(warm_up_source, list(pass_manager.registry), uf=2)
+
+# remove the socket of a server that is no longer running, error if
+# one still is
+def remove_stale_socket(path: str) -> None:
+    if not os.path.exists(path):
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        try:
+            s.connect(path)
+        except OSError:
+            os.unlink(path)
+            return
+    raise RuntimeError("a compile server is already listening on %s" % path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--socket', type=str, default=socket_path())
+    args = parser.parse_args()
+
+    try:
+        remove_stale_socket(args.socket)
+    except RuntimeError as e:
+        parser.error(str(e))
+    warm_up()
+    server = CompileServer(args.socket, CompileHandler)
+    # kill and Ctrl-C both remove the socket
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print("compile server listening on %s" % args.socket, file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(args.socket)
@@ -0,0 +1,202 @@
+import math
+import struct
+from typing import Dict,List,Optional,Tuple,Union
+from classir import Op, Instruction, load_ops, arithmetic_ops, store_ops, branch_ops, is_literal, int_literal_value, INT2VR, FLOAT2VR, COPY, LABEL
+from cse110A_ast import *
+
+# Constant folding and propagation.
+#
+# Constants are python ints for values in the .i field of a
+# virtual_reg and python floats (rounded to 32 bits) for values in
+# the .f field. An operation is only folded when the C++ code would
+# compute a well defined value: ints stay within 32 bits (no folding
+# of overflow or of division by zero) and floats stay finite.
+Constant = Union[int, float]
+
+INT_MIN = -2**31
+INT_MAX = 2**31 - 1
+
+# round a double to the nearest float, None if it does not fit
+def f32(value: float) -> Optional[float]:
+    try:
+        ret = struct.unpack("f", struct.pack("f", value))[0]
+    except OverflowError:
+        return None
+    if math.isinf(ret) or math.isnan(ret):
+        return None
+    return ret
+
+def c_int(value: int) -> Optional[int]:
+    if INT_MIN <= value <= INT_MAX:
+        return value
+    return None
+
+# C integer division truncates towards zero
+def c_div(a: int, b: int) -> Optional[int]:
+    if b == 0:
+        return None
+    q = abs(a) // abs(b)
+    if (a < 0) != (b < 0):
+        q = -q
+    return c_int(q)
+
+int_operations = {
+    Op.ADDI: lambda a, b: c_int(a + b),
+    Op.SUBI: lambda a, b: c_int(a - b),
+    Op.MULTI: lambda a, b: c_int(a * b),
+    Op.DIVI: c_div,
+    Op.EQI: lambda a, b: int(a == b),
+    Op.LTI: lambda a, b: int(a < b),
+}
+
+# float operations are computed in double precision and then rounded,
+# which gives the correctly rounded float result for + - * /
+float_operations = {
+    Op.ADDF: lambda a, b: f32(a + b),
+    Op.SUBF: lambda a, b: f32(a - b),
+    Op.MULTF: lambda a, b: f32(a * b),
+    Op.DIVF: lambda a, b: f32(a / b) if b != 0 else None,
+    Op.EQF: lambda a, b: int(a == b),
+    Op.LTF: lambda a, b: int(a < b),
+}
+
+# the value of an operation on constants, None if it cannot be folded
+def evaluate(op: Op, args: List[Constant]) -> Optional[Constant]:
+    if op in int_operations:
+        if type(args[0]) is int and type(args[1]) is int:
+            return int_operations[op](args[0], args[1])
+    elif op in float_operations:
+        if type(args[0]) is float and type(args[1]) is float:
+            return float_operations[op](args[0], args[1])
+    elif op == Op.VR_INT2FLOAT:
+        if type(args[0]) is int:
+            return f32(float(args[0]))
+    elif op == Op.VR_FLOAT2INT:
+        if type(args[0]) is float:
+            return c_int(int(args[0]))
+    return None
+
+# the value an int2vr/float2vr of a literal loads (int literals with
+# a leading 0 are octal)
+def literal_value(op: Op, literal: str) -> Optional[Constant]:
+    if op == INT2VR:
+        value = int_literal_value(literal)
+        return c_int(value) if value is not None else None
+    return f32(float(literal))
+
+# A literal for a constant: floats always get a "." (this is how
+# ASTNumNode tells them apart) and are printed with enough digits to
+# give back the same float
+def format_constant(value: Constant) -> str:
+    if type(value) is int:
+        return str(value)
+    ret = repr(value)
+    if "." not in ret:
+        mantissa, _, exponent = ret.partition("e")
+        ret = mantissa + ".0" + ("e" + exponent if exponent else "")
+    return ret
+
+# the instruction loading a constant
+def load(dest: str, value: Constant) -> Instruction:
+    if type(value) is int:
+        return Instruction(INT2VR, dest, (format_constant(value),))
+    return Instruction(FLOAT2VR, dest, (format_constant(value),))
+
+# the value of a number leaf with the given type
+def leaf_value(node: ASTNumNode) -> Optional[Constant]:
+    if node.node_type == Type.INT:
+        return literal_value(INT2VR, node.value)
+    return literal_value(FLOAT2VR, node.value)
+
+# Fold the operations on constants of a typed AST (after
+# type_inference) into number leaves. Returns the new root and how
+# many operations were folded.
+def fold_ast(root: ASTNode) -> Tuple[ASTNode,int]:
+    values = {}     # id of a number leaf -> its value
+    folded = 0
+    replaced = {}   # id of a folded node -> the leaf replacing it
+    for node in postorder(root):
+        if isinstance(node, ASTBinOpNode):
+            node.l_child = replaced.get(id(node.l_child), node.l_child)
+            node.r_child = replaced.get(id(node.r_child), node.r_child)
+        elif isinstance(node, ASTUnOpNode):
+            node.child = replaced.get(id(node.child), node.child)
+
+        if type(node) == ASTNumNode:
+            values[id(node)] = leaf_value(node)
+            continue
+        args = [values.get(id(c)) for c in node.children()]
+        if len(args) == 0 or None in args:
+            continue
+        value = evaluate(node.get_op(), args)
+        if value is None:
+            continue
+        leaf = ASTNumNode(format_constant(value))
+        values[id(leaf)] = value
+        replaced[id(node)] = leaf
+        folded += 1
+    return replaced.get(id(root), root), folded
+
+# Constant propagation over the IR. Within a basic block the values
+# of variables loaded with (or computed from) constants are tracked,
+# and operations on them become loads of the result. A variable
+# defined once in the whole program with a constant (e.g. a program
+# variable only ever assigned a literal) is known in every block.
+# Returns the new program and how many operations were folded.
+def propagate_constants(program: List[Instruction]) -> Tuple[List[Instruction],int]:
+    defs = {}
+    for i in program:
+        if i.dest is not None:
+            defs[i.dest] = defs.get(i.dest, 0) + 1
+
+    # repeat while more single definition constants are found
+    known = {}
+    while True:
+        new_program, folded, constants = propagate_blocks(program, known)
+        found = {n: v for n, v in constants.items() if defs[n] == 1}
+        if len(found) == len(known):
+            return new_program, folded
+        known = found
+
+# one pass of constant propagation given the values of the single
+# definition constants known so far (those are never reassigned, so
+# they hold in every block). Returns the new program, how many
+# operations were folded and every definition found to be constant
+def propagate_blocks(program: List[Instruction], known: Dict[str,Constant]) -> Tuple[List[Instruction],int,Dict[str,Constant]]:
+    new_program = []
+    folded = 0
+    constants = {}
+    env = {}    # constants of the current block
+    for i in program:
+        op = i.op
+        if op is LABEL:
+            env = {}
+        value = None
+        if op in load_ops:
+            if is_literal(i.args[0]):
+                value = literal_value(op, i.args[0])
+        elif op is COPY:
+            value = lookup(env, known, i.args[0])
+        elif op in arithmetic_ops:
+            args = [lookup(env, known, a) for a in i.args]
+            if None not in args:
+                value = evaluate(op, args)
+                if value is not None:
+                    i = load(i.dest, value)
+                    folded += 1
+
+        if i.dest is not None and op not in store_ops:
+            if value is None:
+                env.pop(i.dest, None)
+            else:
+                env[i.dest] = value
+                constants[i.dest] = value
+        new_program.append(i)
+        if op in branch_ops:
+            env = {}
+    return new_program, folded, constants
+
+def lookup(env: Dict[str,Constant], known: Dict[str,Constant], name: str) -> Optional[Constant]:
+    if name in env:
+        return env[name]
+    return known.get(name)
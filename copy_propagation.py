@@ -0,0 +1,193 @@
+from typing import Dict,List,Tuple
+from classir import Instruction, store_ops, branch_ops, COPY, LABEL
+from cfg import CFG
+
+# Copy propagation. Copies come from assignments to program variables
+# (_new_nameN = vrN) and from passes replacing a computation by a copy
+# of a variable holding the value (LVN, strength reduction).
+#
+# Forward: after a copy d = s, reads of d read s instead, for as long
+# as neither d nor s is written again. Within a block this follows
+# the instructions; across blocks a copy is used when it is available
+# on entry, i.e. it reaches the block along every path without d or s
+# being written (a forward dataflow analysis over the control flow
+# graph, intersecting at joins).
+#
+# Copies whose destination is no longer read are removed.
+#
+# Backward: a register computed in a block and only read by a copy
+# into a variable later in that block is computed into the variable
+# directly (vrN = addi(a,b); x = vrN becomes x = addi(a,b)) when x is
+# not read or written in between.
+
+# Returns the new program and how many reads and copies were replaced
+def propagate_copies(program: List[Instruction]) -> Tuple[List[Instruction],int]:
+    program, forwarded = forward_copies(program)
+    program = remove_dead_copies(program)
+    program, coalesced = coalesce_copies(program)
+    return program, forwarded + coalesced
+
+# the copies (dest, source) of a program, each distinct pair once,
+# and for each variable the bitset of the pairs it is part of. Copies
+# of a variable to itself (from x = x) copy nothing
+def copy_pairs(program: List[Instruction]) -> Tuple[List[Tuple[str,str]],Dict[str,int]]:
+    pairs = {}
+    for i in program:
+        if i.op is COPY and i.dest != i.args[0]:
+            pairs.setdefault((i.dest, i.args[0]), len(pairs))
+    members = {}
+    for (d, s), c in pairs.items():
+        members[d] = members.get(d, 0) | 1 << c
+        members[s] = members.get(s, 0) | 1 << c
+    return list(pairs), members
+
+# The copies available on entry to each block as bitsets over the
+# copy pairs: every path from the entry executes the copy and writes
+# neither of its variables afterwards
+def available_copies(cfg: CFG, pairs: List[Tuple[str,str]], members: Dict[str,int]) -> List[int]:
+    index = {p: c for c, p in enumerate(pairs)}
+    gen = []    # copies not followed by a write of their variables
+    kill = []   # copies with a variable written in the block
+    for block in cfg.blocks:
+        g = 0
+        k = 0
+        written = set()
+        for i in reversed(cfg.instructions(block)):
+            if i.dest is None or i.op in store_ops:
+                continue
+            if i.op is COPY and i.dest != i.args[0] and i.dest not in written and i.args[0] not in written:
+                g |= 1 << index[(i.dest, i.args[0])]
+            if i.dest not in written:
+                written.add(i.dest)
+                k |= members.get(i.dest, 0)
+        gen.append(g)
+        kill.append(k)
+
+    order = cfg.reverse_postorder()
+    every = (1 << len(pairs)) - 1
+    avail_in = [0] * len(cfg.blocks)
+    avail_out = [0] * len(cfg.blocks)
+    for b in order[1:]:
+        avail_out[b] = every
+    if order:
+        avail_out[0] = gen[0]
+    changed = True
+    while changed:
+        changed = False
+        for b in order[1:]:
+            new_in = every
+            for p in cfg.blocks[b].preds:
+                new_in &= avail_out[p]
+            avail_in[b] = new_in
+            out = gen[b] | (new_in & ~kill[b])
+            if out != avail_out[b]:
+                avail_out[b] = out
+                changed = True
+    return avail_in
+
+# the variable a read of name reads through the available copies
+def source(copies: Dict[str,str], name: str) -> str:
+    while name in copies:
+        name = copies[name]
+    return name
+
+# rewrite the reads of copied variables to read the copied sources
+def forward_copies(program: List[Instruction]) -> Tuple[List[Instruction],int]:
+    pairs, members = copy_pairs(program)
+    if not pairs:
+        return program, 0
+    cfg = CFG(program)
+    avail_in = available_copies(cfg, pairs, members)
+
+    new_program = []
+    forwarded = 0
+    for block in cfg.blocks:
+        copies = {}     # dest -> source
+        copied = {}     # source -> dests
+        avail = avail_in[block.index]
+        while avail:
+            low = avail & -avail
+            d, s = pairs[low.bit_length() - 1]
+            copies[d] = s
+            copied.setdefault(s, set()).add(d)
+            avail ^= low
+
+        for i in cfg.instructions(block):
+            if copies:
+                names = {}
+                for u in i.uses():
+                    if u in copies:
+                        names[u] = source(copies, u)
+                if names:
+                    forwarded += len(names)
+                    if i.op in branch_ops:
+                        # the target label is not a variable
+                        i = Instruction(i.op, None, tuple([names.get(a, a) for a in i.args[:-1]]) + i.args[-1:])
+                    else:
+                        i = Instruction(i.op, i.dest, tuple([names.get(a, a) for a in i.args]))
+            if i.dest is not None and i.op not in store_ops:
+                # writing a variable ends the copies to and from it
+                if i.dest in copies:
+                    copied[copies.pop(i.dest)].discard(i.dest)
+                for d in copied.pop(i.dest, ()):
+                    del copies[d]
+                if i.op is COPY and i.args[0] != i.dest:
+                    copies[i.dest] = i.args[0]
+                    copied.setdefault(i.args[0], set()).add(i.dest)
+            new_program.append(i)
+    return new_program, forwarded
+
+# remove the copies whose destination is never read (and copies of a
+# variable to itself), until none are left
+def remove_dead_copies(program: List[Instruction]) -> List[Instruction]:
+    while True:
+        read = set()
+        for i in program:
+            read.update(i.uses())
+        new_program = [i for i in program if i.op is not COPY or (i.dest in read and i.dest != i.args[0])]
+        if len(new_program) == len(program):
+            return program
+        program = new_program
+
+# compute registers only copied into a variable into the variable
+def coalesce_copies(program: List[Instruction]) -> Tuple[List[Instruction],int]:
+    defs = {}
+    reads = {}
+    for i in program:
+        if i.dest is not None and i.op not in store_ops:
+            defs[i.dest] = defs.get(i.dest, 0) + 1
+        for u in i.uses():
+            reads[u] = reads.get(u, 0) + 1
+
+    new_program = []
+    coalesced = 0
+    # the positions in new_program of the definitions of registers and
+    # of the last read or write of variables, within the current block.
+    # The instruction defining the register may read the variable
+    defined_at = {}
+    touched = {}
+    for i in program:
+        if i.op is LABEL:
+            defined_at = {}
+            touched = {}
+        if i.op is COPY:
+            v = i.args[0]
+            p = defined_at.get(v)
+            if p is not None and defs[v] == 1 and reads[v] == 1 and touched.get(i.dest, -1) <= p and i.dest != v:
+                d = new_program[p]
+                new_program[p] = Instruction(d.op, i.dest, d.args)
+                touched[i.dest] = p
+                coalesced += 1
+                continue
+
+        k = len(new_program)
+        for u in i.uses():
+            touched[u] = k
+        if i.dest is not None and i.op not in store_ops:
+            touched[i.dest] = k
+            defined_at[i.dest] = k
+        new_program.append(i)
+        if i.op in branch_ops:
+            defined_at = {}
+            touched = {}
+    return new_program, coalesced
@@ -1,5 +1,6 @@
 from enum import Enum
 from typing import Callable,List,Tuple,Optional
+from classir import Op, Instruction, Emitter
 
 # enum for data types in ClassIeR
 class Type(Enum):
@@ -13,6 +14,28 @@ class ASTNode():
         self.node_type = None
         self.vr = None
 
+    def children(self) -> Tuple["ASTNode", ...]:
+        return ()
+
+    # append the three address code of the tree rooted at this node
+    # to the emitter, children first
+    def linearize_code(self, emitter: Emitter) -> None:
+        for node in postorder(self):
+            node.emit_code(emitter)
+
+# The nodes of the tree rooted at root in post order (children left
+# to right, then the node). Trees are walked with an explicit stack
+# rather than recursion as expressions can be nested very deeply.
+def postorder(root: ASTNode) -> List[ASTNode]:
+    ret = []
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        ret.append(node)
+        stack.extend(node.children())
+    ret.reverse()
+    return ret
+
 # AST leaf nodes
 class ASTLeafNode(ASTNode):
     def __init__(self, value: str) -> None:
@@ -23,17 +46,17 @@ class ASTLeafNode(ASTNode):
         ret = f"{level[:-3]}{'|_ '* bool(level)}<{self.value}, {self.node_type}, {self.vr}>\n"
         return ret
 
-    def get_op(self) -> str:
+    def get_op(self) -> Op:
         if self.node_type == Type.INT:
-            return "int2vr"
+            return Op.INT2VR
         else:
-            return "float2vr"
+            return Op.FLOAT2VR
         
-    def three_addr_code(self) -> str:
-        return "%s = %s(%s);" % (self.vr, self.get_op(), self.value)
+    def three_addr_code(self) -> Instruction:
+        return Instruction(self.get_op(), self.vr, (self.value,))
     
-    def linearize_code(self) -> List[str]:
-        return [self.three_addr_code()]
+    def emit_code(self, emitter: Emitter) -> None:
+        emitter.emit(self.three_addr_code())
 
 ######
 # A number leaf node
@@ -65,11 +88,11 @@ class ASTVarIDNode(ASTLeafNode):
         self.node_type = value_type
         self.vr = value
 
-    def three_addr_code(self) -> str:
+    def three_addr_code(self) -> Instruction:
         assert(0)
 
-    def linearize_code(self) -> List[str]:
-        return []
+    def emit_code(self, emitter: Emitter) -> None:
+        pass
     
 ######
 # An IO leaf node
@@ -107,55 +130,58 @@ class ASTBinOpNode(ASTNode):
             ret += child.__str__(level + childIndent)
         return ret
     
-    def three_addr_code(self) -> str:
-        return "%s = %s(%s,%s);" % (self.vr, self.get_op(), self.l_child.vr, self.r_child.vr)
+    def children(self) -> Tuple[ASTNode, ...]:
+        return (self.l_child, self.r_child)
+
+    def three_addr_code(self) -> Instruction:
+        return Instruction(self.get_op(), self.vr, (self.l_child.vr, self.r_child.vr))
     
-    def linearize_code(self) -> List[str]:
-        return self.l_child.linearize_code() + self.r_child.linearize_code() + [self.three_addr_code()]
+    def emit_code(self, emitter: Emitter) -> None:
+        emitter.emit(self.three_addr_code())
 
 
 class ASTPlusNode(ASTBinOpNode):
     def __init__(self, l_child: ASTNode, r_child: ASTNode) -> None:
         super().__init__(l_child,r_child)
 
-    def get_op(self) -> str:
+    def get_op(self) -> Op:
         if self.node_type == Type.INT:
-            return "addi"
+            return Op.ADDI
         else:
-            return "addf"
+            return Op.ADDF
 
 
 class ASTMultNode(ASTBinOpNode):
     def __init__(self, l_child: ASTNode, r_child: ASTNode) -> None:
         super().__init__(l_child,r_child)
 
-    def get_op(self) -> str:
+    def get_op(self) -> Op:
         if self.node_type == Type.INT:
-            return "multi"
+            return Op.MULTI
         else:
-            return "multf"
+            return Op.MULTF
 
 
 class ASTMinusNode(ASTBinOpNode):
     def __init__(self, l_child: ASTNode, r_child: ASTNode) -> None:
         super().__init__(l_child,r_child)
 
-    def get_op(self) -> str:
+    def get_op(self) -> Op:
         if self.node_type == Type.INT:
-            return "subi"
+            return Op.SUBI
         else:
-            return "subf"
+            return Op.SUBF
 
 
 class ASTDivNode(ASTBinOpNode):
     def __init__(self, l_child: ASTNode, r_child: ASTNode) ->None:
         super().__init__(l_child,r_child)
 
-    def get_op(self) -> str:
+    def get_op(self) -> Op:
         if self.node_type == Type.INT:
-            return "divi"
+            return Op.DIVI
         else:
-            return "divf"
+            return Op.DIVF
 
 ######
 # Special BinOp nodes for comparisons
@@ -175,12 +201,12 @@ class ASTEqNode(ASTBinOpNode):
         self.node_type = Type.INT
         super().__init__(l_child,r_child)
 
-    def get_op(self) -> str:
+    def get_op(self) -> Op:
         # Since our type is ALWAYS INT, check type of either child instead.
         if self.l_child.node_type == Type.INT:
-            return "eqi"
+            return Op.EQI
         else:
-            return "eqf"
+            return Op.EQF
 
 
 class ASTLtNode(ASTBinOpNode):
@@ -188,12 +214,12 @@ class ASTLtNode(ASTBinOpNode):
         self.node_type = Type.INT
         super().__init__(l_child,r_child)
 
-    def get_op(self) -> str:
+    def get_op(self) -> Op:
         # Since our type is ALWAYS INT, check type of either child instead.
         if self.l_child.node_type == Type.INT:
-            return "lti"
+            return Op.LTI
         else:
-            return "ltf"
+            return Op.LTF
 
 
 ######
@@ -215,25 +241,28 @@ class ASTUnOpNode(ASTNode):
         ret += self.child.__str__(level + "   ")
         return ret
     
-    def three_addr_code(self) -> str:
-        return "%s = %s(%s);" % (self.vr, self.get_op(), self.child.vr)
+    def children(self) -> Tuple[ASTNode, ...]:
+        return (self.child,)
+
+    def three_addr_code(self) -> Instruction:
+        return Instruction(self.get_op(), self.vr, (self.child.vr,))
     
-    def linearize_code(self) -> List[str]:
-        return self.child.linearize_code() + [self.three_addr_code()]
+    def emit_code(self, emitter: Emitter) -> None:
+        emitter.emit(self.three_addr_code())
 
         
 class ASTIntToFloatNode(ASTUnOpNode):
     def __init__(self, child: ASTNode) -> None:
         super().__init__(child)
 
-    def get_op(self) -> str:
-        return "vr_int2float"
+    def get_op(self) -> Op:
+        return Op.VR_INT2FLOAT
 
 
 class ASTFloatToIntNode(ASTUnOpNode):
     def __init__(self, child: ASTNode) -> None:
         super().__init__(child)
 
-    def get_op(self) -> str:
-        return "vr_float2int"
+    def get_op(self) -> Op:
+        return Op.VR_FLOAT2INT
 
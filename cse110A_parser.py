@@ -1,6 +1,8 @@
 from cse110A_ast import *
-from typing import Callable,List,Tuple,Optional
-from scanner import Lexeme,Token,Scanner
+from typing import Callable,Dict,Generator,Iterator,List,Tuple,Optional
+from classir import Op, Instruction, Emitter, label, branch, beq, copy, int_literal_value
+from scanner import Lexeme,Token,Scanner,TokenTape,token_kinds,token_kind_index
+from constant_folding import fold_ast, INT_MIN, INT_MAX
 
 # Extra classes:
 
@@ -38,6 +40,12 @@ class SymbolTableException(Exception):
     def __init__(self, lineno: int, ID: str) -> None:
         message = "Symbol table error on line: " + str(lineno) + "\nUndeclared ID: " + str(ID)
         super().__init__(message)
+        self.init_args = (lineno, ID)
+
+    # rebuilt from the constructor arguments, so the error of a
+    # function compiled in a worker process reaches the caller
+    def __reduce__(self) -> tuple:
+        return (SymbolTableException, self.init_args)
 
 # Generates a new label when needed
 class NewLabelGenerator():
@@ -73,11 +81,15 @@ class VRAllocator():
         self.counter += 1
         return vr
 
+    # the virtual registers allocated so far
+    def names(self) -> List[str]:
+        return ["vr%d" % i for i in range(self.counter)]
+
     # get variable declarations (needed for the C++ wrapper)
     def declare_variables(self) -> List[str]:
         ret = []
-        for i in range(self.counter):
-            ret.append("virtual_reg vr%d;" % i)
+        for name in self.names():
+            ret.append("virtual_reg %s;" % name)
 
         return ret
 
@@ -116,9 +128,52 @@ class SymbolTable:
 class ParserException(Exception):
     
     # Pass a line number, current lexeme, and what tokens are expected
-    def __init__(self, lineno: int, lexeme: Lexeme, tokens: List[Token]) -> None:
-        message = "Parser error on line: " + str(lineno) + "\nExpected one of: " + str(tokens) + "\nGot: " + str(lexeme)
+    # (or, for an error that is not a missing token, what is wrong)
+    def __init__(self, lineno: int, lexeme: Lexeme, tokens: List[Token], reason: Optional[str] = None) -> None:
+        if reason is None:
+            reason = "Expected one of: " + str(tokens)
+        message = "Parser error on line: " + str(lineno) + "\n" + reason + "\nGot: " + str(lexeme)
         super().__init__(message)
+        self.init_args = (lineno, lexeme, tokens, reason)
+
+    # see SymbolTableException
+    def __reduce__(self) -> tuple:
+        return (ParserException, self.init_args)
+
+# Parse tables
+
+# FIRST set of a statement, and the tokens an error reports
+statement_first = frozenset([Token.INT, Token.FLOAT, Token.ID, Token.IF, Token.LBRACE, Token.FOR])
+statement_expected = [Token.FOR, Token.IF, Token.LBRACE, Token.INT, Token.FLOAT, Token.ID]
+
+# the tokens that can start a unit, and the tokens that can follow
+# one (the FOLLOW set of term2 in the expression grammar)
+unit_expected = [Token.NUM, Token.ID, Token.LPAR]
+unit_follow_expected = [Token.EQ, Token.SEMI, Token.RPAR, Token.LT, Token.PLUS, Token.MINUS, Token.MUL, Token.DIV]
+
+# a table indexed by the token kind numbers used on the token tape
+def kind_table(entries: Dict[Token, object]) -> list:
+    table = [None] * len(token_kinds)
+    for t, v in entries.items():
+        table[token_kind_index[t]] = v
+    return table
+
+# binary operators: precedence (higher binds tighter) and AST node.
+# All of them are left associative.
+binary_operators = kind_table({
+    Token.EQ:    (1, ASTEqNode),
+    Token.LT:    (2, ASTLtNode),
+    Token.PLUS:  (3, ASTPlusNode),
+    Token.MINUS: (3, ASTMinusNode),
+    Token.MUL:   (4, ASTMultNode),
+    Token.DIV:   (4, ASTDivNode),
+})
+
+NUM_KIND = token_kind_index[Token.NUM]
+ID_KIND = token_kind_index[Token.ID]
+LPAR_KIND = token_kind_index[Token.LPAR]
+RPAR_KIND = token_kind_index[Token.RPAR]
+SEMI_KIND = token_kind_index[Token.SEMI]
 
 # Parser class
 class Parser:
@@ -141,68 +196,102 @@ class Parser:
         self.function_args = []
 
     # Do post order traversal of node and allocate vrs to every node in the tree
-    def allocate_vrs(self, node:ASTNode) -> None:
-        if is_leaf_node(node) and node.vr == None:
-            node.vr = self.vra.mk_new_vr()
-        elif is_binop_node(node):
-            self.allocate_vrs(node.l_child)
-            self.allocate_vrs(node.r_child)
+    def allocate_vrs(self, root:ASTNode) -> None:
+        for node in postorder(root):
+            if is_leaf_node(node):
+                if node.vr == None:
+                    node.vr = self.vra.mk_new_vr()
+            else:
+                node.vr = self.vra.mk_new_vr()
 
-            node.vr = self.vra.mk_new_vr()
-        elif is_unop_node(node):
-            self.allocate_vrs(node.child)
 
-            node.vr = self.vra.mk_new_vr()
+    # uf: the loop unroll factor, cf: fold constant expressions
+    def parse(self, s: str, uf: int, cf: bool = False) -> List[Instruction]:
 
+        # Set the scanner input and parse it
+        self.scanner.input_string(s)
+        return self.parse_input(uf, cf)
 
-    def parse(self, s: str, uf: int) -> List[str]:
+    # Parse whatever input the scanner has been given
+    def parse_input(self, uf: int, cf: bool = False) -> List[Instruction]:
 
-        # Set the scanner and get the first token
-        self.scanner.input_string(s)
-        self.to_match = self.scanner.token()
+        # tokenize the whole input onto a token tape, the
+        # parser reads tokens from it by index
+        return self.parse_tape(self.scanner.tokenize(), uf, cf)
+
+    # Parse the function on a token tape (e.g. one of
+    # Scanner.tokenize_functions)
+    def parse_tape(self, tape: TokenTape, uf: int, cf: bool = False) -> List[Instruction]:
 
-        # start parsing. In your solution, p must contain a list of
-        # three address instructions
-        p = self.parse_function()
+        # loop unroll factor for for loops, and how many for loops
+        # have been parsed (see parse_for_statement)
+        self.uf = uf
+        self.for_loops = 0
+
+        # constant folding of expression ASTs, and how many
+        # operations it folded
+        self.cf = cf
+        self.folded = 0
+
+        self.tape = tape
+        self.index = 0
+
+        # every parse routine appends its three address
+        # instructions to the emitter
+        self.emitter = Emitter()
+
+        # start parsing
+        self.parse_function()
         self.eat(None)
         
-        return p
+        return self.emitter.code
+
+    # The current token as a Lexeme. It is only built when needed,
+    # e.g. for a ParserException
+    @property
+    def to_match(self) -> Optional[Lexeme]:
+        return self.tape.lexeme(self.index)
 
-    # Helper fuction: get the token ID
-    def get_token_id(self, l: Lexeme) ->Token:
-        if l is None:
-            return None
-        return l.token
+    # Helper fuction: get the token ID of the current token
+    def get_token_id(self) -> Optional[Token]:
+        return self.tape.token(self.index)
+
+    # Helper fuction: get the text of the current token
+    def get_token_value(self) -> str:
+        return self.tape.value(self.index)
+
+    # Helper fuction: get the line number of the current token
+    def get_lineno(self) -> int:
+        return self.tape.lineno(self.index)
 
     # Helper fuction: eat a token ID and advance
     # to the next token
     def eat(self, check: Token) -> None:
-        token_id = self.get_token_id(self.to_match)
+        token_id = self.get_token_id()
         if token_id != check:
-            raise ParserException(self.scanner.get_lineno(),
+            raise ParserException(self.get_lineno(),
                                   self.to_match,
                                   [check])      
-        self.to_match = self.scanner.token()
+        self.index += 1
 
     # The top level parse_function
-    def parse_function(self) -> List[str]:
+    def parse_function(self) -> None:
 
         # I am parsing the function header for you
         # You do not need to do anything with this.
         self.parse_function_header()    
         self.eat(Token.LBRACE)
 
-        # your solution should have p containing a list
-        # of three address instructions
-        p = self.parse_statement_list()        
+        # the three address instructions of the function
+        # body are appended to the emitter
+        self.run(self.parse_statement_list())
         self.eat(Token.RBRACE)
-        return p
 
     # You do not need to modify this for your homework
     # but you can look :) 
     def parse_function_header(self) -> None:
         self.eat(Token.VOID)
-        function_name = self.to_match.value
+        function_name = self.get_token_value()
         self.eat(Token.ID)        
         self.eat(Token.LPAR)
         self.function_name = function_name
@@ -212,22 +301,25 @@ class Parser:
 
     # You do not need to modify this for your homework
     # but you can look :) 
+    # (the arguments are returned last to first)
     def parse_arg_list(self) -> List[Tuple[str, str]]:
-        token_id = self.get_token_id(self.to_match)
+        args = []
+        token_id = self.get_token_id()
         if token_id == Token.RPAR:
-            return
-        arg = self.parse_arg()
-        token_id = self.get_token_id(self.to_match)
-        if token_id == Token.RPAR:
-            return [arg]
-        self.eat(Token.COMMA)
-        arg_l = self.parse_arg_list()
-        return arg_l + [arg]
+            return args
+        while True:
+            args.append(self.parse_arg())
+            token_id = self.get_token_id()
+            if token_id == Token.RPAR:
+                break
+            self.eat(Token.COMMA)
+        args.reverse()
+        return args
 
     # You do not need to modify this for your homework
     # but you can look :) 
     def parse_arg(self) -> Tuple[str, str]:
-        token_id = self.get_token_id(self.to_match)
+        token_id = self.get_token_id()
         if token_id == Token.FLOAT:
             self.eat(Token.FLOAT)
             data_type = Type.FLOAT
@@ -237,37 +329,51 @@ class Parser:
             data_type = Type.INT
             data_type_str = "int"
         else:
-            raise ParserException(self.scanner.get_lineno(),
+            raise ParserException(self.get_lineno(),
                               self.to_match,            
                               [Token.INT, Token.FLOAT])
         self.eat(Token.AMP)
 	# change strings and indexing token.names .value .token
-        id_name = self.to_match.value
+        id_name = self.get_token_value()
         self.eat(Token.ID)
 
         # storing an IO variable to the symbol table
         self.symbol_table.insert(id_name, IDType.IO, data_type)
         return (id_name, data_type_str)
         
-    # The top level parsing function for your homework
-    # This function needs to return a list of three address codes
-    def parse_statement_list(self) -> List[str]:    
-        token_id = self.get_token_id(self.to_match)
-        if token_id in [Token.INT, Token.FLOAT, Token.ID, Token.IF, Token.LBRACE, Token.FOR]:
-            a = self.parse_statement()
-            b = self.parse_statement_list()
-            return a + b
-        if token_id in [Token.RBRACE]:
-            return []
+    # Statements are parsed without recursion. Parsing a compound
+    # statement (a block, if/else or for) is a generator that yields
+    # a generator for each nested statement list or statement it
+    # needs parsed, and is resumed once that one has been parsed.
+    # Simple statements are parsed directly, parse_statement returns
+    # None for them. run() keeps the generators being parsed on an
+    # explicit stack, so statements can be nested arbitrarily deeply.
+    def run(self, parser: Generator) -> None:
+        stack = [parser]
+        while stack:
+            try:
+                nested = next(stack[-1])
+            except StopIteration:
+                stack.pop()
+                continue
+            if nested is not None:
+                stack.append(nested)
+
+    # The top level parsing function for your homework. The
+    # statements are parsed in a loop, each one appends its three
+    # address instructions to the emitter
+    def parse_statement_list(self) -> Generator:
+        while self.get_token_id() in statement_first:
+            yield self.parse_statement()
         
-    # you need to return a list of three address instructions
-    # from the statement that gets parsed
-    def parse_statement(self) -> List[str]:
-        token_id = self.get_token_id(self.to_match)
+    # parse a simple statement, or return the generator parsing a
+    # compound statement (see run)
+    def parse_statement(self) -> Optional[Generator]:
+        token_id = self.get_token_id()
         if token_id in [Token.INT, Token.FLOAT]:
-            return self.parse_declaration_statement()
+            self.parse_declaration_statement()
         elif token_id in [Token.ID]:
-            return self.parse_assignment_statement()
+            self.parse_assignment_statement()
         elif token_id in [Token.IF]:
             return self.parse_if_else_statement()
         elif token_id in [Token.LBRACE]:
@@ -275,26 +381,27 @@ class Parser:
         elif token_id in [Token.FOR]:
             return self.parse_for_statement()
         else:
-            raise ParserException(self.scanner.get_lineno(),
+            raise ParserException(self.get_lineno(),
                               self.to_match,            
-                              [Token.FOR, Token.IF, Token.LBRACE, Token.INT, Token.FLOAT, Token.ID])
+                              statement_expected)
+        return None
 
-    # you need to return a list of three address instructions
-    def parse_declaration_statement(self) -> List[str]:
-        token_id = self.get_token_id(self.to_match)
+    # declarations do not emit any instructions
+    def parse_declaration_statement(self) -> None:
+        token_id = self.get_token_id()
         if token_id in [Token.INT]:
             self.eat(Token.INT)
-            id_name = self.to_match.value
+            id_name = self.get_token_value()
             # Think about what you want to insert into the symbol table
             # self.symbol_table.insert(...)
             self.eat(Token.ID)
             self.eat(Token.SEMI)
             data_type = Type.INT
             self.symbol_table.insert(id_name, IDType.VAR, data_type, self.nng)
-            return []
+            return
         if token_id in [Token.FLOAT]:
             self.eat(Token.FLOAT)
-            id_name = self.to_match.value
+            id_name = self.get_token_value()
             # Think about what you want to insert into the symbol table
             # self.symbol_table.insert(...)
             self.eat(Token.ID)
@@ -302,24 +409,27 @@ class Parser:
             data_type = Type.FLOAT
             self.symbol_table.insert(id_name, IDType.VAR, data_type, self.nng)
             self.eat(Token.SEMI)
-            return []
+            return
         
-        raise ParserException(self.scanner.get_lineno(),
+        raise ParserException(self.get_lineno(),
                               self.to_match,            
                               [Token.INT, Token.FLOAT])
 
-    # you need to return a list of three address instructions
-    def parse_assignment_statement(self) -> List[str]:
-        i = self.parse_assignment_statement_base()
+    def parse_assignment_statement(self) -> None:
+        self.parse_assignment_statement_base()
         self.eat(Token.SEMI)
-        return i;
 
-    # you need to return a list of three address instructions
-    def parse_assignment_statement_base(self) -> List[str]:
-        id_name = self.to_match.value
+    def parse_assignment_statement_base(self) -> None:
+        id_name, id_data, expr_ast = self.parse_assignment_ast()
+        self.emit_assignment(id_name, id_data, expr_ast)
+
+    # parse an assignment and return the assigned ID, its symbol
+    # table data and the typed AST of the assigned expression
+    def parse_assignment_ast(self) -> Tuple[str, SymbolTableData, ASTNode]:
+        id_name = self.get_token_value()
         id_data = self.symbol_table.lookup(id_name)
         if id_data == None:
-            raise SymbolTableException(self.scanner.get_lineno(), id_name)
+            raise SymbolTableException(self.get_lineno(), id_name)
         self.eat(Token.ID)
         self.eat(Token.ASSIGN)
         expr_ast = self.parse_expr()
@@ -332,209 +442,342 @@ class Parser:
             new_root = ASTIntToFloatNode(expr_ast)
             new_root.node_type = Type.FLOAT
             expr_ast = new_root
-
+        return id_name, id_data, self.fold_constants(expr_ast)
+
+    # constant folding of a typed expression AST (if enabled)
+    def fold_constants(self, expr_ast: ASTNode) -> ASTNode:
+        if not self.cf:
+            return expr_ast
+        expr_ast, folded = fold_ast(expr_ast)
+        self.folded += folded
+        return expr_ast
+
+    # emit the three address instructions for an assignment
+    def emit_assignment(self, id_name: str, id_data: SymbolTableData, expr_ast: ASTNode) -> None:
         self.allocate_vrs(expr_ast)
-        program = expr_ast.linearize_code()
+        expr_ast.linearize_code(self.emitter)
 
         if id_data.id_type == IDType.IO:
             if id_data.data_type == Type.INT:
-                assignment_instruction = ["%s = vr2int(%s);" % (id_name, expr_ast.vr)]
+                self.emitter.emit(Instruction(Op.VR2INT, id_name, (expr_ast.vr,)))
             else:
-                assignment_instruction = ["%s = vr2float(%s);" % (id_name, expr_ast.vr)]
+                self.emitter.emit(Instruction(Op.VR2FLOAT, id_name, (expr_ast.vr,)))
         else:
-            assignment_instruction = ["%s = %s;" % (id_data.new_name, expr_ast.vr)]
-        return program + assignment_instruction
+            self.emitter.emit(copy(id_data.new_name, expr_ast.vr))
 
-    # you need to return a list of three address instructions
-    def parse_if_else_statement(self) -> List[str]:
-        self.eat(Token.IF)
-        self.eat(Token.LPAR)
+    # parse an expression and emit the instructions computing it,
+    # returns the expression AST (its vr holds the result)
+    def emit_expr(self) -> ASTNode:
         expr_ast = self.parse_expr()
         type_inference(expr_ast)
+        expr_ast = self.fold_constants(expr_ast)
         self.allocate_vrs(expr_ast)
-        expr_program = expr_ast.linearize_code()
-
-        else_label = self.nlg.mk_new_label()
-        end_label = self.nlg.mk_new_label()
+        expr_ast.linearize_code(self.emitter)
+        return expr_ast
 
+    # emit a branch to label if the value in vr is 0 (false)
+    def emit_branch_if_false(self, vr: str, label_name: str) -> None:
         zero_vr = self.vra.mk_new_vr() # VrX in the slides
+        self.emitter.emit(Instruction(Op.INT2VR, zero_vr, ("0",)))
+        self.emitter.emit(beq(vr, zero_vr, label_name))
 
-        compare_ins = ["%s = int2vr(0);" % (zero_vr), "beq(%s, %s, %s);" % (expr_ast.vr, zero_vr, else_label)]
-        branch_ins = ["branch(%s);" % (end_label)]
+    def parse_if_else_statement(self) -> Generator:
+        self.eat(Token.IF)
+        self.eat(Token.LPAR)
+        expr_ast = self.emit_expr()
 
+        else_label = self.nlg.mk_new_label()
+        end_label = self.nlg.mk_new_label()
+        self.emit_branch_if_false(expr_ast.vr, else_label)
 
         self.eat(Token.RPAR)
-        if_program = self.parse_statement()
+        yield self.parse_statement()
+        self.emitter.emit(branch(end_label))
         self.eat(Token.ELSE)
-        else_program = self.parse_statement()
-        return expr_program + compare_ins + if_program + branch_ins + ["%s:" % (else_label)] + else_program + ["%s:" % (end_label)]
+        self.emitter.emit(label(else_label))
+        yield self.parse_statement()
+        self.emitter.emit(label(end_label))
     
-    # you need to return a list of three address instructions
-    def parse_block_statement(self) -> List[str]:
+    def parse_block_statement(self) -> Generator:
         self.eat(Token.LBRACE)
         self.symbol_table.push_scope()
-        ret = self.parse_statement_list()
+        yield self.parse_statement_list()
         self.symbol_table.pop_scope()
         self.eat(Token.RBRACE)
-        return ret
 
-    # you need to return a list of three address instructions
-    def parse_for_statement(self) -> List[str]:
+    # The loop is emitted as:
+    #   init; start: cond; beq(cond, 0, end); body; update; branch(start); end:
+    # The update statement is parsed before the body, its AST is
+    # kept and only emitted once the body has been emitted.
+    #
+    # Only innermost loops (no for loop in the body) are unrolled:
+    # unrolling a loop copies the already unrolled loops in its body
+    # again, so a nest of depth d would grow as uf^d.
+    def parse_for_statement(self) -> Generator:
         self.eat(Token.FOR)
+        self.for_loops += 1
+        for_loops = self.for_loops
         self.eat(Token.LPAR)
-        original_assignment_program = self.parse_assignment_statement()
-        expr_ast = self.parse_expr()
-        type_inference(expr_ast)
-        self.allocate_vrs(expr_ast)
-        expr_program = expr_ast.linearize_code() 
+        self.parse_assignment_statement()
 
-        self.eat(Token.SEMI)
-        loop_end_assignment_program = self.parse_assignment_statement_base()
-        self.eat(Token.RPAR)
-        loop_program = self.parse_statement()
-        
         loop_start_label = self.nlg.mk_new_label()
         end_label = self.nlg.mk_new_label()
-        zero_vr = self.vra.mk_new_vr()
-
-        compare_ins = ["%s = int2vr(0);" % (zero_vr), "beq(%s, %s, %s);" % (expr_ast.vr, zero_vr, end_label)]  # Branch out if expression == 0
-        branch_ins = ["branch(%s);" % (loop_start_label)]  # Instruction to branch back to the start of the loop (right before evaluating the expression again)
-
-        return original_assignment_program + ["%s:" % (loop_start_label)] + expr_program + compare_ins + loop_program + loop_end_assignment_program + branch_ins + ["%s:" % (end_label)]
-
-    # you need to build and return an AST
-    def parse_expr(self) -> ASTNode:
-        node = self.parse_comp()
-        ret = self.parse_expr2(node)
-        return ret
+        loop_start = self.emitter.position()
+        self.emitter.emit(label(loop_start_label))
+        expr_ast = self.emit_expr()
+        self.emit_branch_if_false(expr_ast.vr, end_label)  # Branch out if expression == 0
 
-    # you need to build and return an AST
-    def parse_expr2(self, lhs_node: ASTNode) -> ASTNode:
-        token_id = self.get_token_id(self.to_match)
-        if token_id in [Token.EQ]:
-            self.eat(Token.EQ)
-            rhs_node = self.parse_comp()
-            n = ASTEqNode(lhs_node, rhs_node)
-            return self.parse_expr2(n)
-        
-        if token_id in [Token.SEMI, Token.RPAR]:
-            return lhs_node
-        
-        raise ParserException(self.scanner.get_lineno(),
-                              self.to_match,            
-                              [Token.EQ, Token.SEMI, Token.RPAR])
-    
-    # you need to build and return an AST
-    def parse_comp(self) -> ASTNode:
-        node = self.parse_factor()
-        ret = self.parse_comp2(node)
-        return ret
+        self.eat(Token.SEMI)
+        update = self.parse_assignment_ast()
+        self.eat(Token.RPAR)
+        body_start = self.emitter.position()
+        yield self.parse_statement()
+        self.emit_assignment(*update)
 
-    # you need to build and return an AST
-    def parse_comp2(self, lhs_node: ASTNode) -> ASTNode:
-        token_id = self.get_token_id(self.to_match)
-        if token_id in [Token.LT]:
-            self.eat(Token.LT)
-            rhs_node = self.parse_factor()
-            ret = ASTLtNode(lhs_node, rhs_node)
-            return self.parse_comp2(ret)
-        if token_id in [Token.SEMI, Token.RPAR, Token.EQ]:
-            return lhs_node
-        
-        raise ParserException(self.scanner.get_lineno(),
-                              self.to_match,            
-                              [Token.EQ, Token.SEMI, Token.RPAR, Token.LT])
+        if self.uf > 1 and self.for_loops == for_loops:
+            self.unroll_loop(loop_start, body_start, expr_ast, update)
+            return
 
-    # you need to build and return an AST
-    def parse_factor(self) -> ASTNode:
-        node = self.parse_term()
-        ret = self.parse_factor2(node)
-        return ret
+        # Instruction to branch back to the start of the loop (right before evaluating the expression again)
+        self.emitter.emit(branch(loop_start_label))
+        self.emitter.emit(label(end_label))
+
+    # Unroll the for loop emitted from position loop_start by the
+    # unroll factor (self.uf). The emitted loop is cut out of the
+    # emitter and emitted again unrolled.
+    #
+    # For counted loops (see counted_loop) the loop test runs once per
+    # group of uf iterations: the group runs while the induction
+    # variable is at least uf - 1 steps away from the bound, and a
+    # remainder loop runs the last iterations one at a time. Other
+    # loops keep their test in front of every copy of the body and
+    # only save the back branches.
+    #
+    # The group test is iv < bound - (uf - 1) * step rather than
+    # iv + (uf - 1) * step < bound, which wraps around near INT_MAX.
+    # The subtraction is folded for a constant bound (the loop is
+    # unrolled as uncounted if it would go below INT_MIN); for a
+    # variable bound a guard in front of the group loop sends a bound
+    # below INT_MIN + (uf - 1) * step to the remainder loop.
+    def unroll_loop(self, loop_start: int, body_start: int, expr_ast: ASTNode, update: Tuple[str, SymbolTableData, ASTNode]) -> None:
+        loop = self.emitter.extract(loop_start)
+        start_label = loop[0].args[0]
+        test_program = loop[1:]
+        body_program = loop[body_start - loop_start:]
+        counted = counted_loop(expr_ast, update, body_program)
+        emitter = self.emitter
+
+        if counted is not None:
+            iv, step, bound = counted
+            distance = (self.uf - 1) * step
+            if distance > INT_MAX:
+                counted = None
+            elif type(bound) == ASTNumNode:
+                value = int_literal_value(bound.value)
+                if value is None or value - distance < INT_MIN:
+                    counted = None
+                else:
+                    group_bound_ast = ASTNumNode(str(value - distance))
+            else:
+                group_bound_ast = ASTMinusNode(copy_leaf(bound), ASTNumNode(str(distance)))
+
+        if counted is None:
+            end_label = test_program[body_start - loop_start - 2].target()
+            emitter.emit(label(start_label))
+            emitter.extend(test_program)
+            for _ in range(self.uf - 1):
+                emitter.extend(self.rename_copy(test_program))
+            emitter.emit(branch(start_label))
+            emitter.emit(label(end_label))
+            return
 
-    # you need to build and return an AST
-    def parse_factor2(self, lhs_node:ASTNode) -> ASTNode:
-        token_id = self.get_token_id(self.to_match)
-        if token_id in [Token.PLUS]:
-            self.eat(Token.PLUS)
-            rhs_node = self.parse_term()
-            ret = ASTPlusNode(lhs_node, rhs_node)    
-            ret = self.parse_factor2(ret)
-            return ret
-        if token_id in [Token.MINUS]:
-            self.eat(Token.MINUS)
-            rhs_node = self.parse_term()
-            ret = ASTMinusNode(lhs_node, rhs_node)    
-            ret = self.parse_factor2(ret)
-            return ret
-        if token_id in [Token.EQ, Token.SEMI, Token.RPAR, Token.LT]:
-            return lhs_node
-
-        raise ParserException(self.scanner.get_lineno(),
-                              self.to_match,            
-                              [Token.EQ, Token.SEMI, Token.RPAR, Token.LT, Token.PLUS, Token.MINUS])
-    
-    # you need to build and return an AST
-    def parse_term(self) -> ASTNode:
-        node = self.parse_unit()
-        ret = self.parse_term2(node)
-        return ret
+        remainder_label = self.nlg.mk_new_label()
+        if type(bound) != ASTNumNode:
+            # INT_MIN + distance - 1 < bound
+            self.emit_test(ASTLtNode(ASTNumNode(str(INT_MIN + distance - 1)), copy_leaf(bound)), remainder_label)
+        emitter.emit(label(start_label))
+        self.emit_test(ASTLtNode(ASTVarIDNode(iv, Type.INT), group_bound_ast), remainder_label)
+
+        emitter.extend(body_program)
+        for _ in range(self.uf - 1):
+            emitter.extend(self.rename_copy(body_program))
+        emitter.emit(branch(start_label))
+
+        # the remainder loop runs the original test
+        remainder_test = test_program[:body_start - loop_start - 1]
+        end_label = remainder_test[-1].target()
+        emitter.emit(label(remainder_label))
+        emitter.extend(remainder_test)
+        emitter.extend(self.rename_copy(body_program))
+        emitter.emit(branch(remainder_label))
+        emitter.emit(label(end_label))
+
+    # emit a test built by the parser and branch to label_name if it
+    # is false
+    def emit_test(self, test_ast: ASTNode, label_name: str) -> None:
+        type_inference(test_ast)
+        self.allocate_vrs(test_ast)
+        test_ast.linearize_code(self.emitter)
+        self.emit_branch_if_false(test_ast.vr, label_name)
+
+    # Copy a list of instructions, giving the virtual registers and
+    # labels it defines new names so that the copy can be placed in
+    # the same function
+    def rename_copy(self, program: List[Instruction]) -> List[Instruction]:
+        names = {}
+        for i in program:
+            if i.op == Op.LABEL:
+                names[i.args[0]] = self.nlg.mk_new_label()
+            elif is_vr(i.dest) and i.dest not in names:
+                names[i.dest] = self.vra.mk_new_vr()
+        return [i.rename(names) for i in program]
+
+    # Parse an expression and return its AST. Operator precedence
+    # parsing with explicit operand and operator stacks (instead of
+    # one recursive call per grammar rule) builds the same AST as the
+    # grammar:
+    #
+    #   expr   := comp (EQ comp)*
+    #   comp   := factor (LT factor)*
+    #   factor := term ((PLUS | MINUS) term)*
+    #   term   := unit ((MUL | DIV) unit)*
+    #   unit   := NUM | ID | LPAR expr RPAR
+    #
+    # The expression ends at a SEMI or RPAR outside of parentheses,
+    # which is left for the caller to eat.
+    def parse_expr(self) -> ASTNode:
+        kinds = self.tape.kinds
+        n = len(kinds)
+        operands = []
+        operators = []   # (precedence, AST node class), None for a LPAR
+        depth = 0        # number of open parentheses
+        while True:
+            # expecting a unit
+            kind = kinds[self.index] if self.index < n else None
+            while kind == LPAR_KIND:
+                operators.append(None)
+                depth += 1
+                self.index += 1
+                kind = kinds[self.index] if self.index < n else None
+            if kind == NUM_KIND:
+                operands.append(ASTNumNode(self.get_token_value()))
+            elif kind == ID_KIND:
+                operands.append(self.parse_id_unit())
+            else:
+                raise ParserException(self.get_lineno(),
+                                      self.to_match,            
+                                      unit_expected)
+            self.index += 1
+
+            # after a unit: a binary operator, closing parentheses
+            # or the end of the expression
+            while True:
+                kind = kinds[self.index] if self.index < n else None
+                operator = binary_operators[kind] if kind is not None else None
+                if operator is not None:
+                    precedence = operator[0]
+                    while operators and operators[-1] is not None and operators[-1][0] >= precedence:
+                        reduce_operator(operators, operands)
+                    operators.append(operator)
+                    self.index += 1
+                    break
+                if kind == RPAR_KIND and depth > 0:
+                    while operators[-1] is not None:
+                        reduce_operator(operators, operands)
+                    operators.pop()
+                    depth -= 1
+                    self.index += 1
+                    continue
+                if kind == SEMI_KIND and depth > 0:
+                    raise ParserException(self.get_lineno(),
+                                          self.to_match,
+                                          [Token.RPAR])
+                if kind == SEMI_KIND or kind == RPAR_KIND:
+                    while operators:
+                        reduce_operator(operators, operands)
+                    return operands[0]
+                raise ParserException(self.get_lineno(),
+                                      self.to_match,            
+                                      unit_follow_expected)
+
+    # the AST leaf for the ID at the current token
+    def parse_id_unit(self) -> ASTLeafNode:
+        id_name = self.get_token_value()
+        id_data = self.symbol_table.lookup(id_name)
+        if id_data == None:
+            raise SymbolTableException(self.get_lineno(), id_name)
+
+        if (id_data.id_type == IDType.IO):
+            return ASTIOIDNode(id_name, id_data.data_type)
+        # For Program Variable
+        return ASTVarIDNode(id_data.new_name, id_data.data_type)
+
+# The function tapes of a translation unit (see
+# Scanner.tokenize_functions) as they are scanned. A function name
+# defined twice is an error on the line of the second definition.
+def distinct_functions(tapes: Iterator[TokenTape]) -> Iterator[TokenTape]:
+    defined = {}    # function name -> line of its definition
+    for tape in tapes:
+        # the header is: void name (
+        if len(tape) > 1 and tape.kinds[1] == ID_KIND:
+            name = tape.value(1)
+            lineno = tape.lineno(1)
+            if name in defined:
+                raise ParserException(lineno, tape.lexeme(1), [],
+                                      "Function %s already defined on line: %d" % (name, defined[name]))
+            defined[name] = lineno
+        yield tape
+
+# Pop the top operator and its two operands and push the AST node
+# applying it
+def reduce_operator(operators: list, operands: List[ASTNode]) -> None:
+    node_class = operators.pop()[1]
+    r_child = operands.pop()
+    l_child = operands.pop()
+    operands.append(node_class(l_child, r_child))
+
+# Is a name a virtual register made by the VRAllocator?
+def is_vr(name: Optional[str]) -> bool:
+    return name is not None and name.startswith("vr") and name[2:].isdigit()
+
+# Is the loop `for (...; iv < bound; iv = iv + step)` with an int
+# induction variable iv, a positive constant step, and a bound that
+# is a constant or a variable the loop never assigns, with no other
+# assignment to iv in the loop? If so return (iv, step, bound)
+def counted_loop(expr_ast: ASTNode, update: Tuple[str, SymbolTableData, ASTNode], body_program: List[Instruction]) -> Optional[Tuple[str, int, ASTLeafNode]]:
+    if type(expr_ast) != ASTLtNode:
+        return None
+    iv = expr_ast.l_child
+    bound = expr_ast.r_child
+    if type(iv) != ASTVarIDNode or iv.node_type != Type.INT:
+        return None
+    if type(bound) not in [ASTNumNode, ASTVarIDNode, ASTIOIDNode] or bound.node_type != Type.INT:
+        return None
 
-    # you need to build and return an AST
-    def parse_term2(self, lhs_node:ASTNode) -> ASTNode:
-        token_id = self.get_token_id(self.to_match)
-        if token_id in [Token.DIV]:
-            self.eat(Token.DIV)
-            rhs_node = self.parse_unit()
-            ret = ASTDivNode(lhs_node, rhs_node)
-            ret = self.parse_term2(ret)
-            return ret
-        
-        if token_id in [Token.MUL]:            
-            self.eat(Token.MUL)
-            rhs_node = self.parse_unit()
-            ret = ASTMultNode(lhs_node, rhs_node)
-            ret = self.parse_term2(ret)
-            return ret
-        
-        if token_id in [Token.EQ, Token.SEMI, Token.RPAR, Token.LT, Token.PLUS, Token.MINUS]:
-            return lhs_node
+    id_name, id_data, update_ast = update
+    if id_data.id_type != IDType.VAR or id_data.new_name != iv.value:
+        return None
+    if type(update_ast) != ASTPlusNode:
+        return None
+    children = [update_ast.l_child, update_ast.r_child]
+    steps = [c for c in children if type(c) == ASTNumNode and c.node_type == Type.INT]
+    ivs = [c for c in children if type(c) == ASTVarIDNode and c.value == iv.value]
+    step = int_literal_value(steps[0].value) if len(steps) == 1 else None
+    if step is None or len(ivs) != 1 or step <= 0:
+        return None
 
-        raise ParserException(self.scanner.get_lineno(),
-                              self.to_match,            
-                              [Token.EQ, Token.SEMI, Token.RPAR, Token.LT, Token.PLUS, Token.MINUS, Token.MUL, Token.DIV])
-
-
-    # you need to build and return an AST
-    def parse_unit(self) -> ASTNode:
-        token_id = self.get_token_id(self.to_match)
-        if token_id in [Token.NUM]:
-            value = self.to_match.value
-            node = ASTNumNode(value)
-            self.eat(Token.NUM)            
-            return node
-        if token_id in [Token.ID]:
-            id_name = self.to_match.value
-            id_data = self.symbol_table.lookup(id_name)
-            if id_data == None:
-                raise SymbolTableException(self.scanner.get_lineno(), id_name)
-            self.eat(Token.ID)
+    # the update is the last instruction of the body program
+    defined = set([i.dest for i in body_program[:-1]])
+    if iv.value in defined or bound.value in defined:
+        return None
+    return iv.value, step, bound
 
-            if (id_data.id_type == IDType.IO):
-                node = ASTIOIDNode(id_name, id_data.data_type)
-            # For Program Variable
-            else:
-                node = ASTVarIDNode(id_data.new_name, id_data.data_type)
-
-            return node
-        if token_id in [Token.LPAR]:
-            self.eat(Token.LPAR)
-            ret = self.parse_expr()
-            self.eat(Token.RPAR)
-            return ret
-            
-        raise ParserException(self.scanner.get_lineno(),
-                              self.to_match,            
-                              [Token.NUM, Token.ID, Token.LPAR])    
+# A fresh copy of a leaf node (ASTs get their virtual registers
+# assigned in place, so nodes cannot be shared)
+def copy_leaf(node: ASTLeafNode) -> ASTLeafNode:
+    if type(node) == ASTNumNode:
+        return ASTNumNode(node.value)
+    return type(node)(node.value, node.node_type)
 
 # Type inference start
 def is_leaf_node(node: ASTNode) -> bool:
@@ -549,24 +792,17 @@ def is_unop_node(node: ASTNode) -> bool:
 def convert_children_type(node: ASTNode) -> None:
     if node.l_child.node_type == Type.INT and node.r_child.node_type == Type.FLOAT:
         conv = ASTIntToFloatNode(node.l_child)
-        type_inference(conv)
+        infer_node_type(conv)
         node.l_child = conv
     elif node.l_child.node_type == Type.FLOAT and node.r_child.node_type == Type.INT:
         conv = ASTIntToFloatNode(node.r_child)
-        type_inference(conv)
+        infer_node_type(conv)
         node.r_child = conv
 
-# Type inference top level
-def type_inference(node: ASTNode) -> Type:
-    
-    if is_leaf_node(node):
-        return node.node_type
-
-    elif is_binop_node(node):
-        # do type inference on children
-        type_inference(node.l_child)
-        type_inference(node.r_child)
+# Type inference of a single node, its children already have types
+def infer_node_type(node: ASTNode) -> None:
 
+    if is_binop_node(node):
         # do inference for arithmetic operators
         if type(node) in [ASTPlusNode, ASTMinusNode, ASTMultNode, ASTDivNode]:
             # if either child is float type, we become a float too.
@@ -587,9 +823,6 @@ def type_inference(node: ASTNode) -> Type:
             convert_children_type(node)
 
     elif is_unop_node(node):
-        # do type inference on children
-        # type_inference(node.child) # NOTE: Should not be necessary. child node should definitely already have a type
-        
         # Set our node_type and check child type
         if type(node) in [ASTIntToFloatNode]:
             node.node_type = Type.FLOAT
@@ -598,8 +831,14 @@ def type_inference(node: ASTNode) -> Type:
             assert(node.child.node_type == Type.INT)
             
         elif type(node) in [ASTFloatToIntNode]:
-            node.node_type = Types.INT
+            node.node_type = Type.INT
 
             # Make sure chlid is right type
             assert(node.child.node_type == Type.FLOAT)
-    
+
+# Type inference top level: infers the types bottom up (leaves
+# already have their types)
+def type_inference(root: ASTNode) -> Type:
+    for node in postorder(root):
+        infer_node_type(node)
+    return root.node_type
@@ -0,0 +1,55 @@
+from typing import List,Tuple
+from classir import Instruction, store_ops
+
+# Dead code elimination by mark and sweep.
+#
+# The roots are the instructions with an effect outside of the
+# virtual registers: stores to the IO variables (vr2int/vr2float),
+# branches (and the registers they compare) and labels. Marking
+# follows the operands of marked instructions to every instruction
+# defining them. The variables (virtual registers and _new_name
+# program variables) are locals of the emitted function, so a value
+# is only live out of it through a store.
+#
+# Definitions are found by name rather than by reaching definitions,
+# so a definition that is always overwritten before being read is
+# kept if some other definition of the variable is needed.
+#
+# Returns the new program and how many instructions were removed.
+def eliminate_dead_code(program: List[Instruction]) -> Tuple[List[Instruction],int]:
+    defs = {}   # variable -> indexes of the instructions defining it
+    for k, i in enumerate(program):
+        if i.dest is not None and i.op not in store_ops:
+            defs.setdefault(i.dest, []).append(k)
+
+    # mark
+    marked = bytearray(len(program))
+    worklist = []
+    for k, i in enumerate(program):
+        if i.dest is None or i.op in store_ops:
+            marked[k] = 1
+            worklist.append(k)
+    needed = set()
+    while worklist:
+        for u in program[worklist.pop()].uses():
+            if u in needed:
+                continue
+            needed.add(u)
+            for d in defs.get(u, ()):
+                if not marked[d]:
+                    marked[d] = 1
+                    worklist.append(d)
+
+    # sweep
+    new_program = [i for k, i in enumerate(program) if marked[k]]
+    return new_program, len(program) - len(new_program)
+
+# the variables a program reads or writes, in order of appearance
+def referenced_variables(program: List[Instruction]) -> List[str]:
+    names = {}
+    for i in program:
+        for u in i.uses():
+            names[u] = True
+        if i.dest is not None and i.op not in store_ops:
+            names[i.dest] = True
+    return list(names)
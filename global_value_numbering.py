@@ -0,0 +1,164 @@
+import re
+from typing import List,Optional,Set,Tuple
+from classir import Instruction, arithmetic_ops, commutative_ops, copy, COPY
+from cfg import CFG, dominators, immediate_dominators, dominator_tree
+from local_value_numbering import ValueTable
+
+# Global value numbering over the dominator tree: each block starts
+# with the value table of its immediate dominator, so an expression
+# computed in a dominating block is not computed again (e.g. in both
+# arms of an if or in a loop body after the loop test). The tables are
+# scoped, what a block adds is undone when the walk leaves its subtree.
+#
+# The IR is not in SSA form, so a table is only inherited as is by a
+# block with a single predecessor (which is then its immediate
+# dominator). A block with several predecessors can be reached from
+# its immediate dominator d through any block d dominates, so the
+# variables written in those blocks lose their value numbers.
+# Registers (vrN) are written once before they are read, so only the
+# program and IO variables and registers written more than once need
+# to be tracked.
+
+register_re = re.compile(r"vr\d+")
+
+# marks a table entry missing before a scope wrote it
+MISSING = object()
+
+# A value table whose changes can be undone back to a mark
+class ScopedValueTable(ValueTable):
+    def __init__(self) -> None:
+        super().__init__()
+        self.log = []   # (dict, key, previous value) of every change
+
+    def put(self, d: dict, key, value) -> None:
+        self.log.append((d, key, d.get(key, MISSING)))
+        d[key] = value
+
+    def new_number(self) -> int:
+        # the counter is never undone, so value numbers stay unique
+        vn = self.counter
+        self.counter += 1
+        self.put(self.holders, vn, [])
+        return vn
+
+    def number(self, operand: str) -> int:
+        if operand not in self.numbers:
+            self.put(self.numbers, operand, self.new_number())
+        return self.numbers[operand]
+
+    def assign(self, name: str, vn: int) -> None:
+        self.put(self.numbers, name, vn)
+        self.put(self.holders, vn, self.holders[vn] + [name])
+
+    # forget the value of a variable written on some path
+    def kill(self, name: str) -> None:
+        if name in self.numbers:
+            self.log.append((self.numbers, name, self.numbers.pop(name)))
+
+    # a variable that still holds value number vn (killed variables
+    # hold nothing)
+    def holder(self, vn: int) -> Optional[str]:
+        for name in self.holders[vn]:
+            if self.numbers.get(name) == vn:
+                return name
+        return None
+
+    def mark(self) -> int:
+        return len(self.log)
+
+    def undo(self, mark: int) -> None:
+        while len(self.log) > mark:
+            d, key, previous = self.log.pop()
+            if previous is MISSING:
+                d.pop(key, None)
+            else:
+                d[key] = previous
+
+# value numbering of one block with the table of its dominators,
+# returns the new block and how many instructions were replaced
+def GVN_block(vt: ScopedValueTable, block: List[Instruction]) -> Tuple[List[Instruction],int]:
+    new_block = []
+    replaced = 0
+    for i in block:
+        op = i.op
+        if op is COPY:
+            vt.assign(i.dest, vt.number(i.args[0]))
+        elif i.dest is not None:
+            operands = tuple([vt.number(a) for a in i.args])
+            if op in commutative_ops and operands[0] > operands[1]:
+                operands = (operands[1], operands[0])
+            key = (op, operands)
+
+            vn = vt.table.get(key)
+            if vn is not None:
+                holder = vt.holder(vn)
+                if holder is not None and op in arithmetic_ops:
+                    i = copy(i.dest, holder)
+                    replaced += 1
+            else:
+                vn = vt.new_number()
+                vt.put(vt.table, key, vn)
+
+            vt.assign(i.dest, vn)
+
+        new_block.append(i)
+    return new_block, replaced
+
+# the variables that can change value between a block and a block it
+# dominates: everything but registers written once
+def tracked_variables(program: List[Instruction]) -> Set[str]:
+    defs = {}
+    for i in program:
+        if i.dest is not None:
+            defs[i.dest] = defs.get(i.dest, 0) + 1
+    ret = set()
+    for i in program:
+        for v in i.uses() + ([i.dest] if i.dest is not None else []):
+            if defs.get(v, 0) > 1 or register_re.fullmatch(v) is None:
+                ret.add(v)
+    return ret
+
+# perform global value numbering, returns the new program and how
+# many instructions were replaced
+def GVN(program: List[Instruction]) -> Tuple[List[Instruction],int]:
+    cfg = CFG(program)
+    if not cfg.blocks:
+        return program, 0
+    idom = immediate_dominators(cfg, dominators(cfg))
+    children = dominator_tree(idom)
+
+    # the tracked variables written in each block and in the
+    # dominator subtree below each block
+    tracked = tracked_variables(program)
+    written = [set([i.dest for i in cfg.instructions(block) if i.dest in tracked]) for block in cfg.blocks]
+    below = [set() for _ in cfg.blocks]
+    for b in reversed(cfg.reverse_postorder()):
+        # children come after their dominator in reverse postorder
+        for c in children[b]:
+            below[b] |= below[c] | written[c]
+
+    new_blocks = {}
+    replaced = 0
+    vt = ScopedValueTable()
+    marks = {}
+    stack = [(0, False)]
+    while stack:
+        b, leaving = stack.pop()
+        if leaving:
+            vt.undo(marks[b])
+            continue
+        marks[b] = vt.mark()
+        if idom[b] is not None and len(cfg.blocks[b].preds) > 1:
+            for v in below[idom[b]]:
+                vt.kill(v)
+        new_blocks[b], r = GVN_block(vt, cfg.instructions(cfg.blocks[b]))
+        replaced += r
+        stack.append((b, True))
+        for c in reversed(children[b]):
+            stack.append((c, False))
+
+    # unreachable blocks are left as they are
+    new_program = []
+    for block in cfg.blocks:
+        new_program.extend(new_blocks.get(block.index, cfg.instructions(block)))
+    return new_program, replaced
@@ -2,42 +2,131 @@
 # Type hint for lvn_new_variables
 # Type hint for lvn_replaced
 
-import local_value_numbering
-from cse110A_parser import Parser
+import c_backend
+import pass_manager
+from classir import Instruction, format_program
+from cse110A_parser import Parser, distinct_functions
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+from scanner import TokenTape
 from typing import Callable,List,Tuple,Optional
 
+classir_preamble = '#include "../../classir.h"'
+
+# One output unit from the (header comments, C++ function) of every
+# function in source order. The first function's comments come before
+# the preamble (the classir.h include), so a unit of one function is
+# the output of a single function file.
+def format_unit(functions: List[Tuple[str,str]], preamble: str) -> str:
+    ret = "\n%s\n%s\n%s" % (functions[0][0], preamble, functions[0][1])
+    for comments, function in functions[1:]:
+        ret += "\n\n%s\n%s" % (comments, function)
+    return ret + "\n        "
+
 class IRCompiler():
     def __init__(self, p: Parser):
         self.parser = p
 
-    def print_program(self,program: List[str], lvn_new_variables: List[str], lvn_replaced: int) -> str:
+    # the comments of the function: the LVN count, then the header
+    # comments of the passes that ran (self.header)
+    def format_comments(self, lvn_replaced: int) -> str:
+        header = "".join(["\n// %s" % h for h in self.header])
+        return "// LVN replaced %s arithmetic instructions%s" % (str(lvn_replaced), header)
+
+    # variables: the variables to declare if not every virtual
+    # register and new name (e.g. after register allocation)
+    def format_function(self, program: List[Instruction], lvn_new_variables: List[str], variables: Optional[List[str]] = None) -> str:
         args = ["%s &%s" % (a[1], a[0]) for a in self.parser.function_args]
         arg_string = ",".join(reversed(args))
-        program_str = "\n".join(program)
-        vrs = self.parser.vra.declare_variables()
+        program_str = "\n".join(format_program(program))
+        if variables is None:
+            vrs = self.parser.vra.declare_variables()
+            new_names = "\n".join(["virtual_reg %s;" % n for n in self.parser.nng.new_names])
+        else:
+            vrs = ["virtual_reg %s;" % n for n in variables]
+            new_names = ""
         vrs_str = "\n".join(vrs)
-        new_names = "\n".join(["virtual_reg %s;" % n for n in self.parser.nng.new_names])
         lvn_names = "\n".join(["virtual_reg %s;" % n for n in lvn_new_variables])
-        return """
-// LVN replaced %s arithmetic instructions
-#include "../../classir.h"
-void %s(%s){
-%s
-%s
-%s
-%s
-return;
-}
-        """ % (str(lvn_replaced), self.parser.function_name, arg_string, vrs_str, new_names, lvn_names, program_str)
-        
-
-    def compile2ir(self, s: str, lvn: bool, uf: int) -> None:
-        program = self.parser.parse(s,uf)
-        program = [p for p in program if p != '']
-        if lvn:
-            program,lvn_new_names,lvn_replaced = local_value_numbering.LVN(program)
+        return "void %s(%s){\n%s\n%s\n%s\n%s\nreturn;\n}" % (self.parser.function_name, arg_string, vrs_str, new_names, lvn_names, program_str)
+
+    def print_program(self,program: List[Instruction], lvn_new_variables: List[str], lvn_replaced: int, variables: Optional[List[str]] = None) -> str:
+        function = self.format_function(program, lvn_new_variables, variables)
+        return format_unit([(self.format_comments(lvn_replaced), function)], classir_preamble)
+
+    # compile a source string, see compile_file
+    def compile2ir(self, s: str, pipeline: List[str], uf: int = 1, fixed_point: bool = False, time_passes: bool = False, backend: str = "classir", jobs: int = 1) -> None:
+        self.parser.scanner.input_string(s)
+        self.compile_input(pipeline, uf, fixed_point, time_passes, backend, jobs)
+
+    # compile a source file with a pipeline of passes by name (see
+    # pass_manager); constants are folded while parsing when the
+    # pipeline has cf. backend is "classir" (calls to the classir.h
+    # helpers) or "c" (see c_backend).
+    def compile_file(self, file_name: str, pipeline: List[str], uf: int = 1, fixed_point: bool = False, time_passes: bool = False, backend: str = "classir", jobs: int = 1) -> None:
+        self.parser.scanner.input_file(file_name)
+        self.compile_input(pipeline, uf, fixed_point, time_passes, backend, jobs)
+
+    # Compile the scanner's input. It can have many functions: they
+    # are scanned one at a time, every function is parsed and optimized
+    # on its own (see compile_function), and the functions are printed
+    # in source order. With one job each function is compiled as soon
+    # as it is scanned, so only its output is kept; with more they are
+    # all scanned first and compiled by a pool of jobs processes. An
+    # input of one function is compiled in this process with this
+    # compiler's parser.
+    def compile_input(self, pipeline: List[str], uf: int = 1, fixed_point: bool = False, time_passes: bool = False, backend: str = "classir", jobs: int = 1) -> None:
+        tapes = distinct_functions(self.parser.scanner.tokenize_functions())
+        first = next(tapes)
+        second = next(tapes, None)
+        if second is None:
+            program = self.parser.parse_tape(first,uf,"cf" in pipeline)
+            self.run_passes(program, pipeline, fixed_point, time_passes, backend)
+            return
+
+        tasks = (FunctionTask(t, pipeline, uf, fixed_point, time_passes, backend) for t in chain([first, second], tapes))
+        if jobs <= 1:
+            functions = list(map(compile_function, tasks))
         else:
-            lvn_new_names = []
-            lvn_replaced = 0
-        self.ir_program = self.print_program(program,lvn_new_names,lvn_replaced)
+            tasks = list(tasks)
+            # a few chunks per worker keeps them busy without a round trip per function
+            chunksize = max(1, len(tasks) // (jobs * 4))
+            with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as pool:
+                functions = list(pool.map(compile_function, tasks, chunksize=chunksize))
+        self.functions = functions
+        self.ir_program = format_unit(functions, c_backend.preamble if backend == "c" else classir_preamble)
+
+    def run_passes(self, program: List[Instruction], pipeline: List[str], fixed_point: bool = False, time_passes: bool = False, backend: str = "classir") -> None:
+        ctx = pass_manager.PassContext(self.parser)
+        pm = pass_manager.PassManager(pipeline, fixed_point)
+        program = pm.run(program, ctx)
+        self.header = pm.report(time_passes)
+        if backend == "c":
+            function = c_backend.format_function(program,self.parser.function_name,self.parser.function_args)
+            preamble = c_backend.preamble
+        else:
+            function = self.format_function(program,ctx.new_names,ctx.variables)
+            preamble = classir_preamble
+        # (comments, function) of every function compiled
+        self.functions = [(self.format_comments(ctx.lvn_replaced), function)]
+        self.ir_program = format_unit(self.functions, preamble)
+
+# a function of a file to compile and how
+class FunctionTask:
+    def __init__(self, tape: TokenTape, pipeline: List[str], uf: int, fixed_point: bool, time_passes: bool, backend: str) -> None:
+        self.tape = tape
+        self.pipeline = pipeline
+        self.uf = uf
+        self.fixed_point = fixed_point
+        self.time_passes = time_passes
+        self.backend = backend
 
+# Compile one function of a file (in a worker), returns its comments
+# and C++ function. Every function gets a new parser, so its virtual
+# registers, labels and new names are its own (vr0, label0, ... in
+# every function), as are its symbol table and pass statistics.
+def compile_function(task: FunctionTask) -> Tuple[str,str]:
+    # the tape has the text, the parser needs no scanner
+    compiler = IRCompiler(Parser(None))
+    program = compiler.parser.parse_tape(task.tape, task.uf, "cf" in task.pipeline)
+    compiler.run_passes(program, task.pipeline, task.fixed_point, task.time_passes, task.backend)
+    return compiler.functions[0]
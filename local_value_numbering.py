@@ -1,15 +1,92 @@
-import re
+from typing import List,Optional,Tuple
+from classir import Instruction, arithmetic_ops, commutative_ops, copy, COPY
+from cfg import basic_blocks
+
+# The value numbering state of one basic block
+class ValueTable:
+    def __init__(self) -> None:
+        self.counter = 0
+        self.numbers = {}   # variable or literal -> value number
+        self.table = {}     # (op, operand value numbers) -> value number
+        self.holders = {}   # value number -> variables that held it
+
+    def new_number(self) -> int:
+        vn = self.counter
+        self.counter += 1
+        self.holders[vn] = []
+        return vn
+
+    # value number of an operand, variables (and literals) that have
+    # not been seen in this block get a fresh number
+    def number(self, operand: str) -> int:
+        if operand not in self.numbers:
+            self.numbers[operand] = self.new_number()
+        return self.numbers[operand]
+
+    # assign a value number to a variable, this kills whatever
+    # value the variable held before
+    def assign(self, name: str, vn: int) -> None:
+        self.numbers[name] = vn
+        self.holders[vn].append(name)
+
+    # a variable that still holds value number vn
+    def holder(self, vn: int) -> Optional[str]:
+        for name in self.holders[vn]:
+            if self.numbers[name] == vn:
+                return name
+        return None
+
+# value numbering of a single basic block, returns the new block and
+# how many instructions were replaced
+def LVN_block(block: List[Instruction]) -> Tuple[List[Instruction],int]:
+    vt = ValueTable()
+    numbers = vt.numbers
+    number = vt.number
+    new_block = []
+    replaced = 0
+    for i in block:
+        op = i.op
+        if op is COPY:
+            vt.assign(i.dest, number(i.args[0]))
+        elif i.dest is not None:
+            operands = tuple([numbers[a] if a in numbers else number(a) for a in i.args])
+            if op in commutative_ops and operands[0] > operands[1]:
+                operands = (operands[1], operands[0])
+            key = (op, operands)
+
+            vn = vt.table.get(key)
+            if vn is not None:
+                holder = vt.holder(vn)
+                if holder is not None and op in arithmetic_ops:
+                    i = copy(i.dest, holder)
+                    replaced += 1
+            else:
+                vn = vt.new_number()
+                vt.table[key] = vn
+
+            vt.assign(i.dest, vn)
+
+        new_block.append(i)
+
+    return new_block, replaced
 
 # perform the local value numbering optimization
-def LVN(program):
+def LVN(program: List[Instruction]) -> Tuple[List[Instruction],List[str],int]:
 
     # returns 3 items:
-    
+
     # 1. a new program (list of classier instructions)
     # with the LVN optimization applied
 
     # 2. a list of new variables required (e.g. numbered virtual
-    # registers and program variables)
+    # registers and program variables). Replaced instructions copy
+    # from a variable that still holds the value, so none are needed
 
-    # 3. a number with how many instructions were replaced    
-    return program,[],0
+    # 3. a number with how many instructions were replaced
+    new_program = []
+    replaced = 0
+    for block in basic_blocks(program):
+        new_block, r = LVN_block(block)
+        new_program.extend(new_block)
+        replaced += r
+    return new_program,[],replaced
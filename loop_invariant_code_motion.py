@@ -0,0 +1,119 @@
+from typing import Dict,List,Optional,Tuple
+from classir import Op, Instruction, load_ops, arithmetic_ops, branch_ops
+from cfg import CFG, Loop, dominators, natural_loops
+from register_allocation import global_names, liveness
+
+# Loop invariant code motion: computations in a loop whose operands
+# do not change while the loop runs are moved to a preheader, the
+# code just before the label of the loop header, and run once.
+#
+# The loops are the natural loops of the control flow graph (for
+# loops are a header label with the test, the body and a branch back
+# to the label). An instruction in a loop is invariant when every
+# operand is a literal, a variable not written in the loop or a
+# variable whose only definition in the loop is itself invariant.
+#
+# An invariant instruction is hoisted when:
+# * it is the only definition of its variable in the loop,
+# * the variable is not live on entry to the header (no iteration
+#   reads a value from before the loop or the previous iteration),
+# * the variable is not live on exit from the loop (the loop may not
+#   run at all, and the hoisted value must not leak out of it),
+# * the operation cannot trap or be undefined on values the loop
+#   would not have computed: integer division and float to int
+#   conversions are never hoisted. Stores and control flow never are.
+
+# operations that may be hoisted
+hoistable_ops = (load_ops | arithmetic_ops | frozenset([Op.COPY])) - frozenset([Op.DIVI, Op.VR_FLOAT2INT])
+
+# Hoist the invariant instructions of every loop, outer loops first
+# so that an instruction invariant in several nested loops moves out
+# of all of them at once. Returns the new program and how many
+# instructions were hoisted.
+def hoist_invariants(program: List[Instruction]) -> Tuple[List[Instruction],int]:
+    hoisted = 0
+    depth = 0
+    while True:
+        cfg = CFG(program)
+        loops = [l for l in natural_loops(cfg, dominators(cfg)) if l.depth == depth]
+        if not loops:
+            return program, hoisted
+
+        names = global_names(cfg)
+        index = {n: b for b, n in enumerate(names)}
+        live_in, _ = liveness(cfg, index)
+
+        # loops at the same depth are disjoint, all of them are
+        # hoisted from in one rewrite of the program
+        preheaders = {}     # position of a header -> instructions to insert before it
+        removed = set()     # positions of the hoisted instructions
+        for loop in loops:
+            header = preheader_position(cfg, loop)
+            if header is None:
+                continue
+            invariants = loop_invariants(cfg, loop, index, live_in)
+            preheaders[header] = [program[k] for k in invariants]
+            removed.update(invariants)
+            hoisted += len(invariants)
+
+        new_program = []
+        for k, i in enumerate(program):
+            if k in preheaders:
+                new_program.extend(preheaders[k])
+            if k not in removed:
+                new_program.append(i)
+        program = new_program
+        depth += 1
+
+# The position of the header label when the code just before it can
+# serve as the preheader: the loop is only entered by falling through
+# from the previous block (or is at the start of the program). None
+# otherwise.
+def preheader_position(cfg: CFG, loop: Loop) -> Optional[int]:
+    header = cfg.blocks[loop.header]
+    entries = loop.entries(cfg)
+    if loop.header == 0:
+        return header.start if not entries else None
+    if entries != [loop.header - 1]:
+        return None
+    last = cfg.program[header.start - 1]
+    if last.op in branch_ops and last.target() == cfg.program[header.start].args[0]:
+        return None
+    return header.start
+
+# The positions of the instructions of a loop that can be hoisted, in
+# an order where every instruction comes after the ones it reads
+def loop_invariants(cfg: CFG, loop: Loop, index: Dict[str,int], live_in: List[int]) -> List[int]:
+    program = cfg.program
+    positions = []
+    for b in sorted(loop.blocks):
+        positions.extend(range(cfg.blocks[b].start, cfg.blocks[b].end))
+
+    # variables written in the loop -> number of definitions
+    defs = {}
+    for k in positions:
+        dest = program[k].dest
+        if dest is not None:
+            defs[dest] = defs.get(dest, 0) + 1
+
+    # variables live into the loop or out of it
+    live = live_in[loop.header]
+    for e in loop.exits(cfg):
+        live |= live_in[e]
+
+    invariant = set()
+    ret = []
+    changed = True
+    while changed:
+        changed = False
+        for k in positions:
+            i = program[k]
+            if i.op not in hoistable_ops or i.dest in invariant or defs[i.dest] != 1:
+                continue
+            if i.dest in index and live >> index[i.dest] & 1:
+                continue
+            if all([u not in defs or u in invariant for u in i.uses()]):
+                invariant.add(i.dest)
+                ret.append(k)
+                changed = True
+    return ret
@@ -1,46 +1,118 @@
 import argparse
-from scanner import Scanner, tokens, Lexeme, Token
+from typing import List,Optional,Tuple
+from scanner import Scanner, tokens, Lexeme, Token, idy
 from cse110A_parser import Parser
 from ir_compiler import IRCompiler
+from compile_cache import CompileCache, default_directory, default_max_bytes
+import pass_manager
 
-if __name__ == "__main__":
+backends = ["classir", "c"]
 
-    # this is the command line parser, not the C-simple parser
+# this is the command line parser, not the C-simple parser
+def build_arg_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser()
     parser.add_argument('file_name', type=str)
+    # the functions of a file can be compiled by a pool of processes;
+    # starting one costs more than compiling a few small functions
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='processes compiling the functions of the file')
+    add_compile_arguments(parser)
+    return parser
+
+# the options choosing how to compile (shared with batch.py)
+def add_compile_arguments(parser: argparse.ArgumentParser) -> None:
     parser.add_argument('--local_value_numbering', '-lvn', action='store_true')
     parser.add_argument('--unroll_factor', '-uf', type=int)
-    args = parser.parse_args()
-    if args.unroll_factor is None:
-        args.unroll_factor = 1
-    if args.local_value_numbering is None:
-        args.local_value_numbering = False
-
-    args = parser.parse_args()
+    parser.add_argument('--register_allocation', '-ra', action='store_true')
+    parser.add_argument('--constant_folding', '-cf', action='store_true')
+    parser.add_argument('--dead_code_elimination', '-dce', action='store_true')
+    parser.add_argument('--loop_invariant_code_motion', '-licm', action='store_true')
+    parser.add_argument('--strength_reduction', '-sr', action='store_true')
+    parser.add_argument('--copy_propagation', '-cp', action='store_true')
+    parser.add_argument('--global_value_numbering', '-gvn', action='store_true')
+    parser.add_argument('--ssa', '-ssa', action='store_true')
+    # -O0 to -O3, the single pass flags add to the level's passes
+    parser.add_argument('-O', dest='optimization_level', type=int, choices=range(len(pass_manager.levels)), default=0)
+    # a pipeline of passes by name in the order to run them, e.g. --passes=cf,cp,dce
+    parser.add_argument('--passes', type=str)
+    parser.add_argument('--fixed_point', action='store_true')
+    parser.add_argument('--time_passes', action='store_true')
+    # classir: calls to the classir.h helpers, c: typed locals and native operators (see c_backend)
+    parser.add_argument('--backend', choices=backends, default='classir')
+    # the compiled IR is cached on disk, see compile_cache
+    parser.add_argument('--no_cache', '--no-cache', action='store_true')
+    parser.add_argument('--cache_dir', type=str, default=default_directory)
+    parser.add_argument('--cache_size', type=int, default=default_max_bytes // 2**20, help='in MB')
 
-    # get the program string
-    f = open(args.file_name)    
-    f_contents = f.read()
-    f.close()
+# the passes to run and whether to iterate them to a fixed point,
+# exits with a usage error for an invalid pipeline
+def select_passes(parser: argparse.ArgumentParser, args: argparse.Namespace) -> Tuple[List[str],bool]:
+    flags = pass_manager.flag_pipeline(args.local_value_numbering, args.register_allocation, args.constant_folding, args.dead_code_elimination, args.loop_invariant_code_motion, args.strength_reduction, args.copy_propagation, args.global_value_numbering, args.ssa)
+    if args.passes is not None:
+        if flags or args.optimization_level:
+            parser.error("--passes cannot be combined with -O or single pass flags")
+        pipeline = [n.strip() for n in args.passes.split(",") if n.strip()]
+    else:
+        selected = set(pass_manager.levels[args.optimization_level] + flags)
+        pipeline = [n for n in pass_manager.registry if n in selected]
+    try:
+        pipeline = pass_manager.build_pipeline(pipeline)
+    except ValueError as e:
+        parser.error(str(e))
+    fixed_point = args.fixed_point or args.optimization_level >= pass_manager.fixed_point_level
+    return pipeline, fixed_point
 
-    # create the scanner and make a token action for
-    # tracking the line number
+# a new compiler; the parser keeps per-compile state, so every
+# compile needs its own
+def make_compiler() -> IRCompiler:
+    # create the scanner, whitespace is ignored. The scanner
+    # tracks line numbers itself from its offset into the input
     s = Scanner()
-    def track_lineno(l: Lexeme) -> Lexeme:
-        if l.value == "\n":
-            s.lineno += 1
-        return l
-    tokens = tokens + [(Token.IGNORE, " |\n|\t", track_lineno)]
-    s.set_tokens(tokens)
+    s.set_tokens(tokens + [(Token.IGNORE, " |\n|\t", idy)])
 
     # create the parser with the scanner
     p = Parser(s)
 
     # create the IRCompiler with the parser
-    compiler = IRCompiler(p)
+    return IRCompiler(p)
+
+# compile a source file into the IR text
+def compile_file(file_name: str, pipeline: List[str], uf: int = 1, fixed_point: bool = False, time_passes: bool = False, backend: str = "classir", jobs: int = 1) -> str:
+    compiler = make_compiler()
+
+    # compile the program into IR, the source file is memory
+    # mapped rather than read into a string
+    compiler.compile_file(file_name, pipeline, uf, fixed_point, time_passes, backend, jobs)
+    return compiler.ir_program
 
-    # compile the program into IR
-    compiler.compile2ir(f_contents,args.local_value_numbering, args.unroll_factor)
+# compile a source file through the cache: the key covers everything
+# the IR depends on. With --time_passes the output has timings and is
+# never cached. jobs does not change the output
+def compile_cached(cache: Optional[CompileCache], file_name: str, pipeline: List[str], uf: int, fixed_point: bool, time_passes: bool, backend: str = "classir", jobs: int = 1) -> str:
+    if cache is None or time_passes:
+        return compile_file(file_name, pipeline, uf, fixed_point, time_passes, backend, jobs)
+    with open(file_name, "rb") as f:
+        source = f.read()
+    key = cache.key(source, ["passes=" + ",".join(pipeline), "uf=%d" % uf, "fixed_point=%d" % fixed_point, "backend=" + backend])
+    ir = cache.get(key)
+    if ir is None:
+        ir = compile_file(file_name, pipeline, uf, fixed_point, backend=backend, jobs=jobs)
+        cache.put(key, ir)
+    return ir
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    if args.unroll_factor is None:
+        args.unroll_factor = 1
+    if args.local_value_numbering is None:
+        args.local_value_numbering = False
+    pipeline, fixed_point = select_passes(parser, args)
+
+    cache = None if args.no_cache else CompileCache(args.cache_dir, args.cache_size * 2**20)
+    ir = compile_cached(cache, args.file_name, pipeline, args.unroll_factor, fixed_point, args.time_passes, args.backend, args.jobs)
 
     # print the IR
-    print(compiler.ir_program)
+    print(ir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+import time
+from typing import Callable,List,Optional,Tuple
+from classir import Instruction
+import local_value_numbering
+import register_allocation
+import constant_folding
+import dead_code_elimination
+import loop_invariant_code_motion
+import strength_reduction
+import copy_propagation
+import global_value_numbering
+import static_single_assignment
+
+# The optimization passes and the order they run in.
+#
+# Every pass is registered with a name (the one --passes takes), the
+# function running it and the message reporting its statistics in the
+# header of the output. A pass function takes the program and the
+# PassContext and returns the new program and a tuple of counts; when
+# a pass runs more than once its counts are added up.
+#
+# No pass depends on another having run: each is correct on any
+# program, and the order of the optimization levels below is the one
+# that finds the most work.
+#
+# invalidates: the passes that may find more work once this one has
+# changed the program; when iterating to a fixed point only those run
+# again
+# last: the pass renames every variable and must end the pipeline
+
+# state shared by the passes of one compilation
+class PassContext:
+    def __init__(self, parser) -> None:
+        self.parser = parser
+        self.folded = parser.folded     # constants folded by the parser
+        self.new_names = []             # variables the passes added (declared with the LVN names)
+        self.lvn_replaced = 0
+        self.prune = False              # declare only the variables still referenced
+        self.variables = None           # the variables to declare, None for every one
+
+class Pass:
+    def __init__(self, name: str, run: Callable, message: Optional[str],
+                 invalidates: Tuple[str, ...] = (), last: bool = False) -> None:
+        self.name = name
+        self.run = run
+        self.message = message
+        self.invalidates = invalidates
+        self.last = last
+
+def run_cf(program: List[Instruction], ctx: PassContext) -> Tuple[List[Instruction],Tuple[int, ...]]:
+    program, folded = constant_folding.propagate_constants(program)
+    # the parser's folds are reported with the first run
+    folded += ctx.folded
+    ctx.folded = 0
+    return program, (folded,)
+
+def run_licm(program: List[Instruction], ctx: PassContext) -> Tuple[List[Instruction],Tuple[int, ...]]:
+    program, hoisted = loop_invariant_code_motion.hoist_invariants(program)
+    return program, (hoisted,)
+
+def run_sr(program: List[Instruction], ctx: PassContext) -> Tuple[List[Instruction],Tuple[int, ...]]:
+    program, reduced = strength_reduction.reduce_strength(program, ctx.parser.vra)
+    return program, (reduced,)
+
+def run_lvn(program: List[Instruction], ctx: PassContext) -> Tuple[List[Instruction],Tuple[int, ...]]:
+    program, new_names, replaced = local_value_numbering.LVN(program)
+    ctx.new_names.extend(new_names)
+    ctx.lvn_replaced += replaced
+    return program, (replaced,)
+
+def run_gvn(program: List[Instruction], ctx: PassContext) -> Tuple[List[Instruction],Tuple[int, ...]]:
+    program, replaced = global_value_numbering.GVN(program)
+    return program, (replaced,)
+
+def run_cp(program: List[Instruction], ctx: PassContext) -> Tuple[List[Instruction],Tuple[int, ...]]:
+    program, replaced = copy_propagation.propagate_copies(program)
+    ctx.prune = True
+    return program, (replaced,)
+
+# dead code elimination on SSA form follows the def-use chains;
+# versions that cannot get their variable's name back are declared
+# with the LVN names
+def run_ssa(program: List[Instruction], ctx: PassContext) -> Tuple[List[Instruction],Tuple[int, ...]]:
+    form = static_single_assignment.to_ssa(program)
+    removed = static_single_assignment.eliminate_dead_code(form)
+    program, names = static_single_assignment.from_ssa(form)
+    # a fixed point runs it again, the names can already be declared
+    ctx.new_names.extend([n for n in names if n not in ctx.new_names])
+    return program, (form.phis, removed)
+
+def run_dce(program: List[Instruction], ctx: PassContext) -> Tuple[List[Instruction],Tuple[int, ...]]:
+    program, removed = dead_code_elimination.eliminate_dead_code(program)
+    ctx.prune = True
+    return program, (removed,)
+
+def run_ra(program: List[Instruction], ctx: PassContext) -> Tuple[List[Instruction],Tuple[int, ...]]:
+    program, ctx.variables, allocated = register_allocation.allocate_registers(program)
+    return program, (len(ctx.variables), allocated)
+
+# the registered passes, in the order the single pass flags run them
+registry = {}
+
+def register(p: Pass) -> None:
+    registry[p.name] = p
+
+# constant folding before LICM exposes constant loads to hoist, and
+# LICM before LVN value numbers the hoisted code together in the
+# preheader
+register(Pass("cf", run_cf, "constant folding folded %d operations",
+              invalidates=("licm", "sr", "lvn", "gvn", "cp", "dce")))
+register(Pass("licm", run_licm, "loop invariant code motion hoisted %d instructions",
+              invalidates=("lvn", "gvn", "cp", "dce")))
+register(Pass("sr", run_sr, "strength reduction reduced %d operations",
+              invalidates=("lvn", "gvn", "cp", "dce")))
+# LVN reports in the first header line
+register(Pass("lvn", run_lvn, None,
+              invalidates=("cp", "dce")))
+register(Pass("gvn", run_gvn, "GVN replaced %d arithmetic instructions",
+              invalidates=("cp", "dce")))
+register(Pass("cp", run_cp, "copy propagation replaced %d copies and reads of copies",
+              invalidates=("cf", "licm", "lvn", "gvn", "ssa", "dce")))
+register(Pass("ssa", run_ssa, "SSA form had %d phis, dead code elimination on it removed %d instructions",
+              invalidates=("cp", "licm")))
+register(Pass("dce", run_dce, "dead code elimination removed %d instructions",
+              invalidates=("cp", "licm")))
+register(Pass("ra", run_ra, "register allocation used %d registers for %d variables", last=True))
+
+# the pipelines of the optimization levels
+levels = [
+    [],
+    ["cf", "cp", "dce"],
+    ["cf", "licm", "sr", "lvn", "gvn", "cp", "dce"],
+    ["cf", "licm", "sr", "lvn", "gvn", "cp", "ssa", "dce", "ra"],
+]
+
+# -O3 iterates its passes to a fixed point
+fixed_point_level = 3
+
+# the pipeline of the single pass flags, in registry order
+def flag_pipeline(lvn: bool = False, ra: bool = False, cf: bool = False, dce: bool = False, licm: bool = False,
+                  sr: bool = False, cp: bool = False, gvn: bool = False, ssa: bool = False) -> List[str]:
+    flags = {"lvn": lvn, "ra": ra, "cf": cf, "dce": dce, "licm": licm, "sr": sr, "cp": cp, "gvn": gvn, "ssa": ssa}
+    return [name for name in registry if flags[name]]
+
+# Check a pipeline. Passes named twice run twice. Raises ValueError
+# for unknown passes and passes after a last pass.
+def build_pipeline(names: List[str]) -> List[str]:
+    for name in names:
+        if name not in registry:
+            raise ValueError("unknown pass '%s' (passes: %s)" % (name, ", ".join(registry)))
+    for name in names[:-1]:
+        if registry[name].last:
+            raise ValueError("pass '%s' must be the last pass" % name)
+    return list(names)
+
+# Runs a pipeline and collects the statistics of every pass
+class PassManager:
+    def __init__(self, pipeline: List[str], fixed_point: bool = False, max_rounds: int = 10) -> None:
+        self.pipeline = build_pipeline(pipeline)
+        self.fixed_point = fixed_point
+        self.max_rounds = max_rounds
+        self.stats = {}     # name -> the counts of its message, added up over its runs
+        self.runs = {}      # name -> how many times it ran
+        self.seconds = {}   # name -> wall time
+        self.delta = {}     # name -> change in the number of instructions
+
+    def run_pass(self, name: str, program: List[Instruction], ctx: PassContext) -> List[Instruction]:
+        p = registry[name]
+        start = time.perf_counter()
+        new_program, counts = p.run(program, ctx)
+        self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - start
+        self.runs[name] = self.runs.get(name, 0) + 1
+        self.delta[name] = self.delta.get(name, 0) + len(new_program) - len(program)
+        previous = self.stats.get(name, (0,) * len(counts))
+        self.stats[name] = tuple([a + b for a, b in zip(previous, counts)])
+        return new_program
+
+    # Run the pipeline on a program. Without fixed_point every pass
+    # runs once in order. With it, rounds over the pipeline run the
+    # passes invalidated by a change since they last ran, until a
+    # round changes nothing (or max_rounds). Last passes run once at
+    # the end either way.
+    def run(self, program: List[Instruction], ctx: PassContext) -> List[Instruction]:
+        body = [n for n in self.pipeline if not registry[n].last]
+        last = [n for n in self.pipeline if registry[n].last]
+        if not self.fixed_point:
+            for name in body:
+                program = self.run_pass(name, program, ctx)
+        else:
+            pending = set(range(len(body)))     # positions in body to run
+            rounds = 0
+            while pending and rounds < self.max_rounds:
+                rounds += 1
+                for k, name in enumerate(body):
+                    if k not in pending:
+                        continue
+                    pending.discard(k)
+                    before = [(i.op, i.dest, i.args) for i in program]
+                    program = self.run_pass(name, program, ctx)
+                    if [(i.op, i.dest, i.args) for i in program] != before:
+                        invalidated = registry[name].invalidates
+                        pending.update([j for j, n in enumerate(body) if n in invalidated])
+
+        # only the variables still referenced are declared
+        if ctx.prune:
+            referenced = set(dead_code_elimination.referenced_variables(program))
+            ctx.variables = [v for v in ctx.parser.vra.names() + ctx.parser.nng.new_names if v in referenced]
+
+        for name in last:
+            program = self.run_pass(name, program, ctx)
+        return program
+
+    # the header lines: the message of every pass that ran, in
+    # pipeline order, and with timing the runs, wall time and
+    # instruction count change of each
+    def report(self, timing: bool = False) -> List[str]:
+        names = list(dict.fromkeys(self.pipeline))
+        ret = []
+        for name in names:
+            if registry[name].message is not None:
+                ret.append(registry[name].message % self.stats[name])
+        if timing:
+            for name in names:
+                ret.append("pass %s: %d run%s, %.2f ms, %+d instructions" % (
+                    name, self.runs[name], "" if self.runs[name] == 1 else "s",
+                    self.seconds[name] * 1000, self.delta[name]))
+        return ret
@@ -0,0 +1,152 @@
+import heapq
+import re
+from typing import Dict,List,Tuple
+from classir import Instruction
+from cfg import CFG
+
+# Register allocation: gives the virtual registers (vrN) and renamed
+# program variables (_new_nameN) of a program a small set of
+# registers, so that the emitted function declares as many
+# virtual_reg locals as are live at once rather than one per AST node.
+#
+# Registers are assigned by linear scan over live intervals. Every
+# variable gets one interval covering all the points where it is
+# live (computed by a liveness analysis over the control flow graph),
+# and two variables whose intervals do not overlap can share a
+# register. Registers are unbounded, so nothing is ever spilled.
+
+# variables the allocator renames (IO variables keep their names)
+allocatable_re = re.compile(r"vr\d+|_new_name\d+")
+
+def allocatable(name: str) -> bool:
+    return allocatable_re.fullmatch(name) is not None
+
+# the set bits of a bitset
+def bits(s: int) -> List[int]:
+    ret = []
+    while s:
+        low = s & -s
+        ret.append(low.bit_length() - 1)
+        s ^= low
+    return ret
+
+# the allocatable variables read in some block before they are
+# written in that block
+def global_names(cfg: CFG) -> List[str]:
+    names = {}
+    for block in cfg.blocks:
+        written = set()
+        for i in cfg.instructions(block):
+            for u in i.uses():
+                if u not in written and allocatable(u):
+                    names[u] = True
+            if i.dest is not None:
+                written.add(i.dest)
+    return list(names)
+
+# Liveness analysis over the blocks of a control flow graph. Sets of
+# variables are bitsets (python ints), variable v being bit index[v].
+# Returns the variables live on entry to and on exit from each block.
+def liveness(cfg: CFG, index: Dict[str,int]) -> Tuple[List[int],List[int]]:
+    gen = []    # variables read in the block before any write
+    kill = []   # variables written in the block
+    for block in cfg.blocks:
+        g = 0
+        k = 0
+        for i in reversed(cfg.instructions(block)):
+            if i.dest in index:
+                bit = 1 << index[i.dest]
+                g &= ~bit
+                k |= bit
+            for u in i.uses():
+                if u in index:
+                    g |= 1 << index[u]
+        gen.append(g)
+        kill.append(k)
+
+    live_in = [0] * len(cfg.blocks)
+    live_out = [0] * len(cfg.blocks)
+    changed = True
+    while changed:
+        changed = False
+        for block in reversed(cfg.blocks):
+            b = block.index
+            out = 0
+            for s in block.succs:
+                out |= live_in[s]
+            live_out[b] = out
+            new_in = gen[b] | (out & ~kill[b])
+            if new_in != live_in[b]:
+                live_in[b] = new_in
+                changed = True
+    return live_in, live_out
+
+# The live interval of every allocatable variable as (start, end)
+# points. Instruction k reads its operands at point 2k and writes its
+# destination at point 2k + 1, so a variable last read by an
+# instruction can share a register with the one it writes.
+def live_intervals(program: List[Instruction]) -> Dict[str,Tuple[int,int]]:
+    starts = {}
+    ends = {}
+    for k, i in enumerate(program):
+        for u in i.uses():
+            if allocatable(u):
+                if u not in starts:
+                    starts[u] = 2 * k
+                ends[u] = 2 * k
+        if i.dest is not None and allocatable(i.dest):
+            if i.dest not in starts:
+                starts[i.dest] = 2 * k + 1
+            ends[i.dest] = max(ends.get(i.dest, 0), 2 * k + 1)
+
+    # extend the intervals over the blocks a variable is live
+    # through. Only variables read in some block before being written
+    # there can be live across blocks, the liveness analysis is
+    # restricted to those
+    cfg = CFG(program)
+    names = global_names(cfg)
+    index = {n: b for b, n in enumerate(names)}
+    live_in, live_out = liveness(cfg, index)
+    for block in cfg.blocks:
+        for v in bits(live_in[block.index]):
+            starts[names[v]] = min(starts[names[v]], 2 * block.start)
+        for v in bits(live_out[block.index]):
+            ends[names[v]] = max(ends[names[v]], 2 * block.end)
+
+    return {n: (starts[n], ends[n]) for n in starts}
+
+# Linear scan: walk the intervals by start point, a register is free
+# again once the interval holding it has ended. Returns the register
+# number of every variable and the number of registers used.
+def linear_scan(intervals: Dict[str,Tuple[int,int]]) -> Tuple[Dict[str,int],int]:
+    registers = {}
+    active = []     # heap of (end, register)
+    free = []       # heap of free registers, the lowest is reused first
+    count = 0
+    for name, (start, end) in sorted(intervals.items(), key=lambda x: x[1][0]):
+        while active and active[0][0] < start:
+            heapq.heappush(free, heapq.heappop(active)[1])
+        if free:
+            r = heapq.heappop(free)
+        else:
+            r = count
+            count += 1
+        registers[name] = r
+        heapq.heappush(active, (end, r))
+    return registers, count
+
+# perform register allocation
+def allocate_registers(program: List[Instruction]) -> Tuple[List[Instruction],List[str],int]:
+
+    # returns 3 items:
+
+    # 1. the program with every allocatable variable renamed to the
+    # register it was given
+
+    # 2. the registers to declare (vr0, vr1, ...)
+
+    # 3. how many variables were allocated
+    registers, count = linear_scan(live_intervals(program))
+    names = {n: "vr%d" % r for n, r in registers.items()}
+    new_program = [i.rename(names) for i in program]
+    return new_program, ["vr%d" % r for r in range(count)], len(registers)
@@ -3,10 +3,14 @@
 # if your tests fit the format of the other tests, you can register
 # them here and include them in this script
 
-Tests=("test0" "test1" "test2" "test3" "test4" "test5" "test6" "test7")
+Tests=("test0" "test1" "test2" "test3" "test4" "test5" "test6" "test7" "test8" "test9")
+
+# compile every test to tests/testN/testNir.cpp in one batch
+echo "compiling tests"
+python3 batch.py -lvn $(for t in ${Tests[*]}; do echo tests/${t}/${t}.cpp; done)
+
 for t in ${Tests[*]}; do
-    echo "compiling test $t"
-    python3 main.py -lvn tests/${t}/${t}.cpp > tests/${t}/${t}ir.cpp
+    echo "test $t"
     cd tests/$t
     echo "compiling"
     make
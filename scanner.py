@@ -1,5 +1,8 @@
 from enum import Enum
-from typing import Callable,List,Tuple,Optional
+from typing import Callable,Iterator,List,Tuple,Optional,Pattern,Union
+from array import array
+from bisect import bisect_left
+import mmap
 import re
 
 class ScannerException(Exception):
@@ -43,69 +46,295 @@ class Lexeme:
         return "(" + str(self.token) + "," + "\"" + self.value + "\"" + ")"    
 
 
+# The text a token regex matches if it only matches that one text
+# (e.g. "==" or "\+"), otherwise None
+def exact_lexeme(regex: str) -> Optional[str]:
+    lexeme = re.sub(r"\\(.)", r"\1", regex)
+    if re.search(r"(?<!\\)\.", regex) or re.fullmatch(regex, lexeme) is None:
+        return None
+    return lexeme
+
+# Compile a token table into a single master regex: an alternation
+# with a named group per token, so one match call at a position finds
+# the token and m.lastindex tells which rule matched.
+#
+# An alternation takes the first alternative that matches rather than
+# the longest, so maximal munch comes from the order: the rules of one
+# exact lexeme first, longest first ("==" before "="), then the other
+# rules in table order. Keywords are not rules of their own but are
+# mapped from identifiers by the ID token action. This is the longest
+# match as long as no two of the other rules can match at the same
+# position, which holds for the C-simple token table.
+#
+# Returns the pattern and the rule of each group number.
+def compile_tokens(tokens: List[Tuple[Token,str,Callable[[Lexeme],Lexeme]]], binary: bool = False) -> Tuple[Pattern,List[Optional[int]]]:
+    lexemes = [exact_lexeme(t[1]) for t in tokens]
+    exact = [i for i in range(len(tokens)) if lexemes[i] is not None]
+    exact.sort(key=lambda i: -len(lexemes[i]))
+    order = exact + [i for i in range(len(tokens)) if lexemes[i] is None]
+    master = "|".join(["(?P<_t%d>%s)" % (i, tokens[i][1]) for i in order])
+    if binary:
+        pattern = re.compile(master.encode())
+    else:
+        pattern = re.compile(master)
+    rules = [None] * (pattern.groups + 1)
+    for i in range(len(tokens)):
+        rules[pattern.groupindex["_t%d" % i]] = i
+    return pattern, rules
+
+# The scanner input: text, or any bytes-like buffer (e.g. a memory
+# mapped file) holding ASCII/UTF-8 source
+Buffer = Union[str, bytes, memoryview, mmap.mmap]
+
+# Token kinds are stored on a token tape as small integers
+token_kinds = list(Token)
+token_kind_index = {t: i for i,t in enumerate(token_kinds)}
+
+# A token tape holds a whole tokenized input in compact parallel
+# arrays instead of one Lexeme object per token: the kind of each
+# token (an index into token_kinds) and its start and end offsets in
+# the input buffer. Line numbers come from a table with the offset of
+# every newline. Token i is read by index and a Lexeme is only built
+# when one is asked for (e.g. for an error).
+#
+# The text comes from scanner (anything with a text(start, end)
+# method). line_offset is the number of lines before the tape's text,
+# for a tape of one function of a larger input.
+class TokenTape:
+    def __init__(self, scanner: "Scanner") -> None:
+        self.scanner = scanner
+        self.kinds = array('B')
+        self.starts = array('I')
+        self.ends = array('I')
+        self.newlines = array('I')
+        self.line_offset = 0
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    # the token kind at index i, None past the end of the input
+    def token(self, i: int) -> Optional[Token]:
+        if i < len(self.kinds):
+            return token_kinds[self.kinds[i]]
+        return None
+
+    # the source text of token i
+    def value(self, i: int) -> str:
+        return self.scanner.text(self.starts[i], self.ends[i])
+
+    def lexeme(self, i: int) -> Optional[Lexeme]:
+        if i < len(self.kinds):
+            return Lexeme(self.token(i), self.value(i))
+        return None
+
+    # the line number after token i (or after the whole input
+    # past the end), like Scanner.get_lineno
+    def lineno(self, i: int) -> int:
+        if i < len(self.ends):
+            return bisect_left(self.newlines, self.ends[i]) + 1 + self.line_offset
+        return len(self.newlines) + 1 + self.line_offset
+
+# the text of a token tape made by Scanner.tokenize_functions
+class TapeText:
+    def __init__(self, text: str) -> None:
+        self.buffer = text
+
+    def text(self, start: int, end: int) -> str:
+        return self.buffer[start:end]
+
 class Scanner:
     def __init__(self) -> None:
         self.lineno = 1
 
     def set_tokens(self, tokens: List[Tuple[Token,str,Callable[[Lexeme],Lexeme]]]) -> None:
         self.tokens = tokens
+        self.master, self.rules = compile_tokens(tokens)
+        self.binary_master = None
+
+    # The scanner never copies or slices the remaining input. It keeps
+    # an offset (self.pos) into an immutable buffer and only copies
+    # out the text of each token.
+    def input_string(self, input_string: Buffer) -> None:
+        self.buffer = input_string
+        self.pos = 0
+        self.end = len(input_string)
+
+        # line numbers are computed from offsets on demand:
+        # self.lineno is the line number at offset self.line_pos
+        self.lineno = 1
+        self.line_pos = 0
+
+        if isinstance(input_string, str):
+            self.pattern = self.master
+            self.newline = re.compile("\n")
+        else:
+            if self.binary_master is None:
+                self.binary_master = compile_tokens(self.tokens, True)[0]
+            self.pattern = self.binary_master
+            self.newline = re.compile(b"\n")
 
-    def input_string(self, input_string:str) -> None:
-        self.istring = input_string
+    # Scan a file without reading it into memory: the file is memory
+    # mapped and the scanner works directly on the mapping until
+    # close (tokenize_functions closes it when done)
+    def input_file(self, file_name: str) -> None:
+        with open(file_name, "rb") as f:
+            try:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # empty files cannot be mapped
+                buffer = b""
+        self.input_string(buffer)
+
+    # Release the input, unmapping the file of input_file. Tokens and
+    # tapes still reading from the input cannot be used after this
+    def close(self) -> None:
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+        self.input_string(b"")
+
+    # count the lines up to offset pos
+    def count_lines(self, pos: int) -> None:
+        if self.line_pos < pos:
+            for _ in self.newline.finditer(self.buffer, self.line_pos, pos):
+                self.lineno += 1
+            self.line_pos = pos
 
     # Get the scanner line number, needed for the parser exception
     def get_lineno(self)->int:
+        self.count_lines(self.pos)
         return self.lineno
 
-    # You can use your scanner implementation here if you'd like
-    # it is just the EMScanner right now
+    # get the source text between two offsets
+    def text(self, start: int, end: int) -> str:
+        if isinstance(self.buffer, str):
+            return self.buffer[start:end]
+        return str(self.buffer[start:end], "utf-8")
+
+    # Match the token at the current offset and return the index of
+    # its rule and where it ends
+    def match_token(self) -> Tuple[int,int]:
+        m = self.pattern.match(self.buffer, self.pos)
+        if m is None or m.end() == self.pos:
+            raise ScannerException(self.get_lineno());
+        return self.rules[m.lastindex], m.end()
+
+    # Single pass scanner: one master regex match per token instead
+    # of trying every prefix of the input against every token
     def token(self) -> Optional[Lexeme]:
     
         # Loop until we find a token we can
-        # return (or until the string is empty)
+        # return (or until the input is consumed)
         while True:
-            if len(self.istring) == 0:
+            if self.pos == self.end:
                 return None
 
-            # For each substring
-            for l in range(len(self.istring),0,-1):
-                matches = []
-
-                # Check each token
-                for t in self.tokens:
-                    # Create a tuple for each token:
-                    # * first element is the token name
-                    # * second is the possible match
-                    # * third is the token action
-                    matches.append((t[0],
-                                    re.fullmatch(t[1],self.istring[:l]),
-                                    t[2]))
-
-                # Check if there is any token that returned a match
-                # If so break out of the substring loop
-                matches = [m for m in matches if m[1] is not None]
-                if len(matches) > 0:
-                    break
-    
-            if len(matches) == 0:
-                raise ScannerException(self.lineno);
-    
-            # since we are exact matching on the substring, we can
-            # arbitrarily take the first match as the longest one            
-            longest = matches[0]
+            rule, longest = self.match_token()
 
             # apply the token action
-            lexeme = longest[2](Lexeme(longest[0],longest[1][0]))
+            t = self.tokens[rule]
+            lexeme = t[2](Lexeme(t[0],self.text(self.pos,longest)))
 
-            # figure how much we need to chop from our input string
-            chop = len(lexeme.value)
-            self.istring = self.istring[chop:]
+            # advance past the token
+            self.pos = longest
 
             # if we did not match an IGNORE token, then we can
             # return the lexeme
             if lexeme.token != Token.IGNORE:
                 return lexeme
 
+    # Bulk mode: scan the rest of the input onto a token tape. Token
+    # actions still run, but tokens whose action is idy never get a
+    # Lexeme. The tape records the token kind returned by the action
+    # and the offsets of the matched text.
+    def tokenize(self) -> TokenTape:
+        tape = TokenTape(self)
+        kinds = tape.kinds
+        starts = tape.starts
+        ends = tape.ends
+        ignore = token_kind_index[Token.IGNORE]
+        rules = [(token_kind_index[t[0]], t[2]) for t in self.tokens]
+
+        while self.pos != self.end:
+            rule, longest = self.match_token()
+            kind, action = rules[rule]
+            if action is not idy:
+                lexeme = action(Lexeme(token_kinds[kind],self.text(self.pos,longest)))
+                kind = token_kind_index[lexeme.token]
+
+            start = self.pos
+            self.pos = longest
+            if kind != ignore:
+                kinds.append(kind)
+                starts.append(start)
+                ends.append(longest)
+
+        tape.newlines.extend(m.start() for m in self.newline.finditer(self.buffer))
+        return tape
+
+    # Scan the rest of the input a function at a time, yielding a token
+    # tape per function: from its first token to the brace closing its
+    # body, and the last one to the end of the input (an input with no
+    # function gives one tape). Every tape has its own copy of its text,
+    # so only the function being scanned is held on top of the tapes
+    # the caller keeps, and the input is closed once it is scanned.
+    def tokenize_functions(self) -> Iterator[TokenTape]:
+        ignore = token_kind_index[Token.IGNORE]
+        lbrace = token_kind_index[Token.LBRACE]
+        rbrace = token_kind_index[Token.RBRACE]
+        rules = [(token_kind_index[t[0]], t[2]) for t in self.tokens]
+        kinds, starts, ends = array('B'), array('I'), array('I')
+        depth = 0
+        functions = 0
+
+        try:
+            while self.pos != self.end:
+                rule, longest = self.match_token()
+                kind, action = rules[rule]
+                if action is not idy:
+                    lexeme = action(Lexeme(token_kinds[kind],self.text(self.pos,longest)))
+                    kind = token_kind_index[lexeme.token]
+
+                start = self.pos
+                self.pos = longest
+                if kind == ignore:
+                    continue
+                kinds.append(kind)
+                starts.append(start)
+                ends.append(longest)
+                if kind == lbrace:
+                    depth += 1
+                elif kind == rbrace:
+                    depth -= 1
+                    if depth == 0:
+                        yield self.function_tape(kinds, starts, ends, longest)
+                        functions += 1
+                        kinds, starts, ends = array('B'), array('I'), array('I')
+
+            # the rest of the input, with the newlines after the last
+            # token for errors at the end of the input
+            if kinds or functions == 0:
+                yield self.function_tape(kinds, starts, ends, self.end)
+        finally:
+            self.close()
+
+    # the tape of the tokens of a function ending at offset end, with
+    # its text copied out of the input
+    def function_tape(self, kinds: array, starts: array, ends: array, end: int) -> TokenTape:
+        offset = starts[0] if starts else self.line_pos
+        self.count_lines(offset)
+        text = self.text(offset, end)
+        tape = TokenTape(TapeText(text))
+        tape.kinds = kinds
+        tape.starts = array('I', [s - offset for s in starts])
+        tape.ends = array('I', [e - offset for e in ends])
+        tape.newlines = array('I', [m.start() for m in newline.finditer(text)])
+        tape.line_offset = self.lineno - 1
+        self.lineno += len(tape.newlines)
+        self.line_pos = end
+        return tape
+
+
+newline = re.compile("\n")
 
 keywords = [(Token.IF, "if"), (Token.ELSE, "else"), (Token.FOR, "for"), (Token.INT, "int"), (Token.FLOAT, "float"), (Token.VOID, "void")]
 
@@ -0,0 +1,311 @@
+from typing import Dict,List,Optional,Set,Tuple
+from classir import Op, Instruction, store_ops, branch_ops, copy, PHI, COPY, LABEL
+from cfg import CFG, dominators, immediate_dominators, dominator_tree
+from global_value_numbering import tracked_variables
+from register_allocation import bits, liveness
+
+# Static single assignment form of a program.
+#
+# The registers (vrN) are already written once before being read.
+# The other variables (the _new_name program variables, the IO
+# variables and registers written more than once) get a new version
+# name (v_1, v_2, ...) at every definition, and phi instructions
+# where versions meet. Version 0 of a variable is the variable itself,
+# its value on entry to the function.
+#
+# Phis are placed with dominance frontiers, semi-pruned: only for the
+# variables read in some block before being written there (the others
+# are never live across blocks). The operands of a phi are in the
+# order of the predecessors of its block. When the first block is
+# the header of a loop its phis have no operand for the function
+# entry, where they take version 0.
+#
+# Every name has one definition, so the def-use chains are a map from
+# a name to the instruction defining it and one from a name to the
+# instructions reading it; analyses follow them instead of scanning
+# the whole program.
+
+class SSAForm:
+    def __init__(self, cfg: CFG, blocks: List[List[Instruction]], base: Dict[str,str], io_variables: Set[str],
+                 counters: Dict[str,int]) -> None:
+        self.cfg = cfg
+        self.blocks = blocks        # the instructions of each block of cfg, phis first (after a label)
+        self.base = base            # version name -> variable
+        self.io_variables = io_variables
+        self.counters = counters    # variable -> its last version number
+        self.phis = 0
+        self.build_chains()
+
+    # the def-use chains
+    def build_chains(self) -> None:
+        self.definition = {}    # name -> instruction
+        self.uses = {}          # name -> instructions reading it
+        for block in self.blocks:
+            for i in block:
+                if i.dest is not None:
+                    self.definition[i.dest] = i
+                for u in i.uses():
+                    self.uses.setdefault(u, []).append(i)
+
+# the dominance frontier of every block: the blocks where the
+# dominance of the block ends (Cooper, Harvey and Kennedy). The first
+# block is also entered from outside the function, so with any
+# predecessor it is a join
+def dominance_frontiers(cfg: CFG, idom: List[Optional[int]]) -> List[Set[int]]:
+    frontiers = [set() for _ in cfg.blocks]
+    for block in cfg.blocks:
+        preds = [p for p in block.preds if idom[p] is not None or p == 0]
+        if block.index == 0:
+            if not preds:
+                continue
+        elif len(preds) < 2 or idom[block.index] is None:
+            continue
+        for p in preds:
+            runner = p
+            while runner != idom[block.index]:
+                frontiers[runner].add(block.index)
+                runner = idom[runner]
+    return frontiers
+
+# the variables read in some block before they are written there
+def global_variables(cfg: CFG, variables: Set[str]) -> Set[str]:
+    ret = set()
+    for block in cfg.blocks:
+        written = set()
+        for i in cfg.instructions(block):
+            for u in i.uses():
+                if u in variables and u not in written:
+                    ret.add(u)
+            if i.dest is not None:
+                written.add(i.dest)
+    return ret
+
+# build the SSA form of a program
+def to_ssa(program: List[Instruction]) -> SSAForm:
+    cfg = CFG(program)
+    if not cfg.blocks:
+        return SSAForm(cfg, [], {}, set(), {})
+    idom = immediate_dominators(cfg, dominators(cfg))
+    children = dominator_tree(idom)
+    frontiers = dominance_frontiers(cfg, idom)
+    variables = tracked_variables(program)
+    io_variables = set([i.dest for i in program if i.op in store_ops])
+    for i in program:
+        if i.op is Op.INT2VR or i.op is Op.FLOAT2VR:
+            io_variables.update(i.uses())
+
+    # phi placement: the iterated dominance frontier of the blocks
+    # writing each global variable
+    def_blocks = {}
+    for block in cfg.blocks:
+        for i in cfg.instructions(block):
+            if i.dest in variables:
+                def_blocks.setdefault(i.dest, set()).add(block.index)
+    phis = [[] for _ in cfg.blocks]     # phi instructions of each block
+    phi_count = 0
+    for v in sorted(global_variables(cfg, variables)):
+        worklist = list(def_blocks.get(v, ()))
+        placed = set()
+        while worklist:
+            for f in frontiers[worklist.pop()]:
+                if f not in placed:
+                    placed.add(f)
+                    phis[f].append(Instruction(PHI, v, tuple([v] * len(cfg.blocks[f].preds))))
+                    phi_count += 1
+                    worklist.append(f)
+
+    # renaming, walking the dominator tree: the current version of
+    # every variable is the top of its stack
+    stacks = {v: [v] for v in variables}
+    counters = version_counters(program, variables)
+    base = {}
+    blocks = [None] * len(cfg.blocks)
+    stack = [(0, None)]
+    while stack:
+        b, pushed = stack.pop()
+        if pushed is not None:
+            for v in pushed:
+                stacks[v].pop()
+            continue
+        pushed = []
+
+        def define(v: str) -> str:
+            counters[v] += 1
+            name = "%s_%d" % (v, counters[v])
+            base[name] = v
+            stacks[v].append(name)
+            pushed.append(v)
+            return name
+
+        block = cfg.instructions(cfg.blocks[b])
+        new_block = []
+        rest = block
+        if block and block[0].op is LABEL:
+            new_block.append(block[0])
+            rest = block[1:]
+        for phi in phis[b]:
+            phi.dest = define(phi.dest)
+            new_block.append(phi)
+        for i in rest:
+            names = {u: stacks[u][-1] for u in i.uses() if u in stacks}
+            dest = i.dest
+            if dest in stacks:
+                dest = define(dest)
+            if names or dest != i.dest:
+                if i.op in branch_ops:
+                    i = Instruction(i.op, None, tuple([names.get(a, a) for a in i.args[:-1]]) + i.args[-1:])
+                else:
+                    i = Instruction(i.op, dest, tuple([names.get(a, a) for a in i.args]))
+            new_block.append(i)
+        blocks[b] = new_block
+
+        # the operands of the phis of the successors
+        for s in cfg.blocks[b].succs:
+            j = cfg.blocks[s].preds.index(b)
+            for phi in phis[s]:
+                v = base.get(phi.dest, phi.dest)
+                args = list(phi.args)
+                args[j] = stacks[v][-1]
+                phi.args = tuple(args)
+
+        stack.append((b, pushed))
+        for c in reversed(children[b]):
+            stack.append((c, None))
+
+    # unreachable blocks are never run, they are left as they are
+    for block in cfg.blocks:
+        if blocks[block.index] is None:
+            blocks[block.index] = cfg.instructions(block)
+
+    ret = SSAForm(cfg, blocks, base, io_variables, counters)
+    ret.phis = phi_count
+    return ret
+
+# The last version number of each variable in a program. A version
+# left by an earlier round of SSA (a name like x_1 that could not get
+# x back) is a variable of its own now, so new versions of x are
+# numbered after it rather than reusing its name.
+def version_counters(program: List[Instruction], variables: Set[str]) -> Dict[str,int]:
+    counters = {v: 0 for v in variables}
+    names = set([i.dest for i in program])
+    for i in program:
+        names.update(i.args)
+    for n in names:
+        if n is not None and "_" in n:
+            v, _, k = n.rpartition("_")
+            if k.isdigit() and v in counters:
+                counters[v] = max(counters[v], int(k))
+    return counters
+
+# Dead code elimination on SSA form: marking follows the def-use
+# chains from the instructions with an effect (stores, branches and
+# labels), so each instruction is visited once. Returns how many
+# instructions were removed.
+def eliminate_dead_code(ssa: SSAForm) -> int:
+    marked = set()
+    worklist = []
+    for block in ssa.blocks:
+        for i in block:
+            if i.dest is None or i.op in store_ops:
+                marked.add(id(i))
+                worklist.append(i)
+    while worklist:
+        for u in worklist.pop().uses():
+            d = ssa.definition.get(u)
+            if d is not None and id(d) not in marked:
+                marked.add(id(d))
+                worklist.append(d)
+
+    removed = 0
+    for b, block in enumerate(ssa.blocks):
+        new_block = [i for i in block if id(i) in marked]
+        removed += len(block) - len(new_block)
+        ssa.blocks[b] = new_block
+    if removed:
+        ssa.build_chains()
+    return removed
+
+# Leave SSA form. Every phi d = phi(a1, ..., an) gets a new version p
+# of its variable: each predecessor i copies ai into p at its end
+# (before its branch) and the phi becomes d = p. The copies into p
+# cannot overwrite a value another path still needs, p being read only
+# by that one copy, and the copies out of them at the start of a block
+# read no phi destination, so no edges need to be split.
+#
+# The versions of a variable are then given back the variable's name
+# unless two of them interfere (one is live where the other is
+# written). Renaming and passes only removing instructions never
+# cause that, only the copies into the p versions can (a block with
+# two successors having a phi of the same variable): everything else
+# live at such a copy is its source. So only the p versions are
+# checked. The IO variables are references to the caller's variables
+# and always get their names back. Returns the program and the
+# version names left in it, which need declaring.
+def from_ssa(ssa: SSAForm) -> Tuple[List[Instruction],List[str]]:
+    cfg = ssa.cfg
+    base = dict(ssa.base)
+    counters = dict(ssa.counters)
+    phi_versions = set()
+
+    at_end = [[] for _ in ssa.blocks]   # the copies at the end of each block
+    at_entry = []                       # copies of version 0 for the phis of the first block
+    blocks = []
+    for b, block in enumerate(ssa.blocks):
+        new_block = []
+        for i in block:
+            if i.op is PHI:
+                v = base[i.dest]
+                counters[v] += 1
+                p = "%s_%d" % (v, counters[v])
+                base[p] = v
+                phi_versions.add(p)
+                for j, pred in enumerate(cfg.blocks[b].preds):
+                    at_end[pred].append(copy(p, i.args[j]))
+                if b == 0:
+                    at_entry.append(copy(p, v))
+                i = copy(i.dest, p)
+            new_block.append(i)
+        blocks.append(new_block)
+
+    program = at_entry
+    for b, block in enumerate(blocks):
+        if block and block[-1].op in branch_ops:
+            program.extend(block[:-1] + at_end[b] + block[-1:])
+        else:
+            program.extend(block + at_end[b])
+
+    interfering = interfering_variables(program, base, phi_versions)
+    names = {n: v for n, v in base.items() if v not in interfering or v in ssa.io_variables}
+    program = [i.rename(names) for i in program]
+    program = [i for i in program if i.op is not COPY or i.dest != i.args[0]]
+    return program, sorted(set([n for n in base if n not in names]))
+
+# The variables with two of the given versions interfering in a
+# program: one is live at a definition of the other, other than a copy
+# of it. The live versions are kept by variable so that a definition
+# is only compared with the versions of its own variable.
+def interfering_variables(program: List[Instruction], base: Dict[str,str], versions: Set[str]) -> Set[str]:
+    if not versions:
+        return set()
+    cfg = CFG(program)
+    versions = sorted(versions)
+    index = {n: k for k, n in enumerate(versions)}
+    _, live_out = liveness(cfg, index)
+    ret = set()
+    for block in cfg.blocks:
+        live = {}   # variable -> its live versions
+        for k in bits(live_out[block.index]):
+            n = versions[k]
+            live.setdefault(base[n], set()).add(n)
+        for i in reversed(cfg.instructions(block)):
+            if i.dest in index:
+                v = base[i.dest]
+                others = live.setdefault(v, set())
+                others.discard(i.dest)
+                for w in others:
+                    if not (i.op is COPY and i.args[0] == w):
+                        ret.add(v)
+            for u in i.uses():
+                if u in index:
+                    live.setdefault(base[u], set()).add(u)
+    return ret
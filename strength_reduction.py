@@ -0,0 +1,217 @@
+from typing import Dict,List,Optional,Set,Tuple
+from classir import Op, Instruction, is_literal, copy, INT2VR, COPY, ADDI, SUBI, MULTI, DIVI, INCI, DECI
+from cfg import CFG, dominators, natural_loops
+from constant_folding import literal_value, load
+from loop_invariant_code_motion import preheader_position
+
+# Strength reduction: integer operations are replaced by cheaper ones
+# computing the same 32 bit result.
+#
+# In loops, a multiplication of an induction variable i (a variable
+# whose only definition in the loop adds or subtracts an invariant
+# step c) by an invariant k becomes a variable t kept equal to i * k:
+# t = i * k is computed in the preheader and t = t + c * k follows
+# the update of i, so the multiplication becomes a copy of t.
+#
+# Everywhere, with the constants being the variables defined once by
+# a load of a literal:
+# * multi by a power of two 2^n becomes shli(x, n)
+# * divi by a power of two becomes divpow2i(x, n), which rounds
+#   towards zero like divi
+# * addi/subi of 1 or -1 become inci/deci
+# The loads of constants no longer read are removed.
+
+# wrap an int around to 32 bits like the C++ int operations do
+def wrap(value: int) -> int:
+    return (value + 2**31) % 2**32 - 2**31
+
+# n if value is 2^n for some n > 0, None otherwise
+def log2(value: Optional[int]) -> Optional[int]:
+    if value is None or value < 2 or value & (value - 1):
+        return None
+    return value.bit_length() - 1
+
+# the variables defined once, by a load of an int literal, and their
+# values
+def int_constants(program: List[Instruction]) -> Dict[str,int]:
+    defs = {}
+    for i in program:
+        if i.dest is not None:
+            defs[i.dest] = defs.get(i.dest, 0) + 1
+    ret = {}
+    for i in program:
+        if i.op is INT2VR and defs[i.dest] == 1 and is_literal(i.args[0]):
+            value = literal_value(INT2VR, i.args[0])
+            if value is not None:
+                ret[i.dest] = value
+    return ret
+
+# Reduce the strength of the integer operations of a program. New
+# variables come from the parser's virtual register allocator vra.
+# Returns the new program and how many operations were reduced.
+def reduce_strength(program: List[Instruction], vra) -> Tuple[List[Instruction],int]:
+    constants = int_constants(program)
+    read = referenced(program, constants)
+    program, reduced_ivs = reduce_induction_variables(program, vra)
+    program, reduced = reduce_operations(program)
+
+    # the loads of constants only the reduced operations read
+    dropped = read - referenced(program, constants)
+    if dropped:
+        program = [i for i in program if i.dest not in dropped]
+    return program, reduced_ivs + reduced
+
+# the variables of names read by some instruction
+def referenced(program: List[Instruction], names: Dict[str,int]) -> Set[str]:
+    ret = set()
+    for i in program:
+        for u in i.uses():
+            if u in names:
+                ret.add(u)
+    return ret
+
+# The induction variables of a loop: variable -> (position of its
+# definition, the update (ADDI or SUBI), the step). The step is a
+# variable or, for inci/deci, the literal "1".
+def induction_variables(program: List[Instruction], positions: List[int], defs: Dict[str,int],
+                        invariant) -> Dict[str,Tuple[int,Op,str]]:
+    def_at = {}
+    for k in positions:
+        if program[k].dest is not None:
+            def_at[program[k].dest] = k
+
+    ret = {}
+    for v, k in def_at.items():
+        if defs[v] != 1:
+            continue
+        update = program[k]
+        # the parser assigns a program variable a copy of the register
+        # holding the expression
+        if update.op is COPY and defs.get(update.args[0]) == 1:
+            update = program[def_at[update.args[0]]]
+        op = update.op
+        args = update.args
+        if op is ADDI and args[0] == v and invariant(args[1]):
+            ret[v] = (k, ADDI, args[1])
+        elif op is ADDI and args[1] == v and invariant(args[0]):
+            ret[v] = (k, ADDI, args[0])
+        elif op is SUBI and args[0] == v and invariant(args[1]):
+            ret[v] = (k, SUBI, args[1])
+        elif op is INCI and args[0] == v:
+            ret[v] = (k, ADDI, "1")
+        elif op is DECI and args[0] == v:
+            ret[v] = (k, SUBI, "1")
+    return ret
+
+# Replace the multiplications of induction variables by invariants
+# with additions, innermost loops first (a multiplication is reduced
+# in one loop only). Multiplications by a constant power of two are
+# left to become shifts.
+def reduce_induction_variables(program: List[Instruction], vra) -> Tuple[List[Instruction],int]:
+    cfg = CFG(program)
+    loops = natural_loops(cfg, dominators(cfg))
+    constants = int_constants(program)
+
+    before = {}     # position -> instructions to insert before it
+    after = {}      # position -> instructions to insert after it
+    replaced = {}   # position -> the instruction replacing it
+    for loop in sorted(loops, key=lambda l: -l.depth):
+        header = preheader_position(cfg, loop)
+        if header is None:
+            continue
+        positions = []
+        for b in sorted(loop.blocks):
+            positions.extend(range(cfg.blocks[b].start, cfg.blocks[b].end))
+        defs = {}
+        for k in positions:
+            dest = program[k].dest
+            if dest is not None:
+                defs[dest] = defs.get(dest, 0) + 1
+        invariant = lambda v: v not in defs or v in constants or is_literal(v)
+        ivs = induction_variables(program, positions, defs, invariant)
+
+        # (induction variable, factor) -> the variable equal to their product
+        products = {}
+        preheader = before.setdefault(header, [])
+        for k in positions:
+            i = program[k]
+            if i.op is not MULTI or k in replaced:
+                continue
+            iv, factor = i.args
+            if factor in ivs and iv not in ivs:
+                iv, factor = factor, iv
+            if iv not in ivs or iv == factor or not invariant(factor) or log2(constants.get(factor)) is not None:
+                continue
+            if (iv, factor) not in products:
+                update_at, update_op, step = ivs[iv]
+                t = vra.mk_new_vr()
+                s = product(step, factor, defs, constants, preheader, vra)
+                preheader.append(Instruction(MULTI, t, (iv, operand(factor, defs, constants, preheader, vra))))
+                after.setdefault(update_at, []).append(Instruction(update_op, t, (t, s)))
+                products[(iv, factor)] = t
+            replaced[k] = copy(i.dest, products[(iv, factor)])
+
+    new_program = []
+    for k, i in enumerate(program):
+        new_program.extend(before.get(k, ()))
+        new_program.append(replaced.get(k, i))
+        new_program.extend(after.get(k, ()))
+    return new_program, len(replaced)
+
+# An invariant operand as read in the preheader: constants defined in
+# the loop and literals are loaded there
+def operand(v: str, defs: Dict[str,int], constants: Dict[str,int], preheader: List[Instruction], vra) -> str:
+    if v not in defs and not is_literal(v):
+        return v
+    ret = vra.mk_new_vr()
+    preheader.append(load(ret, constants[v] if v in constants else literal_value(INT2VR, v)))
+    return ret
+
+# a variable computed in the preheader holding step * factor
+def product(step: str, factor: str, defs: Dict[str,int], constants: Dict[str,int], preheader: List[Instruction], vra) -> str:
+    ret = vra.mk_new_vr()
+    values = [constants.get(step, literal_value(INT2VR, step) if is_literal(step) else None), constants.get(factor)]
+    if None not in values:
+        preheader.append(load(ret, wrap(values[0] * values[1])))
+    else:
+        preheader.append(Instruction(MULTI, ret, (operand(step, defs, constants, preheader, vra),
+                                                  operand(factor, defs, constants, preheader, vra))))
+    return ret
+
+# the cheaper instruction computing the same value as i, None if
+# there is none
+def reduce_operation(i: Instruction, constants: Dict[str,int]) -> Optional[Instruction]:
+    op = i.op
+    if op is MULTI:
+        for x, c in ((i.args[0], i.args[1]), (i.args[1], i.args[0])):
+            n = log2(constants.get(c))
+            if n is not None:
+                return Instruction(Op.SHLI, i.dest, (x, str(n)))
+    elif op is DIVI:
+        n = log2(constants.get(i.args[1]))
+        if n is not None:
+            return Instruction(Op.DIVPOW2I, i.dest, (i.args[0], str(n)))
+    elif op is ADDI:
+        for x, c in ((i.args[0], i.args[1]), (i.args[1], i.args[0])):
+            if constants.get(c) == 1:
+                return Instruction(INCI, i.dest, (x,))
+            if constants.get(c) == -1:
+                return Instruction(DECI, i.dest, (x,))
+    elif op is SUBI:
+        if constants.get(i.args[1]) == 1:
+            return Instruction(DECI, i.dest, (i.args[0],))
+        if constants.get(i.args[1]) == -1:
+            return Instruction(INCI, i.dest, (i.args[0],))
+    return None
+
+def reduce_operations(program: List[Instruction]) -> Tuple[List[Instruction],int]:
+    constants = int_constants(program)
+    new_program = []
+    reduced = 0
+    for i in program:
+        r = reduce_operation(i, constants)
+        if r is not None:
+            reduced += 1
+            i = r
+        new_program.append(i)
+    return new_program, reduced
@@ -0,0 +1,15 @@
+#include <iostream>
+using namespace std;
+
+#if defined(IR)
+#include "test8ir.cpp"
+#else
+#include "test8.cpp"
+#endif
+
+int main() {
+  int x,y;
+  test8(x,y);
+  cout << x << " " << y << endl;
+  return 0;
+}
@@ -0,0 +1,13 @@
+void test8(int &x, int &y) {
+  int i;
+  int s;
+  int t;
+  s = 0;
+  t = 0;
+  for (i = 0; i < 1000; i = i + 1) {
+    s = s + i * 3 + i * 8;
+    t = t + (i - 500) / 4 - i * 5;
+  }
+  x = s;
+  y = t;
+}
@@ -0,0 +1,15 @@
+#include <iostream>
+using namespace std;
+
+#if defined(IR)
+#include "test9ir.cpp"
+#else
+#include "test9.cpp"
+#endif
+
+int main() {
+  int x,y;
+  test9(x,y);
+  cout << x << " " << y << endl;
+  return 0;
+}
@@ -0,0 +1,13 @@
+void test9(int &x, int &y) {
+  int a;
+  int b;
+  int i;
+  a = 010 + 1;
+  a = a * 032;
+  b = 0;
+  for (i = 0; i < 012; i = i + 01) {
+    b = b + i * 020;
+  }
+  x = a;
+  y = b + 0100 / 010;
+}
@@ -1,31 +1,13 @@
-
-echo "compiling and running baseline"
-python3 main.py tests/timing/timing.cpp > tests/timing/timing_ir.cpp
-cd tests/timing
-make
-./driver
-cd ../../
-
-echo ""
-echo "compiling and running with local value numbering"
-python3 main.py -lvn tests/timing/timing.cpp > tests/timing/timing_ir.cpp
-cd tests/timing
-make
-./driver
-cd ../../
-
-echo ""
-echo "compiling and running with loop unrolling of 512"
-python3 main.py -uf 512 tests/timing/timing.cpp > tests/timing/timing_ir.cpp
-cd tests/timing
-make
-./driver
-cd ../../
-
-echo ""
-echo "compiling and running with loop unrolling of 512 and local value numbering"
-python3 main.py -lvn -uf 512 tests/timing/timing.cpp > tests/timing/timing_ir.cpp
-cd tests/timing
-make
-./driver
-cd ../../
+# runs tests/timing/timing.cpp compiled with each set of options and
+# the original C++, see benchmarks/runtime_matrix.py for the options
+# (--runs, --calls, --csv, --json, ...), which are passed through
+
+python3 -m benchmarks.runtime_matrix tests/timing/timing.cpp \
+    --variant="" \
+    --variant="-lvn" \
+    --variant="-uf 512" \
+    --variant="-lvn -uf 512" \
+    --variant="-licm" \
+    --variant="-O3" \
+    --variant="-O3 --backend c" \
+    "$@"